@@ -0,0 +1,40 @@
+"""
+Streak arithmetic for the per-user stats rollup.
+
+A streak is a run of consecutive calendar days with at least one activity
+log; several logs on the same day count once. The current streak is the run
+ending on the most recent activity day.
+
+advance_streak() moves a stored rollup forward by one newly logged day, so
+recording activity never has to look at older logs. streaks() recomputes
+the same numbers from a user's full list of activity days.
+"""
+
+from datetime import timedelta
+
+ONE_DAY = timedelta(days=1)
+
+
+def advance_streak(current, longest, last_day, day):
+    """(current, longest, last_day) after logging activity on day.
+
+    A day before last_day (a backdated log) can close a gap in the past that
+    an incremental update cannot see; it leaves the streaks alone and the
+    repair command recomputes them exactly.
+    """
+    if last_day is None or day > last_day + ONE_DAY:
+        current = 1
+    elif day == last_day + ONE_DAY:
+        current += 1
+    elif day < last_day:
+        return current, longest, last_day
+    return current, max(longest, current), max(day, last_day or day)
+
+
+def streaks(days):
+    """(current, longest) streak for an iterable of activity days, any order"""
+    current = longest = 0
+    last_day = None
+    for day in sorted(set(days)):
+        current, longest, last_day = advance_streak(current, longest, last_day, day)
+    return current, longest
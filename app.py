@@ -1,17 +1,35 @@
-from flask import Flask, render_template, redirect, url_for, request, flash, jsonify
+from flask import Flask, render_template, redirect, url_for, request, flash, jsonify, abort, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import joinedload, load_only
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import datetime, date, timedelta
 import os
 from werkzeug.utils import secure_filename
 import random
-import pytesseract
-import easyocr
-import pdfplumber
+import uuid
+import hashlib
+import hmac
+import click
 import json
-import pandas as pd
+import time
 from supabase_config import get_supabase_client
+from supabase_cache import supabase_cache
+from reference_data import food_catalog, lab_test_parameters
+from ocr_readers import reader_pool
+from report_jobs import job_pool
+from pdf_ocr import extract_pdf_text
+from trends import build_trend_series
+from pagination import InvalidCursor, encode_cursor, keyset_after, keyset_page, page_size
+from activity_stats import advance_streak, streaks
+from llm_client import LLMError, llm_client
+from chat_cache import chat_cache
+from migrations import current_version, migrate
+from outbox import OutboxDrainer, OutboxMixin, drain, enqueue, prune_sent, push_rows
+from notifications import NotificationHub, feed_from_env
+from patient_import import ImportFileError, PasswordHasher, random_patient_id, read_patient_chunks
+from report_ingest import ManifestError, bounded_map, file_sha256, plan_directory, plan_manifest
+import metrics
 
 # Remove unused LLM imports and keys
 # import openai
@@ -39,66 +57,83 @@ login_manager.login_view = 'login'
 @login_manager.unauthorized_handler
 def unauthorized():
     return jsonify({'error': 'Authentication required'}), 401
-with app.app_context():
-    db.create_all()
-
-# Database initialization complete
 
 # Supabase integration
+# Writes go through the outbox (see outbox.py): create_* add a sync row to the
+# caller's transaction and the background drainer pushes it to Supabase.
+# Reads go through a per-worker read-through cache (see supabase_cache.py);
+# writes invalidate the cached rows they touch.
 class SupabaseService:
-    def __init__(self):
-        self.supabase = get_supabase_client()
+    # Column each table's reads are keyed (and cached) by
+    CACHE_KEYS = {'users': 'id', 'health_reports': 'user_id', 'messages': 'recipient_id'}
+
+    def __init__(self, client=None, cache=None):
+        self._client = client
+        self.cache = cache or supabase_cache
+
+    @property
+    def supabase(self):
+        # Created on first use; importing the app doesn't touch Supabase
+        return self._client or get_supabase_client()
+    
+    def invalidate(self, table_name, row):
+        self.cache.invalidate(table_name, row[self.CACHE_KEYS[table_name]])
     
     def create_user(self, user_data):
-        """Create a new user in Supabase"""
-        try:
-            result = self.supabase.table('users').insert(user_data).execute()
-            return result.data[0] if result.data else None
-        except Exception as e:
-            print(f"Supabase user creation error: {e}")
-            return None
+        """Queue a new user for Supabase; the caller commits"""
+        self.invalidate('users', user_data)
+        return enqueue(db.session, SupabaseOutbox, 'users', user_data, f"users:{user_data['id']}")
+    
+    def push(self, table_name, rows):
+        """Bulk insert rows into a Supabase table (used by the outbox drainer)"""
+        with metrics.timed('supabase', operation='upsert', table=table_name):
+            push_rows(self.supabase, table_name, rows)
+        # Cached reads from before the rows arrived are now stale
+        for row in rows:
+            self.invalidate(table_name, row)
     
     def get_user(self, user_id):
         """Get user by ID from Supabase"""
-        try:
-            result = self.supabase.table('users').select('*').eq('id', user_id).execute()
+        def load():
+            with metrics.timed('supabase', operation='select', table='users'):
+                result = self.supabase.table('users').select('*').eq('id', user_id).execute()
             return result.data[0] if result.data else None
+        try:
+            return self.cache.get('users', user_id, load)
         except Exception as e:
             print(f"Supabase user retrieval error: {e}")
             return None
     
     def create_health_report(self, report_data):
-        """Create a new health report in Supabase"""
-        try:
-            result = self.supabase.table('health_reports').insert(report_data).execute()
-            return result.data[0] if result.data else None
-        except Exception as e:
-            print(f"Supabase health report creation error: {e}")
-            return None
+        """Queue a new health report for Supabase; the caller commits"""
+        self.invalidate('health_reports', report_data)
+        return enqueue(db.session, SupabaseOutbox, 'health_reports', report_data, f"health_reports:{report_data['id']}")
     
     def get_user_reports(self, user_id):
         """Get all health reports for a user from Supabase"""
-        try:
-            result = self.supabase.table('health_reports').select('*').eq('user_id', user_id).execute()
+        def load():
+            with metrics.timed('supabase', operation='select', table='health_reports'):
+                result = self.supabase.table('health_reports').select('*').eq('user_id', user_id).execute()
             return result.data if result.data else []
+        try:
+            return self.cache.get('health_reports', user_id, load)
         except Exception as e:
             print(f"Supabase health reports retrieval error: {e}")
             return []
     
     def create_message(self, message_data):
-        """Create a new message in Supabase"""
-        try:
-            result = self.supabase.table('messages').insert(message_data).execute()
-            return result.data[0] if result.data else None
-        except Exception as e:
-            print(f"Supabase message creation error: {e}")
-            return None
+        """Queue a new message for Supabase; the caller commits"""
+        self.invalidate('messages', message_data)
+        return enqueue(db.session, SupabaseOutbox, 'messages', message_data, f"messages:{message_data['id']}")
     
     def get_user_messages(self, user_id):
         """Get all messages for a user from Supabase"""
-        try:
-            result = self.supabase.table('messages').select('*').eq('recipient_id', user_id).execute()
+        def load():
+            with metrics.timed('supabase', operation='select', table='messages'):
+                result = self.supabase.table('messages').select('*').eq('recipient_id', user_id).execute()
             return result.data if result.data else []
+        try:
+            return self.cache.get('messages', user_id, load)
         except Exception as e:
             print(f"Supabase messages retrieval error: {e}")
             return []
@@ -118,114 +153,55 @@ UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'pdf', 'jpg', 'jpeg', 'png'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-# OpenRouter API key from environment for production
-OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY', '')
+# Versions stored with cached extractions. Bump EXTRACTOR_VERSION when
+# extract_text_from_file output changes for the same file, PARSER_REVISION
+# when parse_medical_values logic changes; the matcher version follows the
+# parameter table automatically.
+EXTRACTOR_VERSION = '2'
+PARSER_REVISION = '1'
+EXTRACTION_CACHE_MAX_BYTES = int(float(os.getenv('EXTRACTION_CACHE_MAX_MB', '256')) * 1024 * 1024)
 
 import requests
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def extract_text_from_file(filepath, lang='eng'):
+def extract_text_from_file(filepath, lang='eng', page_timings=None):
     ext = os.path.splitext(filepath)[1].lower()
     text = ''
     if ext == '.pdf':
-        with pdfplumber.open(filepath) as pdf:
-            for page in pdf.pages:
-                text += page.extract_text() or ''
-        if not text.strip():
-            # Fallback to OCR for scanned PDFs
-            import cv2
-            from pdf2image import convert_from_path
-            images = convert_from_path(filepath)
-            for img in images:
-                text += pytesseract.image_to_string(img, lang=lang)
+        # Text layer per page; only pages without one are OCR'd
+        pages = []
+        text = extract_pdf_text(filepath, lang=lang, page_timings=pages)
+        for method in ('text', 'ocr'):
+            timed_pages = [page['seconds'] for page in pages if page['method'] == method]
+            if timed_pages:
+                metrics.observe('extraction', sum(timed_pages), stage=f'pdf_{method}')
+        if page_timings is not None:
+            page_timings.extend(pages)
     elif ext in ['.jpg', '.jpeg', '.png']:
+        started = time.perf_counter()
         try:
-            reader = easyocr.Reader([lang])
-            result = reader.readtext(filepath, detail=0)
+            # Reuse this worker's reader instead of reloading the models
+            result = reader_pool.readtext(lang, filepath, detail=0)
             text = '\n'.join(result)
         except Exception:
+            import pytesseract
             text = pytesseract.image_to_string(filepath, lang=lang)
+        metrics.observe('extraction', time.perf_counter() - started, stage='image_ocr')
     return text
 
+def parser_version():
+    return f'{PARSER_REVISION}:{lab_test_parameters().matcher.version}'
+
 def parse_medical_values(text):
-    import re
-    import pandas as pd
     print('--- Extracted Text Start ---')
     print(text)
     print('--- Extracted Text End ---')
-    values = {}
-    # Load all test parameters from CSV
-    param_df = pd.read_csv('medical_test_parameters.csv')
-    # Add common abbreviations for matching
-    abbrev_map = {
-        'Hemoglobin (Hb)': ['Hemoglobin', 'Hb'],
-        'RBC Count': ['RBC Count', 'RBC'],
-        'WBC Count': ['WBC Count', 'WBC'],
-        'Platelet Count': ['Platelet Count', 'Platelets'],
-        'Hematocrit (HCT)': ['Hematocrit', 'HCT'],
-        'MCV': ['MCV'],
-        'MCH': ['MCH'],
-        'MCHC': ['MCHC'],
-        'RDW': ['RDW'],
-        'Neutrophils (%)': ['Neutrophils'],
-        'Lymphocytes (%)': ['Lymphocytes'],
-        'Monocytes (%)': ['Monocytes'],
-        'Eosinophils (%)': ['Eosinophils'],
-        'Basophils (%)': ['Basophils'],
-        'SGOT / AST': ['SGOT', 'AST'],
-        'SGPT / ALT': ['SGPT', 'ALT'],
-        'ALP': ['ALP'],
-        'Total Bilirubin': ['Total Bilirubin', 'Bilirubin'],
-        'Direct Bilirubin': ['Direct Bilirubin'],
-        'Albumin': ['Albumin'],
-        'Globulin': ['Globulin'],
-        'A/G Ratio': ['A/G Ratio'],
-        'Creatinine': ['Creatinine'],
-        'Urea / BUN': ['Urea', 'BUN'],
-        'Uric Acid': ['Uric Acid'],
-        'Sodium (Na+)': ['Sodium', 'Na+'],
-        'Potassium (K+)': ['Potassium', 'K+'],
-        'Chloride (Cl-)': ['Chloride', 'Cl-'],
-        'Fasting Blood Sugar (FBS)': ['Fasting Blood Sugar', 'FBS'],
-        'Postprandial Blood Sugar (PPBS)': ['Postprandial Blood Sugar', 'PPBS'],
-        'HbA1c': ['HbA1c'],
-        'Random Blood Sugar (RBS)': ['Random Blood Sugar', 'RBS'],
-        'Insulin (Fasting)': ['Insulin'],
-        'Total Cholesterol': ['Total Cholesterol', 'Cholesterol'],
-        'HDL': ['HDL'],
-        'LDL': ['LDL'],
-        'VLDL': ['VLDL'],
-        'Triglycerides': ['Triglycerides'],
-        'Cholesterol/HDL Ratio': ['Cholesterol/HDL Ratio'],
-        'Vitamin D (25-OH)': ['Vitamin D', '25-OH'],
-        'Vitamin B12': ['Vitamin B12', 'B12'],
-        'Calcium': ['Calcium'],
-        'Iron': ['Iron'],
-        'Ferritin': ['Ferritin'],
-        'TIBC': ['TIBC'],
-        'Magnesium': ['Magnesium'],
-        'Phosphorus': ['Phosphorus'],
-        'TSH': ['TSH'],
-        'T3': ['T3'],
-        'T4': ['T4'],
-        'Free T3': ['Free T3'],
-        'Free T4': ['Free T4'],
-    }
-    for idx, row in param_df.iterrows():
-        param = row['Test Name']
-        key = param.lower().replace(' ', '_').replace('(', '').replace(')', '').replace('/', '_').replace('%', 'percent').replace('-', '_').replace('.', '').replace(',', '').replace('__', '_')
-        patterns = []
-        # Try all known names/abbreviations
-        for name in abbrev_map.get(param, [param]):
-            patterns.append(rf"{re.escape(name)}\s*[:=\-]?\s*([\d.]+)")
-            patterns.append(rf"{re.escape(name)}\s*[a-zA-Z]*\s*[:=\-]?\s*([\d.]+)")
-        for pat in patterns:
-            m = re.search(pat, text, re.IGNORECASE)
-            if m:
-                values[key] = m.group(1)
-                break
+    # Single pass over the text with the matcher compiled from the parameter table
+    started = time.perf_counter()
+    values = lab_test_parameters().matcher.match(text)
+    metrics.observe('extraction', time.perf_counter() - started, stage='parse')
     # Example condition detection (expand as needed)
     conditions = []
     if 'sugar' in values and float(values['sugar']) > 140:
@@ -236,16 +212,22 @@ def parse_medical_values(text):
         conditions.append('Anemia')
     return values, conditions
 
-# Generate unique patient ID
+# Generate unique patient IDs
+def generate_patient_ids(count):
+    """count unused 8-character patient IDs, checked with one query per round.
+
+    With 36**8 possible IDs a round almost never has a collision, so a
+    whole import chunk costs a single query.
+    """
+    patient_ids = set()
+    while len(patient_ids) < count:
+        candidates = {random_patient_id() for _ in range(count - len(patient_ids))} - patient_ids
+        taken = {patient_id for patient_id, in db.session.query(User.patient_id).filter(User.patient_id.in_(candidates))}
+        patient_ids |= candidates - taken
+    return list(patient_ids)
+
 def generate_patient_id():
-    import random
-    import string
-    while True:
-        # Generate a 8-character alphanumeric ID
-        patient_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-        # Check if it already exists
-        if not User.query.filter_by(patient_id=patient_id).first():
-            return patient_id
+    return generate_patient_ids(1)[0]
 
 # Remove get_ai_reply function
 
@@ -279,6 +261,11 @@ class ActivityLog(db.Model):
     exercise = db.Column(db.String(100))
     calories = db.Column(db.Integer)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    
+    # Indexes are added to existing databases by migrations.py
+    __table_args__ = (
+        db.Index('ix_activity_log_user_date', 'user_id', 'date', 'id'),
+    )
 
 class HealthReport(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -291,6 +278,12 @@ class HealthReport(db.Model):
     doctor_comment = db.Column(db.Text)   # Doctor's comment
     comment_timestamp = db.Column(db.DateTime)  # When comment was added
     shared_with_doctor = db.Column(db.Boolean, default=False)
+    # Set once the report's LabResult rows are written (dual-write or backfill-lab-results)
+    lab_results_written = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    
+    __table_args__ = (
+        db.Index('ix_health_report_user_time', 'user_id', 'timestamp', 'id'),
+    )
 
 class ChatHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -298,6 +291,10 @@ class ChatHistory(db.Model):
     message = db.Column(db.Text)
     reply = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_chat_history_user_time', 'user_id', 'timestamp', 'id'),
+    )
 
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -313,6 +310,134 @@ class Message(db.Model):
     sender = db.relationship('User', foreign_keys=[sender_id])
     receiver = db.relationship('User', foreign_keys=[receiver_id])
     related_report = db.relationship('HealthReport', foreign_keys=[related_report_id])
+    
+    __table_args__ = (
+        db.Index('ix_message_receiver_read', 'receiver_id', 'is_read'),
+        db.Index('ix_message_receiver_time', 'receiver_id', 'timestamp'),
+        db.Index('ix_message_sender_time', 'sender_id', 'timestamp'),
+    )
+
+class LabResult(db.Model):
+    # One row per numeric value in HealthReport.extracted_values
+    id = db.Column(db.Integer, primary_key=True)
+    report_id = db.Column(db.Integer, db.ForeignKey('health_report.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    parameter_key = db.Column(db.String(64), nullable=False)
+    numeric_value = db.Column(db.Float, nullable=False)
+    unit = db.Column(db.String(32))
+    measured_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('report_id', 'parameter_key', name='uq_lab_result_report_parameter'),
+        db.Index('ix_lab_result_user_parameter_time', 'user_id', 'parameter_key', 'measured_at'),
+        db.Index('ix_lab_result_user_time', 'user_id', 'measured_at'),
+    )
+
+class ReportJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex, returned to the client
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    filename = db.Column(db.String(200))   # Name shown to the user
+    filepath = db.Column(db.String(300))   # Where the upload was saved
+    ocr_language = db.Column(db.String(10), default='eng')
+    shared_with_doctor = db.Column(db.Boolean, default=False)
+    status = db.Column(db.String(16), default='queued')  # queued, processing, done, failed
+    error = db.Column(db.Text)
+    page_timings = db.Column(db.Text)  # JSON list of per-page extraction method and seconds
+    content_hash = db.Column(db.String(64))  # SHA-256 of the uploaded file
+    from_cache = db.Column(db.Boolean, default=False)
+    report_id = db.Column(db.Integer, db.ForeignKey('health_report.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)    # When a job process last claimed it
+    finished_at = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Claims so far
+    
+    __table_args__ = (
+        db.Index('ix_report_job_user_status', 'user_id', 'status'),
+        db.Index('ix_report_job_status', 'status'),
+    )
+
+class ExtractionCache(db.Model):
+    # Extracted text and parsed values keyed by file content, so duplicate uploads skip OCR
+    content_hash = db.Column(db.String(64), primary_key=True)
+    ocr_language = db.Column(db.String(10), primary_key=True)
+    extractor_version = db.Column(db.String(16))
+    parser_version = db.Column(db.String(40))
+    extracted_text = db.Column(db.Text)
+    extracted_values = db.Column(db.Text)  # JSON
+    conditions = db.Column(db.Text)        # JSON
+    size_bytes = db.Column(db.Integer, default=0)
+    hits = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class DietPlan(db.Model):
+    # Latest diet chart per user, rebuilt on writes that change its inputs
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    plan = db.Column(db.Text)  # JSON list of meals
+    fingerprint = db.Column(db.String(40))  # Hash of the inputs the plan was built from
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UserStats(db.Model):
+    # Per-user activity/report rollup, updated as logs and reports are written
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    current_streak = db.Column(db.Integer, default=0, nullable=False)  # Consecutive days ending at last_activity_date
+    longest_streak = db.Column(db.Integer, default=0, nullable=False)
+    max_steps = db.Column(db.Integer, default=0, nullable=False)
+    report_count = db.Column(db.Integer, default=0, nullable=False)
+    last_activity_date = db.Column(db.Date)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ChatContext(db.Model):
+    # Precomputed chatbot context per user, kept current by the writes it depends on
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)  # Bumped on every change
+    context = db.Column(db.Text)  # Profile, latest values/conditions, latest activity
+    latest_report_at = db.Column(db.DateTime)
+    latest_report_has_values = db.Column(db.Boolean, default=False)
+    history = db.Column(db.Text)  # JSON list of the last exchanges, oldest first
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class InboxCounter(db.Model):
+    # Unread messages per user, kept current as messages are sent and read
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    unread = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SupabaseOutbox(OutboxMixin, db.Model):
+    # Rows waiting to be synced to Supabase, written with the data they mirror
+    __tablename__ = 'supabase_outbox'
+
+# Create tables once all models are registered, then bring existing
+# databases up to date (new indexes etc., see migrations.py)
+with app.app_context():
+    # Every statement is counted and timed for /metrics (see metrics.py)
+    metrics.instrument_engine(db.engine)
+    db.create_all()
+    migrate(db.engine)
+
+@app.before_request
+def start_request_metrics():
+    metrics.start_request()
+
+@app.after_request
+def record_request_metrics(response):
+    # Time until the response is ready; a streamed body keeps running after this
+    route = request.url_rule.rule if request.url_rule else '<unmatched>'
+    metrics.finish_request(request.method, route, response.status_code)
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Request, SQL, extraction, LLM and Supabase timings in Prometheus text format"""
+    token = os.getenv('METRICS_TOKEN')
+    if not token:
+        # Open without a token only in development; in production it needs one
+        if not (app.debug or app.testing):
+            abort(404)
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -335,9 +460,9 @@ def register():
         patient_id = generate_patient_id()
         user = User(username=username, password=password, patient_id=patient_id, age=age, gender=gender, height=height, weight=weight, role=role)
         db.session.add(user)
-        db.session.commit()
+        db.session.flush()
         
-        # Also save to Supabase
+        # Also save to Supabase, via the outbox in the same transaction
         user_data = {
             'id': user.id,
             'username': username,
@@ -349,11 +474,9 @@ def register():
             'role': role,
             'created_at': datetime.now().isoformat()
         }
-        supabase_result = supabase_service.create_user(user_data)
-        if supabase_result:
-            print(f"✅ User {username} also saved to Supabase")
-        else:
-            print(f"⚠️ Failed to save user {username} to Supabase")
+        supabase_service.create_user(user_data)
+        db.session.commit()
+        outbox_drainer.wake()
         
         flash('Registration successful! Please log in.', 'success')
         return redirect(url_for('login'))
@@ -409,67 +532,45 @@ def patient_records(patient_id):
         flash('Patient not found.', 'danger')
         return redirect(url_for('doctor_portal'))
     
-    # Get all health reports for this patient
-    reports = HealthReport.query.filter_by(user_id=patient.id).order_by(HealthReport.timestamp.desc()).all()
-    for report in reports:
-        report.values_dict = json.loads(report.extracted_values or '{}')
-        report.conds_list = json.loads(report.conditions or '[]')
-    
-    # Get activity logs
-    activity_logs = ActivityLog.query.filter_by(user_id=patient.id).order_by(ActivityLog.date.desc()).all()
+    # One page of health reports and activity logs; older pages via their cursors
+    try:
+        reports, next_reports_cursor = report_page(patient, request.args.get('reports_cursor'))
+        activity_logs, next_logs_cursor = activity_log_page(patient, request.args.get('logs_cursor'))
+    except InvalidCursor:
+        abort(400)
     
-    return render_template('patient_records.html', patient=patient, reports=reports, activity_logs=activity_logs)
+    return render_template('patient_records.html', patient=patient, reports=reports, activity_logs=activity_logs,
+                           next_reports_cursor=next_reports_cursor, next_logs_cursor=next_logs_cursor)
 
-# Dashboard
-@app.route('/dashboard')
-@login_required
-def dashboard():
-    reports = HealthReport.query.filter_by(user_id=current_user.id).order_by(HealthReport.timestamp.desc()).all()
-    for report in reports:
-        report.values_dict = json.loads(report.extracted_values or '{}')
-        report.conds_list = json.loads(report.conditions or '[]')
-    activity_logs = ActivityLog.query.filter_by(user_id=current_user.id).order_by(ActivityLog.date.desc()).all()
-    # Dynamically build trend_keys from all extracted keys in all reports
-    all_keys = set()
-    for report in reports:
-        all_keys.update(report.values_dict.keys())
-    trend_keys = sorted(all_keys)
-    # Build trend data by carrying forward last known value
-    trend_data = {}
-    reversed_reports = list(reversed(reports))
-    for key in trend_keys:
-        values = []
-        last_value = None
-        for r in reversed_reports:
-            vals = json.loads(r.extracted_values or '{}')
-            if key in vals and vals[key] not in [None, '', 'null']:
-                last_value = float(vals[key])
-            values.append(last_value if last_value is not None else 0)
-        trend_data[key] = values
-    trend_labels = [r.timestamp.strftime('%Y-%m-%d') for r in reversed_reports]
-    # Report comparison logic (carry forward)
-    comparison = {}
-    if len(reports) >= 2:
-        latest = json.loads(reports[0].extracted_values)
-        prev = json.loads(reports[1].extracted_values)
-        for key in set(latest.keys()).union(prev.keys()):
-            v_new = float(latest.get(key, prev.get(key, 0)))  # Use prev if missing in latest
-            v_old = float(prev.get(key, v_new))  # Use latest if missing in prev
-            if v_new > v_old:
-                status = 'worse'
-            elif v_new < v_old:
-                status = 'improved'
-            else:
-                status = 'no_change'
-            comparison[key] = {'latest': v_new, 'previous': v_old, 'status': status}
-    # Personalized diet chart with explanations (UPGRADED)
-    food_df = pd.read_csv('food_data.csv')
-    goal = current_user.goal or 'weight_loss'
+def decode_report(report):
+    """Attach the decoded values/conditions the templates read"""
+    report.values_dict = json.loads(report.extracted_values or '{}')
+    report.conds_list = json.loads(report.conditions or '[]')
+    return report
+
+def report_page(user, cursor=None, limit=None):
+    """A page of the user's health reports, newest first, and the next cursor"""
+    reports, next_cursor = keyset_page(HealthReport.query.filter_by(user_id=user.id),
+                                       HealthReport.timestamp, HealthReport.id,
+                                       cursor=cursor, limit=limit or page_size(None))
+    return [decode_report(r) for r in reports], next_cursor
+
+def activity_log_page(user, cursor=None, limit=None):
+    """A page of the user's activity logs, most recent day first, and the next cursor"""
+    return keyset_page(ActivityLog.query.filter_by(user_id=user.id),
+                       ActivityLog.date, ActivityLog.id,
+                       cursor=cursor, limit=limit or page_size(None), kind=date)
+
+def chat_history_page(user, cursor=None, limit=None):
+    """A page of the user's chatbot exchanges, newest first, and the next cursor"""
+    return keyset_page(ChatHistory.query.filter_by(user_id=user.id),
+                       ChatHistory.timestamp, ChatHistory.id,
+                       cursor=cursor, limit=limit or page_size(None))
+
+def build_diet_chart(latest_conditions, goal):
+    """Personalized diet chart with explanations for the latest conditions and goal"""
+    catalog = food_catalog()
     diet_chart = []
-    latest_conditions = []
-    if reports:
-        latest_report = reports[0]
-        latest_conditions = latest_report.conds_list if hasattr(latest_report, 'conds_list') else json.loads(latest_report.conditions or '[]')
     # Map conditions to food tags
     condition_tags = []
     if latest_conditions:
@@ -541,11 +642,8 @@ def dashboard():
         
         # Build food list with reasons
         for food in suggested_foods:
-            row = food_df[food_df['food'].str.lower() == food.lower()]
-            if not row.empty:
-                food_data = row.iloc[0]
-                suitable = food_data['suitable_for']
-                
+            food_data = catalog.get(food)
+            if food_data:
                 # Generate specific reason based on condition
                 if primary_condition == 'diabetes':
                     reason = f"Low glycemic index food to help control blood sugar levels"
@@ -569,11 +667,11 @@ def dashboard():
             for food in general_foods:
                 if len(foods) >= 3:
                     break
-                row = food_df[food_df['food'].str.lower() == food.lower()]
-                if not row.empty and not any(f['food'] == row.iloc[0]['food'] for f in foods):
+                food_data = catalog.get(food)
+                if food_data and not any(f['food'] == food_data['food'] for f in foods):
                     foods.append({
-                        'food': row.iloc[0]['food'],
-                        'calories': row.iloc[0]['calories'],
+                        'food': food_data['food'],
+                        'calories': food_data['calories'],
                         'reason': 'General healthy choice for balanced nutrition'
                     })
         
@@ -594,51 +692,180 @@ def dashboard():
             'calories': total_cal,
             'reason': combined_reason
         })
-    
-    # Store diet plan in the latest report if available
-    if reports and diet_chart:
-        latest_report = reports[0]
-        latest_report.diet_plan = json.dumps(diet_chart)
+    return diet_chart
+
+# Bump when build_diet_chart logic changes so stored plans are rebuilt
+DIET_PLAN_REVISION = '1'
+
+def diet_plan_inputs(user, latest_report):
+    """Conditions, goal and a fingerprint of everything the diet plan depends on"""
+    conditions = json.loads(latest_report.conditions or '[]') if latest_report else []
+    goal = user.goal or 'weight_loss'
+    inputs = [DIET_PLAN_REVISION, latest_report.id if latest_report else None, conditions, goal, food_catalog().version]
+    return conditions, goal, hashlib.sha1(json.dumps(inputs).encode()).hexdigest()
+
+def refresh_diet_plan(user):
+    """Rebuild and store a user's diet plan after its inputs changed; the caller commits"""
+    latest_report = HealthReport.query.filter_by(user_id=user.id).order_by(HealthReport.timestamp.desc()).first()
+    conditions, goal, fingerprint = diet_plan_inputs(user, latest_report)
+    diet_chart = build_diet_chart(conditions, goal)
+    plan = DietPlan.query.get(user.id)
+    if plan is None:
+        plan = DietPlan(user_id=user.id)
+        db.session.add(plan)
+    plan.plan = json.dumps(diet_chart)
+    plan.fingerprint = fingerprint
+    plan.updated_at = datetime.utcnow()
+    # Keep the copy on the latest report (read by the chatbot) in step
+    if latest_report and diet_chart:
+        latest_report.diet_plan = plan.plan
+    return diet_chart
+
+def current_diet_plan(user, latest_report):
+    """Stored diet plan for reads; rebuilt only if an input (e.g. the food catalog) changed"""
+    plan = DietPlan.query.get(user.id)
+    if plan and plan.fingerprint == diet_plan_inputs(user, latest_report)[2]:
+        return json.loads(plan.plan)
+    diet_chart = refresh_diet_plan(user)
+    db.session.commit()
+    return diet_chart
+
+def compute_user_stats(user_ids):
+    """Rebuild the stats rows of the given users from their raw logs and reports; the caller commits"""
+    user_ids = list(user_ids)
+    max_steps = dict(db.session.query(ActivityLog.user_id, db.func.max(ActivityLog.steps))
+                     .filter(ActivityLog.user_id.in_(user_ids)).group_by(ActivityLog.user_id))
+    report_counts = dict(db.session.query(HealthReport.user_id, db.func.count(HealthReport.id))
+                         .filter(HealthReport.user_id.in_(user_ids)).group_by(HealthReport.user_id))
+    activity_days = {}
+    for user_id, day in db.session.query(ActivityLog.user_id, ActivityLog.date).distinct() \
+            .filter(ActivityLog.user_id.in_(user_ids), ActivityLog.date.isnot(None)):
+        activity_days.setdefault(user_id, []).append(day)
+    existing = {stats.user_id: stats for stats in UserStats.query.filter(UserStats.user_id.in_(user_ids))}
+    rebuilt = []
+    for user_id in user_ids:
+        stats = existing.get(user_id)
+        if stats is None:
+            stats = UserStats(user_id=user_id)
+            db.session.add(stats)
+        days = activity_days.get(user_id, [])
+        stats.current_streak, stats.longest_streak = streaks(days)
+        stats.last_activity_date = max(days) if days else None
+        stats.max_steps = max_steps.get(user_id) or 0
+        stats.report_count = report_counts.get(user_id, 0)
+        stats.updated_at = datetime.utcnow()
+        rebuilt.append(stats)
+    return rebuilt
+
+def record_activity(log):
+    """Fold a newly added activity log into its user's stats; the caller commits"""
+    stats = UserStats.query.filter_by(user_id=log.user_id).with_for_update().first()
+    if stats is None:
+        # First write since the rollup existed: count everything, this log included
+        db.session.flush()
+        compute_user_stats([log.user_id])
+        return
+    stats.current_streak, stats.longest_streak, stats.last_activity_date = advance_streak(
+        stats.current_streak, stats.longest_streak, stats.last_activity_date, log.date)
+    stats.max_steps = max(stats.max_steps, log.steps or 0)
+    stats.updated_at = datetime.utcnow()
+
+def record_report(user_id, count=1):
+    """Count newly added health reports in the user's stats; the caller commits"""
+    # Increment in SQL so concurrent report jobs cannot lose an update
+    updated = UserStats.query.filter_by(user_id=user_id).update(
+        {'report_count': UserStats.report_count + count, 'updated_at': datetime.utcnow()})
+    if not updated:
+        db.session.flush()
+        compute_user_stats([user_id])
+
+def compute_inbox_counters(user_ids):
+    """Rebuild the unread counters of the given users from their messages; the caller commits"""
+    user_ids = list(user_ids)
+    unread = dict(db.session.query(Message.receiver_id, db.func.count(Message.id))
+                  .filter(Message.receiver_id.in_(user_ids), Message.is_read.is_(False))
+                  .group_by(Message.receiver_id))
+    existing = {counter.user_id: counter for counter in InboxCounter.query.filter(InboxCounter.user_id.in_(user_ids))}
+    rebuilt = []
+    for user_id in user_ids:
+        counter = existing.get(user_id)
+        if counter is None:
+            counter = InboxCounter(user_id=user_id)
+            db.session.add(counter)
+        counter.unread = unread.get(user_id, 0)
+        counter.updated_at = datetime.utcnow()
+        rebuilt.append(counter)
+    return rebuilt
+
+def record_unread(user_id, delta):
+    """Add delta to a user's unread counter; the caller commits"""
+    # In SQL, so concurrent sends and reads cannot lose an update
+    updated = InboxCounter.query.filter_by(user_id=user_id).update(
+        {'unread': InboxCounter.unread + delta, 'updated_at': datetime.utcnow()})
+    if not updated:
+        # First change since the counter existed: count everything, this change included
+        db.session.flush()
+        compute_inbox_counters([user_id])
+
+def current_unread_count(user_id):
+    """Unread messages for reads, counted from the messages the first time a user needs it"""
+    unread = db.session.query(InboxCounter.unread).filter_by(user_id=user_id).scalar()
+    if unread is None:
+        unread = compute_inbox_counters([user_id])[0].unread
+        db.session.commit()
+    return max(unread, 0)
+
+def current_user_stats(user_id):
+    """Stats row for reads, built from the raw data the first time a user needs one"""
+    stats = UserStats.query.get(user_id)
+    if stats is None:
+        stats = compute_user_stats([user_id])[0]
         db.session.commit()
+    return stats
+
+# Dashboard
+@app.route('/dashboard')
+@login_required
+def dashboard():
+    # Only the first page of each list is rendered; the rest is lazy-loaded from /api/*
+    reports, next_reports_cursor = report_page(current_user)
+    activity_logs, next_logs_cursor = activity_log_page(current_user)
+    # Trend series and latest-vs-previous comparison from the normalized lab results
+    trend_data, trend_labels, comparison = build_trend_series(lab_trend_rows(current_user.id))
+    # Personalized diet chart, computed when its inputs change and stored
+    diet_chart = current_diet_plan(current_user, reports[0] if reports else None)
     
     # Fun, gamified milestones (dynamic unlocks)
+    # Milestones read the maintained stats row instead of scanning logs and reports
+    stats = current_user_stats(current_user.id)
     milestones = []
     # First Report Uploaded
     milestones.append({
         'icon': '🏅',
         'name': 'First Report Uploaded',
         'desc': 'Upload your first medical report',
-        'unlocked': len(reports) > 0
+        'unlocked': stats.report_count > 0
     })
     # Step Master
     milestones.append({
         'icon': '🚶‍♂️',
         'name': 'Step Master',
         'desc': 'Walk 10,000 steps in a day',
-        'unlocked': any(log.steps and log.steps >= 10000 for log in activity_logs)
+        'unlocked': stats.max_steps >= 10000
     })
     # 7-Day Streak
-    streak = 1
-    if len(activity_logs) > 1:
-        streak = 1
-        for i in range(1, len(activity_logs)):
-            delta = (activity_logs[i-1].date - activity_logs[i].date).days
-            if delta == 1:
-                streak += 1
-            else:
-                break
     milestones.append({
         'icon': '🔥',
         'name': '7-Day Streak',
         'desc': 'Log activity 7 days in a row',
-        'unlocked': streak >= 7
+        'unlocked': stats.longest_streak >= 7
     })
     # Diet Pro
     milestones.append({
         'icon': '🥗',
         'name': 'Diet Pro',
         'desc': 'Log your diet for a week',
-        'unlocked': len(reports) >= 7
+        'unlocked': stats.report_count >= 7
     })
     # Static wellness score and random tip
     wellness_score = 87  # out of 100
@@ -651,14 +878,254 @@ def dashboard():
         "Celebrate your small health wins!"
     ]
     wellness_tip = random.choice(wellness_tips)
-    # Read all test parameter names for display
-    param_df = pd.read_csv('medical_test_parameters.csv')
-    all_parameters = [row['Test Name'] for _, row in param_df.iterrows()]
+    # All test parameter names for display
+    all_parameters = lab_test_parameters().names
     
-    # Get unread messages count
-    unread_messages = Message.query.filter_by(receiver_id=current_user.id, is_read=False).count()
+    # Maintained unread counter; the page keeps it current from /notifications/stream
+    unread_messages = current_unread_count(current_user.id)
     
-    return render_template('dashboard.html', user=current_user, reports=reports, activity_logs=activity_logs, diet_chart=diet_chart, milestones=milestones, wellness_score=wellness_score, wellness_tip=wellness_tip, comparison=comparison, trend_data=trend_data, trend_labels=trend_labels, all_parameters=all_parameters, unread_messages=unread_messages)
+    # Uploads still being processed in the background
+    pending_jobs = ReportJob.query.filter(ReportJob.user_id == current_user.id, ReportJob.status.in_(['queued', 'processing'])).all()
+    
+    return render_template('dashboard.html', user=current_user, reports=reports, activity_logs=activity_logs, diet_chart=diet_chart, milestones=milestones, wellness_score=wellness_score, wellness_tip=wellness_tip, comparison=comparison, trend_data=trend_data, trend_labels=trend_labels, all_parameters=all_parameters, unread_messages=unread_messages, pending_jobs=pending_jobs,
+                           next_reports_cursor=next_reports_cursor, next_logs_cursor=next_logs_cursor)
+
+def save_upload(file, path, chunk_size=1024 * 1024):
+    """Stream an upload to disk and return the SHA-256 of its contents"""
+    digest = hashlib.sha256()
+    with open(path, 'wb') as out:
+        while True:
+            chunk = file.stream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+def cached_extraction(content_hash, lang):
+    """Return (text, values, conditions) for already-processed file content, or None"""
+    entry = ExtractionCache.query.get((content_hash, lang))
+    if not entry or entry.extractor_version != EXTRACTOR_VERSION:
+        return None
+    if entry.parser_version != parser_version():
+        # Text is still good; re-parsing it takes milliseconds
+        values, conditions = parse_medical_values(entry.extracted_text)
+        entry.extracted_values = json.dumps(values)
+        entry.conditions = json.dumps(conditions)
+        entry.parser_version = parser_version()
+    entry.hits = (entry.hits or 0) + 1
+    entry.last_used_at = datetime.utcnow()
+    return entry.extracted_text, json.loads(entry.extracted_values), json.loads(entry.conditions)
+
+def store_extraction(content_hash, lang, text, values, conditions):
+    """Cache an extraction, then evict least-recently-used entries over the size limit"""
+    values_json = json.dumps(values)
+    conditions_json = json.dumps(conditions)
+    try:
+        db.session.merge(ExtractionCache(
+            content_hash=content_hash,
+            ocr_language=lang,
+            extractor_version=EXTRACTOR_VERSION,
+            parser_version=parser_version(),
+            extracted_text=text,
+            extracted_values=values_json,
+            conditions=conditions_json,
+            size_bytes=len(text.encode()) + len(values_json) + len(conditions_json),
+            hits=0,
+            last_used_at=datetime.utcnow()
+        ))
+        db.session.commit()
+        total = db.session.query(db.func.sum(ExtractionCache.size_bytes)).scalar() or 0
+        if total > EXTRACTION_CACHE_MAX_BYTES:
+            oldest = db.session.query(ExtractionCache.content_hash, ExtractionCache.ocr_language, ExtractionCache.size_bytes) \
+                .order_by(ExtractionCache.last_used_at.asc()).all()
+            for entry_hash, entry_lang, size in oldest:
+                if total <= EXTRACTION_CACHE_MAX_BYTES:
+                    break
+                ExtractionCache.query.filter_by(content_hash=entry_hash, ocr_language=entry_lang).delete()
+                total -= size or 0
+            db.session.commit()
+    except Exception as e:
+        # Another worker cached the same file first; nothing is lost
+        db.session.rollback()
+        print(f"Extraction cache store skipped: {e}")
+
+def lab_value_number(value):
+    """Numeric form of an extracted value, or None for values like '.' or '1.2.3'"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def add_lab_results(report, values):
+    """Write the normalized LabResult rows for a report; the caller commits"""
+    units = lab_test_parameters().units
+    rows = []
+    for key, value in values.items():
+        number = lab_value_number(value)
+        if number is None:
+            continue
+        rows.append({
+            'report_id': report.id,
+            'user_id': report.user_id,
+            'parameter_key': key,
+            'numeric_value': number,
+            'unit': units.get(key),
+            'measured_at': report.timestamp
+        })
+    if rows:
+        db.session.execute(LabResult.__table__.insert(), rows)
+    return len(rows)
+
+# Reports shown in the dashboard trend chart; older ones are in the report history
+DASHBOARD_TREND_POINTS = int(os.getenv('DASHBOARD_TREND_POINTS', '20'))
+
+def lab_trend_rows(user_id, points=None):
+    """(report_id, measured_at, parameter_key, numeric_value) of a user's latest lab results, oldest first.
+
+    Only the last `points` measurement times are read, both through the
+    (user_id, measured_at) index, so the cost doesn't grow with the history.
+    """
+    points = points or DASHBOARD_TREND_POINTS
+    query = db.session.query(LabResult.report_id, LabResult.measured_at, LabResult.parameter_key,
+                             LabResult.numeric_value).filter(LabResult.user_id == user_id)
+    since = (db.session.query(LabResult.measured_at).filter(LabResult.user_id == user_id).distinct()
+             .order_by(LabResult.measured_at.desc()).offset(points - 1).limit(1).scalar())
+    if since is not None:
+        query = query.filter(LabResult.measured_at >= since)
+    return query.order_by(LabResult.measured_at, LabResult.report_id).all()
+
+def add_health_report(user_id, filename, text, values, conditions, shared_with_doctor=False, timestamp=None):
+    """Store an extracted report with its Supabase sync row and LabResult rows; the caller commits"""
+    report = HealthReport(
+        filename=filename,
+        user_id=user_id,
+        extracted_values=json.dumps(values),
+        conditions=json.dumps(conditions),
+        diet_plan='{}',
+        shared_with_doctor=shared_with_doctor,
+        timestamp=timestamp or datetime.utcnow(),
+        lab_results_written=True
+    )
+    db.session.add(report)
+    db.session.flush()
+    supabase_service.create_health_report({
+        'id': report.id,
+        'user_id': report.user_id,
+        'filename': report.filename,
+        'extracted_text': text,
+        'extracted_values': values,
+        'analysis_results': {'conditions': conditions},
+        'created_at': report.timestamp.isoformat()
+    })
+    add_lab_results(report, values)
+    return report
+
+def extract_report(filepath, lang='eng'):
+    """Extract and parse one file as report jobs do: (text, values, conditions, page_timings, seconds)"""
+    started = time.perf_counter()
+    page_timings = []
+    text = extract_text_from_file(filepath, lang=lang, page_timings=page_timings)
+    values, conditions = parse_medical_values(text)
+    return text, values, conditions, page_timings, time.perf_counter() - started
+
+def process_report_job(job_id):
+    """Run OCR and parsing for a queued upload and store the HealthReport"""
+    with app.app_context():
+        # Claim the job atomically so it is processed exactly once
+        claimed = ReportJob.query.filter_by(id=job_id, status='queued').update(
+            {'status': 'processing', 'started_at': datetime.utcnow(), 'attempts': ReportJob.attempts + 1})
+        db.session.commit()
+        if not claimed:
+            return
+        job = ReportJob.query.get(job_id)
+        extracted = None
+        try:
+            cached = cached_extraction(job.content_hash, job.ocr_language) if job.content_hash else None
+            if cached:
+                text, values, conditions = cached
+                job.from_cache = True
+            else:
+                text, values, conditions, page_timings, _ = extract_report(job.filepath, job.ocr_language)
+                job.page_timings = json.dumps(page_timings)
+                extracted = (text, values, conditions)
+            report = add_health_report(job.user_id, job.filename, text, values, conditions, job.shared_with_doctor)
+            record_report(job.user_id)
+            job.report_id = report.id
+            user = User.query.get(job.user_id)
+            refresh_diet_plan(user)
+            refresh_chat_context(user)
+            job.status = 'done'
+        except Exception as e:
+            print(f"Report job {job_id} failed: {e}")
+            db.session.rollback()
+            job = ReportJob.query.get(job_id)
+            job.status = 'failed'
+            job.error = str(e)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        # Only reaches the cache of this process; others miss on the new context hash
+        chat_cache.invalidate_user(job.user_id)
+        if extracted and job.content_hash:
+            store_extraction(job.content_hash, job.ocr_language, *extracted)
+
+def drain_supabase_outbox():
+    """Push one batch of due outbox rows to Supabase and delete rows past their retention"""
+    with app.app_context():
+        try:
+            handled = drain(db.session, SupabaseOutbox, supabase_service.push)
+            prune_sent(db.session, SupabaseOutbox)
+            return handled
+        finally:
+            db.session.remove()
+
+outbox_drainer = OutboxDrainer(drain_supabase_outbox)
+
+# New-message events, relayed across workers (see notifications.py)
+notification_hub = NotificationHub(feed_from_env(database_url, os.path.join(app.instance_path, 'message-events.log')))
+
+# A job still 'processing' after this long lost its process (see recover_stale_report_jobs)
+REPORT_JOB_TIMEOUT = int(os.getenv('REPORT_JOB_TIMEOUT', '900'))
+REPORT_JOB_MAX_ATTEMPTS = int(os.getenv('REPORT_JOB_MAX_ATTEMPTS', '2'))
+
+def recover_stale_report_jobs(now=None):
+    """Jobs left 'processing' longer than REPORT_JOB_TIMEOUT, whose process died mid-extraction.
+
+    They go back to the queue, or are marked failed once they have been
+    claimed REPORT_JOB_MAX_ATTEMPTS times (a file that kills its process
+    every time must not loop forever). The caller commits.
+    """
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=REPORT_JOB_TIMEOUT)
+    stale = ReportJob.query.filter(ReportJob.status == 'processing', ReportJob.started_at < cutoff)
+    failed = stale.filter(ReportJob.attempts >= REPORT_JOB_MAX_ATTEMPTS).update(
+        {'status': 'failed', 'finished_at': datetime.utcnow(),
+         'error': 'Processing was interrupted; please upload the file again.'}, synchronize_session=False)
+    requeued = stale.update({'status': 'queued'}, synchronize_session=False)
+    return requeued, failed
+
+def requeue_report_jobs():
+    """Hand jobs still queued (e.g. from before a restart) or interrupted to the job pool"""
+    with app.app_context():
+        requeued, failed = recover_stale_report_jobs()
+        db.session.commit()
+        if requeued or failed:
+            print(f"Recovered interrupted report jobs: {requeued} requeued, {failed} failed")
+        pending = [job.id for job in ReportJob.query.filter_by(status='queued').all()]
+    for job_id in pending:
+        job_pool.submit(process_report_job, job_id)
+
+def report_job_status(job):
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'filename': job.filename,
+        'report_id': job.report_id,
+        'error': job.error,
+        'page_timings': json.loads(job.page_timings or '[]'),
+        'from_cache': bool(job.from_cache),
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
 
 # Upload Medical Report (POST)
 @app.route('/upload', methods=['POST'])
@@ -673,43 +1140,123 @@ def upload():
         return redirect(url_for('dashboard'))
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(save_path)
+        job_id = uuid.uuid4().hex
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+        # Prefix with the job ID so concurrent uploads never overwrite each other
+        save_path = os.path.join(app.config['UPLOAD_FOLDER'], f'{job_id}_{filename}')
+        content_hash = save_upload(file, save_path)
         lang = request.form.get('ocr_language', 'eng')
-        text = extract_text_from_file(save_path, lang=lang)
-        values, conditions = parse_medical_values(text)
-        shared = bool(request.form.get('shared_with_doctor'))
-        report = HealthReport(
-            filename=filename,
+        job = ReportJob(
+            id=job_id,
             user_id=current_user.id,
-            extracted_values=json.dumps(values),
-            conditions=json.dumps(conditions),
-            diet_plan='{}',
-            shared_with_doctor=shared
+            filename=filename,
+            filepath=save_path,
+            ocr_language=lang,
+            content_hash=content_hash,
+            shared_with_doctor=bool(request.form.get('shared_with_doctor'))
         )
-        db.session.add(report)
+        db.session.add(job)
         db.session.commit()
-        flash('Medical report uploaded and processed successfully!', 'success')
+        if ExtractionCache.query.filter_by(content_hash=content_hash, ocr_language=lang, extractor_version=EXTRACTOR_VERSION).count():
+            # Same file seen before: a cache lookup, done within the request
+            process_report_job(job_id)
+        else:
+            # OCR and parsing run in the job pool; the request returns right away
+            job_pool.submit(process_report_job, job_id)
+        done = job.status == 'done'
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify({**report_job_status(job), 'status_url': url_for('upload_status', job_id=job_id)}), 200 if done else 202
+        if done:
+            flash('Medical report uploaded and processed successfully!', 'success')
+        else:
+            flash('Medical report received! It is being processed and will appear in your reports shortly.', 'success')
         return redirect(url_for('dashboard'))
     else:
         flash('Invalid file type. Only PDF, JPG, JPEG, PNG allowed.', 'danger')
         return redirect(url_for('dashboard'))
 
+@app.route('/upload/status/<job_id>')
+@login_required
+def upload_status(job_id):
+    job = ReportJob.query.filter_by(id=job_id, user_id=current_user.id).first()
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(report_job_status(job))
+
+# Paginated history APIs: ?cursor=<next_cursor from the previous page>&limit=<n>
+def history_owner():
+    """User whose history is requested: the caller, or ?patient_id=... for doctors"""
+    patient_id = request.args.get('patient_id')
+    if not patient_id or patient_id == current_user.patient_id:
+        return current_user
+    if current_user.role != 'doctor':
+        abort(403)
+    patient = User.query.filter_by(patient_id=patient_id).first()
+    if not patient:
+        abort(404)
+    return patient
+
+def history_response(page, owner, serialize):
+    try:
+        items, next_cursor = page(owner, request.args.get('cursor'), page_size(request.args.get('limit')))
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    return jsonify({'items': [serialize(item) for item in items], 'next_cursor': next_cursor})
+
+def report_json(report):
+    return {
+        'id': report.id,
+        'filename': report.filename,
+        'timestamp': report.timestamp.isoformat(),
+        'values': report.values_dict,
+        'conditions': report.conds_list,
+        'doctor_comment': report.doctor_comment,
+        'comment_timestamp': report.comment_timestamp.isoformat() if report.comment_timestamp else None,
+        'shared_with_doctor': bool(report.shared_with_doctor),
+    }
+
+def activity_log_json(log):
+    return {'id': log.id, 'date': log.date.isoformat(), 'steps': log.steps, 'exercise': log.exercise, 'calories': log.calories}
+
+def chat_history_json(entry):
+    return {'id': entry.id, 'message': entry.message, 'reply': entry.reply, 'timestamp': entry.timestamp.isoformat()}
+
+@app.route('/api/reports')
+@login_required
+def api_reports():
+    return history_response(report_page, history_owner(), report_json)
+
+@app.route('/api/activity-logs')
+@login_required
+def api_activity_logs():
+    return history_response(activity_log_page, history_owner(), activity_log_json)
+
+@app.route('/api/chat-history')
+@login_required
+def api_chat_history():
+    # Chatbot conversations are private to the patient
+    return history_response(chat_history_page, current_user, chat_history_json)
+
 # Activity Log (POST)
 @app.route('/activity-log', methods=['POST'])
 @login_required
 def activity_log():
-    steps = request.form.get('steps')
+    steps = request.form.get('steps', type=int)
     exercise = request.form.get('exercise')
-    calories = request.form.get('calories')
+    calories = request.form.get('calories', type=int)
     log = ActivityLog(
+        date=datetime.utcnow().date(),
         steps=steps,
         exercise=exercise,
         calories=calories,
         user_id=current_user.id
     )
     db.session.add(log)
+    record_activity(log)
+    db.session.flush()
+    refresh_chat_context(current_user)
     db.session.commit()
+    chat_cache.invalidate_user(current_user.id)
     flash('Activity log added!', 'success')
     return redirect(url_for('dashboard'))
 
@@ -727,12 +1274,27 @@ def update_goal():
     goal = request.form.get('goal')
     if goal in ['weight_loss', 'muscle_gain', 'diabetes_control']:
         current_user.goal = goal
+        refresh_diet_plan(current_user)
+        refresh_chat_context(current_user)
         db.session.commit()
+        chat_cache.invalidate_user(current_user.id)
         flash('Health goal updated!', 'success')
     else:
         flash('Invalid goal selected.', 'danger')
     return redirect(url_for('dashboard'))
 
+def queue_message_sync(message):
+    """Queue a flushed message for Supabase in the same transaction; the caller commits"""
+    supabase_service.create_message({
+        'id': message.id,
+        'sender_id': message.sender_id,
+        'recipient_id': message.receiver_id,
+        'subject': message.message_type,
+        'content': message.content,
+        'is_read': False,
+        'created_at': message.timestamp.isoformat()
+    })
+
 @app.route('/doctor/comment/<int:report_id>', methods=['POST'])
 @login_required
 def doctor_comment(report_id):
@@ -756,7 +1318,12 @@ def doctor_comment(report_id):
         )
         
         db.session.add(message)
+        db.session.flush()
+        queue_message_sync(message)
+        record_unread(message.receiver_id, 1)
         db.session.commit()
+        outbox_drainer.wake()
+        notify_new_message(message)
         flash('Comment added successfully! Patient will be notified.', 'success')
     else:
         flash('Comment cannot be empty.', 'danger')
@@ -766,41 +1333,153 @@ def doctor_comment(report_id):
     return redirect(url_for('patient_records', patient_id=patient.patient_id))
 
 # Message management routes
+# Column that puts a message in the current user's received or sent list
+MESSAGE_BOXES = {'received': Message.receiver_id, 'sent': Message.sender_id}
+
+def message_query(user, box):
+    """The user's received or sent messages, with the other party and the related
+    report joined into the same query, loading only the columns message_json reads"""
+    other = Message.sender if box == 'received' else Message.receiver
+    return Message.query.filter(MESSAGE_BOXES[box] == user.id).options(
+        load_only(Message.id, Message.content, Message.timestamp, Message.message_type, Message.is_read),
+        joinedload(other).load_only(User.username),
+        joinedload(Message.related_report).load_only(HealthReport.filename))
+
+def message_page(user, box, cursor=None, limit=None):
+    """A page of the user's received or sent messages, newest first, and the next cursor"""
+    return keyset_page(message_query(user, box), Message.timestamp, Message.id, cursor=cursor,
+                       limit=limit or page_size(None))
+
+def messages_since(user, box, since, limit=None):
+    """The user's received or sent messages after the since position, oldest first, and whether more are left"""
+    return keyset_after(message_query(user, box), Message.timestamp, Message.id, since,
+                        limit=limit or page_size(None))
+
+def message_json(msg, box):
+    data = {
+        'id': msg.id,
+        'content': msg.content,
+        'timestamp': msg.timestamp.strftime('%Y-%m-%d %H:%M'),
+        'type': msg.message_type,
+        'related_report': msg.related_report.filename if msg.related_report else None
+    }
+    if box == 'received':
+        data['sender'] = msg.sender.username
+        data['is_read'] = msg.is_read
+    else:
+        data['receiver'] = msg.receiver.username
+    return data
+
 @app.route('/messages')
 @login_required
 def messages():
-    # Get messages for current user
-    received_messages = Message.query.filter_by(receiver_id=current_user.id).order_by(Message.timestamp.desc()).all()
-    sent_messages = Message.query.filter_by(sender_id=current_user.id).order_by(Message.timestamp.desc()).all()
-    
-    return jsonify({
-        'received': [{
-            'id': msg.id,
-            'content': msg.content,
-            'timestamp': msg.timestamp.strftime('%Y-%m-%d %H:%M'),
-            'sender': msg.sender.username,
-            'type': msg.message_type,
-            'is_read': msg.is_read,
-            'related_report': msg.related_report.filename if msg.related_report else None
-        } for msg in received_messages],
-        'sent': [{
-            'id': msg.id,
-            'content': msg.content,
-            'timestamp': msg.timestamp.strftime('%Y-%m-%d %H:%M'),
-            'receiver': msg.receiver.username,
-            'type': msg.message_type,
-            'related_report': msg.related_report.filename if msg.related_report else None
-        } for msg in sent_messages]
-    })
+    """The user's messages, newest first, a page at a time.
+
+    Without ?box= the first page of both lists is returned as 'received' and
+    'sent' with their next cursors. ?box=received|sent returns one list as
+    'items' and 'next_cursor' and follows ?cursor=. Every response carries a
+    'since' position (after the newest message returned); sending it back as
+    ?since= fetches the messages that arrived after it, oldest first, up to
+    limit per list. When 'more' is true some are still left: fetch again
+    with the new 'since' right away.
+    """
+    box = request.args.get('box')
+    if box is not None and box not in MESSAGE_BOXES:
+        return jsonify({'error': 'Unknown box'}), 400
+    limit = page_size(request.args.get('limit'))
+    boxes = [box] if box else list(MESSAGE_BOXES)
+    since = request.args.get('since')
+    if since:
+        try:
+            fetched = {name: messages_since(current_user, name, since, limit) for name in boxes}
+        except InvalidCursor:
+            return jsonify({'error': 'Invalid since'}), 400
+        # A list cut off at limit ends the fetch at its last message; later ones
+        # from the other list come with the next fetch, so none is skipped
+        cut_off = [(items[-1].timestamp, items[-1].id) for items, more in fetched.values() if more]
+        end = min(cut_off, default=None)
+        pages = {name: ([msg for msg in items if end is None or (msg.timestamp, msg.id) <= end], None)
+                 for name, (items, _) in fetched.items()}
+        newest = end or max(((items[-1].timestamp, items[-1].id) for items, _ in pages.values() if items),
+                            default=None)
+        response = {'since': encode_cursor(*newest) if newest else since, 'more': bool(cut_off)}
+    else:
+        try:
+            pages = {name: message_page(current_user, name, request.args.get('cursor') if box else None, limit)
+                     for name in boxes}
+        except InvalidCursor:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        # Newest message seen, so the next incremental fetch starts after it
+        newest = max(((items[0].timestamp, items[0].id) for items, _ in pages.values() if items), default=None)
+        response = {'since': encode_cursor(*newest) if newest else None}
+    if box:
+        items, next_cursor = pages[box]
+        response.update(items=[message_json(msg, box) for msg in items], next_cursor=next_cursor)
+    else:
+        for name, (items, next_cursor) in pages.items():
+            response[name] = [message_json(msg, name) for msg in items]
+            response[f'next_{name}_cursor'] = next_cursor
+    return jsonify(response)
+
+def notify_new_message(message):
+    """Push a committed message to the receiver's open notification streams"""
+    notification_hub.publish(message.receiver_id, 'message', message_id=message.id,
+                             unread=current_unread_count(message.receiver_id))
+
+@app.route('/notifications/stream')
+@login_required
+def notifications_stream():
+    """New-message and read events for the current user as Server-Sent Events.
+
+    Starts with an "unread" event carrying the current unread count, then
+    sends a "message" event ({"message_id", "unread"}) for each new message
+    and a "read" event when one is marked read, in any tab. The stream closes
+    after NOTIFY_STREAM_SECONDS and the browser reconnects on its own.
+    """
+    user_id = current_user.id
+    # Subscribe before reading the count so nothing sent in between is missed
+    subscription = notification_hub.subscribe(user_id)
+    unread = current_unread_count(user_id)
+    # The stream itself never touches the database
+    db.session.close()
+
+    def generate():
+        try:
+            yield sse_event({'unread': unread}, event='unread')
+            closes_at = time.monotonic() + notification_hub.stream_seconds
+            while time.monotonic() < closes_at:
+                event = subscription.get(timeout=notification_hub.keepalive)
+                if event is None:
+                    yield ': keep-alive\n\n'
+                else:
+                    yield sse_event({'message_id': event.get('message_id'), 'unread': event.get('unread')},
+                                    event=event['type'])
+        finally:
+            subscription.close()
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/notifications/stats')
+@login_required
+def notifications_stats():
+    """Open streams and events relayed by this worker"""
+    return jsonify(notification_hub.stats())
 
 @app.route('/mark-message-read/<int:message_id>', methods=['POST'])
 @login_required
 def mark_message_read(message_id):
     message = Message.query.get_or_404(message_id)
     if message.receiver_id == current_user.id:
-        message.is_read = True
+        # Only the request that flips the flag counts it, so two tabs can't both decrement
+        flipped = Message.query.filter_by(id=message.id, is_read=False).update({'is_read': True})
+        if flipped:
+            record_unread(current_user.id, -1)
         db.session.commit()
-        return jsonify({'success': True})
+        unread = current_unread_count(current_user.id)
+        if flipped:
+            notification_hub.publish(current_user.id, 'read', message_id=message.id, unread=unread)
+        return jsonify({'success': True, 'unread': unread})
     return jsonify({'success': False, 'error': 'Unauthorized'})
 
 @app.route('/send-message', methods=['POST'])
@@ -829,7 +1508,12 @@ def send_message():
     )
     
     db.session.add(message)
+    db.session.flush()
+    queue_message_sync(message)
+    record_unread(message.receiver_id, 1)
     db.session.commit()
+    outbox_drainer.wake()
+    notify_new_message(message)
     
     return jsonify({'success': True, 'message_id': message.id})
 
@@ -849,15 +1533,237 @@ def chatbot_test():
 def get_chat_history():
     """Get chat history for the current user without sending a message"""
     try:
-        chat_history = ChatHistory.query.filter_by(user_id=current_user.id).order_by(ChatHistory.timestamp.desc()).limit(10).all()
-        chat_history = list(reversed(chat_history))
-        return jsonify({
-            'history': [{'message': c.message, 'reply': c.reply, 'timestamp': c.timestamp.strftime('%H:%M')} for c in chat_history]
-        })
+        return jsonify({'history': history_for_widget(json.loads(chat_context_snapshot(current_user).history or '[]'))})
     except Exception as e:
         print(f'Error retrieving chat history: {e}')
         return jsonify({'error': 'Failed to retrieve chat history'})
 
+CHAT_SYSTEM_PROMPT = "You are a health assistant. Answer based ONLY on the user's data provided. Keep responses under 100 words."
+CHAT_FALLBACK_REPLY = "I'm experiencing technical difficulties. Please try again later."
+CHAT_CONTEXT_HISTORY = 10  # Exchanges kept in the snapshot (the widget shows 10)
+CHAT_PROMPT_HISTORY = 3  # Exchanges quoted in the prompt
+
+def build_chat_context(user):
+    """Concise context string for the LLM (kept short to avoid token limits) and the latest report"""
+    latest_report = HealthReport.query.filter_by(user_id=user.id).order_by(HealthReport.timestamp.desc()).first()
+    latest_log = ActivityLog.query.filter_by(user_id=user.id).order_by(ActivityLog.date.desc(), ActivityLog.id.desc()).first()
+    context_parts = []
+    context_parts.append(f"User: {user.username}, Age: {user.age if user.age else 'N/A'}, Goal: {user.goal if user.goal else 'N/A'}")
+    if latest_report:
+        try:
+            extracted_values = json.loads(latest_report.extracted_values or '{}')
+            if extracted_values:
+                # Only include key values, limit to 3-4 most important
+                key_values = list(extracted_values.items())[:3]
+                context_parts.append(f"Health Data: {', '.join([f'{k}={v}' for k, v in key_values])}")
+            conditions = json.loads(latest_report.conditions or '[]')
+            if conditions:
+                context_parts.append(f"Conditions: {', '.join(conditions[:2])}")  # Limit to 2 conditions
+        except Exception as e:
+            print(f"Error parsing report data: {e}")
+    if latest_log:
+        # Only include most recent activity
+        context_parts.append(f"Recent: {latest_log.steps} steps, {latest_log.exercise}")
+    return " | ".join(context_parts), latest_report
+
+def refresh_chat_context(user, history=None):
+    """Rebuild a user's context snapshot after a write it depends on; the caller commits.
+
+    The stored chat history is kept unless history (a list of exchanges) is given.
+    """
+    context, latest_report = build_chat_context(user)
+    snapshot = ChatContext.query.get(user.id)
+    if snapshot is None:
+        snapshot = ChatContext(user_id=user.id, version=0)
+        db.session.add(snapshot)
+        if history is None:
+            history = load_chat_history(user.id)
+    snapshot.context = context
+    snapshot.latest_report_at = latest_report.timestamp if latest_report else None
+    snapshot.latest_report_has_values = bool(latest_report and json.loads(latest_report.extracted_values or '{}'))
+    if history is not None:
+        snapshot.history = json.dumps(history)
+    snapshot.version = (snapshot.version or 0) + 1
+    snapshot.updated_at = datetime.utcnow()
+    return snapshot
+
+def chat_context_snapshot(user):
+    """The user's context snapshot for a chat turn, built on first use"""
+    snapshot = ChatContext.query.get(user.id)
+    if snapshot is None:
+        snapshot = refresh_chat_context(user)
+        db.session.commit()
+    return snapshot
+
+def load_chat_history(user_id, limit=None):
+    """Last exchanges from ChatHistory, oldest first, in the snapshot's format"""
+    rows = ChatHistory.query.filter_by(user_id=user_id).order_by(ChatHistory.timestamp.desc()) \
+        .limit(limit or CHAT_CONTEXT_HISTORY).all()
+    return [chat_exchange(c) for c in reversed(rows)]
+
+def chat_exchange(chat):
+    return {'message': chat.message, 'reply': chat.reply, 'timestamp': chat.timestamp.isoformat()}
+
+def record_chat_exchange(user_id, history, chat):
+    """Append a stored exchange to the snapshot without reading it again; the caller commits.
+
+    Returns the new history. A concurrent turn can drop an entry from the
+    snapshot (last write wins); ChatHistory itself is always complete.
+    """
+    history = (list(history) + [chat_exchange(chat)])[-CHAT_CONTEXT_HISTORY:]
+    ChatContext.query.filter_by(user_id=user_id).update(
+        {'history': json.dumps(history), 'version': ChatContext.version + 1, 'updated_at': datetime.utcnow()})
+    return history
+
+def history_for_widget(history):
+    """Snapshot history as the chat widget renders it"""
+    return [{'message': h['message'], 'reply': h['reply'],
+             'timestamp': datetime.fromisoformat(h['timestamp']).strftime('%H:%M')} for h in history]
+
+def chat_history_text(history):
+    """The recent exchanges as quoted in the prompt, replies shortened to keep it small"""
+    return " | ".join([f"Q: {h['message']} A: {h['reply'][:50]}..." for h in history[-CHAT_PROMPT_HISTORY:]])
+
+def chat_messages(context, user_message, history=()):
+    user_prompt = f"Context: {context}\n\n"
+    if history:
+        user_prompt += f"Recent chat: {chat_history_text(history)}\n\n"
+    user_prompt += f"Question: {user_message}\n\nAnswer based ONLY on the user's data above:"
+    return [
+        {'role': 'system', 'content': CHAT_SYSTEM_PROMPT},
+        {'role': 'user', 'content': user_prompt}
+    ]
+
+def sse_event(data, event=None):
+    prefix = f'event: {event}\n' if event else ''
+    return f'{prefix}data: {json.dumps(data)}\n\n'
+
+def ask_llm(context, user_message, goal, history=()):
+    """Ask the LLM; returns (reply, answered), answered only for a usable model reply"""
+    answered = False
+    # Compose concise prompt for LLM
+    print(f"Calling OpenRouter API...")
+    
+    # Call DeepSeek LLM via OpenRouter
+    data = llm_client.payload(chat_messages(context, user_message, history), max_tokens=150)  # Reduced from 512 to avoid hitting limits
+    
+    print(f"Request data: {json.dumps(data, indent=2)}")
+    
+    try:
+        # Pooled keep-alive session instead of a new connection per message
+        response = llm_client.post(data, timeout=30)
+        
+        print(f"OpenRouter response status: {response.status_code}")
+        
+        if response.status_code == 200:
+            response_data = response.json()
+            print(f"Response JSON: {json.dumps(response_data, indent=2)}")
+            
+            if 'choices' in response_data and len(response_data['choices']) > 0:
+                reply = response_data['choices'][0]['message']['content']
+                print(f"Generated reply: {reply[:100]}...")
+                
+                # Check if reply is empty or too short
+                if not reply or len(reply.strip()) < 10:
+                    print("API returned empty/short response, using fallback")
+                    reply = f"Based on your data: {context}. You have a {goal} goal. Your latest health data shows good activity levels. For specific health questions, please consult your healthcare provider."
+                else:
+                    answered = True
+            else:
+                print("No choices in response")
+                reply = 'Sorry, the AI response was incomplete. Please try again.'
+        else:
+            print(f'OpenRouter API error: {response.status_code}, {response.text}')
+            reply = f'API Error {response.status_code}: {response.text[:100]}'
+            
+    except requests.exceptions.Timeout:
+        print("Request timed out")
+        reply = 'Sorry, the request timed out. Please try again.'
+    except requests.exceptions.ConnectionError as e:
+        print(f"Connection error: {e}")
+        reply = 'Sorry, there was a connection error. Please check your internet connection.'
+    except requests.exceptions.RequestException as e:
+        print(f"Request error: {e}")
+        reply = f'Request error: {str(e)}'
+    except json.JSONDecodeError as e:
+        print(f"JSON decode error: {e}")
+        reply = 'Sorry, there was an error parsing the response.'
+    except Exception as e:
+        print(f"Unexpected error in API call: {e}")
+        reply = f'Unexpected error: {str(e)}'
+    return reply, answered
+
+@app.route('/chatbot/cache-stats')
+@login_required
+def chatbot_cache_stats():
+    """Hit ratio and LLM time saved by this worker's chat response cache"""
+    return jsonify(chat_cache.stats())
+
+@app.route('/supabase/cache-stats')
+@login_required
+def supabase_cache_stats():
+    """Hit ratio and size of this worker's Supabase read cache"""
+    return jsonify(supabase_cache.stats())
+
+@app.route('/chatbot/stream', methods=['POST'])
+@login_required
+def chatbot_stream():
+    """Relay the chatbot reply as Server-Sent Events while the LLM generates it.
+
+    Events: {"token": ...} per chunk of reply text, then an event named
+    "done" carrying the updated chat history.
+    """
+    user_message = (request.get_json(silent=True) or {}).get('message', '').strip()
+    if not user_message:
+        return jsonify({'error': 'Message cannot be empty'}), 400
+    user_id = current_user.id
+    snapshot = chat_context_snapshot(current_user)
+    context = snapshot.context
+    history = json.loads(snapshot.history or '[]')
+    messages = chat_messages(context, user_message, history)
+    history_text = chat_history_text(history)
+    cached_reply = chat_cache.get(user_id, user_message, context, history_text)
+    # Hand the DB connection back to the pool for the length of the stream
+    db.session.close()
+
+    def stream_llm_reply():
+        parts = []
+        started = time.perf_counter()
+        try:
+            for text in llm_client.stream_chat(messages):
+                parts.append(text)
+                yield sse_event({'token': text})
+        except (LLMError, requests.exceptions.RequestException, ValueError) as e:
+            print(f"Chatbot stream error: {e}")
+            return ''.join(parts)
+        reply = ''.join(parts)
+        if reply.strip():
+            chat_cache.put(user_id, user_message, context, reply, time.perf_counter() - started, history_text)
+        return reply
+
+    def generate():
+        if cached_reply is not None:
+            reply = cached_reply
+            yield sse_event({'token': reply})
+        else:
+            reply = yield from stream_llm_reply()
+        if not reply.strip():
+            reply = CHAT_FALLBACK_REPLY
+            yield sse_event({'token': reply})
+        updated_history = history
+        try:
+            chat = ChatHistory(user_id=user_id, message=user_message, reply=reply, timestamp=datetime.utcnow())
+            db.session.add(chat)
+            updated_history = record_chat_exchange(user_id, history, chat)
+            db.session.commit()
+        except Exception as e:
+            print(f'Error storing chat history: {e}')
+            db.session.rollback()
+        yield sse_event({'history': history_for_widget(updated_history)}, event='done')
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/chatbot', methods=['POST'])
 @login_required
 def chatbot():
@@ -872,120 +1778,26 @@ def chatbot():
     # Initialize reply variable
     reply = "Sorry, I couldn't process your request."
     
+    # Precomputed context and recent exchanges: one read instead of a query per source
+    snapshot = chat_context_snapshot(current_user)
+    history = json.loads(snapshot.history or '[]')
+    
     try:
-        # Gather user context
-        reports = HealthReport.query.filter_by(user_id=current_user.id).order_by(HealthReport.timestamp.desc()).all()
-        latest_report = reports[0] if reports else None
-        
-        # Get diet plan from latest report
-        diet_chart = None
-        if latest_report and latest_report.diet_plan:
-            try:
-                diet_chart = json.loads(latest_report.diet_plan)
-            except Exception:
-                diet_chart = None
-        
-        # Get recent activity logs
-        activity_logs = ActivityLog.query.filter_by(user_id=current_user.id).order_by(ActivityLog.date.desc()).limit(5).all()
-        
-        # Build context string - keep it concise to avoid token limits
-        context_parts = []
-        context_parts.append(f"User: {current_user.username}, Age: {current_user.age if current_user.age else 'N/A'}, Goal: {current_user.goal if current_user.goal else 'N/A'}")
-        
-        if latest_report:
-            try:
-                extracted_values = json.loads(latest_report.extracted_values or '{}')
-                if extracted_values:
-                    # Only include key values, limit to 3-4 most important
-                    key_values = list(extracted_values.items())[:3]
-                    context_parts.append(f"Health Data: {', '.join([f'{k}={v}' for k, v in key_values])}")
-                
-                conditions = json.loads(latest_report.conditions or '[]')
-                if conditions:
-                    context_parts.append(f"Conditions: {', '.join(conditions[:2])}")  # Limit to 2 conditions
-            except Exception as e:
-                print(f"Error parsing report data: {e}")
-        
-        if activity_logs:
-            # Only include most recent activity
-            latest_log = activity_logs[0]
-            context_parts.append(f"Recent: {latest_log.steps} steps, {latest_log.exercise}")
-        
-        # Build context string
-        context = " | ".join(context_parts)
+        context = snapshot.context
         print(f"Context length: {len(context)} characters")
         
-        # Build chat history string - limit to last 3 exchanges
-        history_str = ""
-        if chat_history:
-            recent_history = chat_history[-3:]  # Only last 3 exchanges
-            history_str = " | ".join([f"Q: {c.message} A: {c.reply[:50]}..." for c in recent_history])
-        
-        # Compose concise prompt for LLM
-        system_prompt = "You are a health assistant. Answer based ONLY on the user's data provided. Keep responses under 100 words."
-        
-        user_prompt = f"Context: {context}\n\nQuestion: {user_message}\n\nAnswer based ONLY on the user's data above:"
-        
-        print(f"Calling OpenRouter API...")
-        
-        # Call DeepSeek LLM via OpenRouter
-        headers = {
-            'Authorization': f'Bearer {OPENROUTER_API_KEY}',
-            'Content-Type': 'application/json',
-        }
-        
-        data = {
-            'model': 'deepseek/deepseek-r1-0528:free',
-            'messages': [
-                {'role': 'system', 'content': system_prompt},
-                {'role': 'user', 'content': user_prompt}
-            ],
-            'max_tokens': 150  # Reduced from 512 to avoid hitting limits
-        }
-        
-        print(f"API Key: {OPENROUTER_API_KEY[:20]}...")
-        print(f"Request data: {json.dumps(data, indent=2)}")
-        
-        try:
-            response = requests.post('https://openrouter.ai/api/v1/chat/completions', 
-                                   headers=headers, json=data, timeout=30)
-            
-            print(f"OpenRouter response status: {response.status_code}")
-            
-            if response.status_code == 200:
-                response_data = response.json()
-                print(f"Response JSON: {json.dumps(response_data, indent=2)}")
-                
-                if 'choices' in response_data and len(response_data['choices']) > 0:
-                    reply = response_data['choices'][0]['message']['content']
-                    print(f"Generated reply: {reply[:100]}...")
-                    
-                    # Check if reply is empty or too short
-                    if not reply or len(reply.strip()) < 10:
-                        print("API returned empty/short response, using fallback")
-                        reply = f"Based on your data: {context}. You have a {current_user.goal} goal. Your latest health data shows good activity levels. For specific health questions, please consult your healthcare provider."
-                else:
-                    print("No choices in response")
-                    reply = 'Sorry, the AI response was incomplete. Please try again.'
-            else:
-                print(f'OpenRouter API error: {response.status_code}, {response.text}')
-                reply = f'API Error {response.status_code}: {response.text[:100]}'
-                
-        except requests.exceptions.Timeout:
-            print("Request timed out")
-            reply = 'Sorry, the request timed out. Please try again.'
-        except requests.exceptions.ConnectionError as e:
-            print(f"Connection error: {e}")
-            reply = 'Sorry, there was a connection error. Please check your internet connection.'
-        except requests.exceptions.RequestException as e:
-            print(f"Request error: {e}")
-            reply = f'Request error: {str(e)}'
-        except json.JSONDecodeError as e:
-            print(f"JSON decode error: {e}")
-            reply = 'Sorry, there was an error parsing the response.'
-        except Exception as e:
-            print(f"Unexpected error in API call: {e}")
-            reply = f'Unexpected error: {str(e)}'
+        # Repeated questions on unchanged data and conversation are answered from the cache
+        history_text = chat_history_text(history)
+        cached_reply = chat_cache.get(current_user.id, user_message, context, history_text)
+        if cached_reply is not None:
+            print("Answered from the chat response cache")
+            reply = cached_reply
+        else:
+            started = time.perf_counter()
+            reply, answered = ask_llm(context, user_message, current_user.goal, history)
+            if answered:
+                chat_cache.put(current_user.id, user_message, context, reply, time.perf_counter() - started,
+                               history_text)
             
     except Exception as e:
         print(f'Error in chatbot: {e}')
@@ -998,36 +1810,30 @@ def chatbot():
     # Fallback response if API fails completely
     if "error" in reply.lower():
         print("Using fallback response system")
-        if latest_report:
-            try:
-                extracted_values = json.loads(latest_report.extracted_values or '{}')
-                if extracted_values:
-                    reply = f"Based on your latest medical report from {latest_report.timestamp.strftime('%Y-%m-%d')}, I can see your health data. However, I'm experiencing technical difficulties with the AI service. Please try again later or contact support if the issue persists."
-                else:
-                    reply = "I can see your medical report but I'm experiencing technical difficulties. Please try again later."
-            except:
-                reply = "I'm experiencing technical difficulties. Please try again later."
+        if snapshot.latest_report_at:
+            if snapshot.latest_report_has_values:
+                reply = f"Based on your latest medical report from {snapshot.latest_report_at.strftime('%Y-%m-%d')}, I can see your health data. However, I'm experiencing technical difficulties with the AI service. Please try again later or contact support if the issue persists."
+            else:
+                reply = "I can see your medical report but I'm experiencing technical difficulties. Please try again later."
         else:
-            reply = "I'm experiencing technical difficulties. Please try again later."
+            reply = CHAT_FALLBACK_REPLY
     
     print(f"Final reply: {reply}")
     
-    # Store chat history
+    # Store chat history, and append it to the snapshot in the same transaction
     try:
-        chat = ChatHistory(user_id=current_user.id, message=user_message, reply=reply)
+        chat = ChatHistory(user_id=current_user.id, message=user_message, reply=reply, timestamp=datetime.utcnow())
         db.session.add(chat)
+        history = record_chat_exchange(current_user.id, history, chat)
         db.session.commit()
         print("Chat history stored successfully")
     except Exception as e:
         print(f'Error storing chat history: {e}')
+        db.session.rollback()
     
     # Return updated chat history
     try:
-        chat_history = ChatHistory.query.filter_by(user_id=current_user.id).order_by(ChatHistory.timestamp.desc()).limit(10).all()
-        chat_history = list(reversed(chat_history))
-        result = {
-            'history': [{'message': c.message, 'reply': c.reply, 'timestamp': c.timestamp.strftime('%H:%M')} for c in chat_history]
-        }
+        result = {'history': history_for_widget(history)}
         print(f"Returning {len(result['history'])} chat history entries")
         return jsonify(result)
     except Exception as e:
@@ -1057,6 +1863,252 @@ def upload_profile_image():
         flash('Invalid file type. Only JPG/PNG allowed.', 'danger')
     return redirect(url_for('dashboard'))
 
+@app.cli.command('backfill-lab-results')
+@click.option('--chunk-size', default=500, show_default=True, help='Reports converted per transaction.')
+def backfill_lab_results(chunk_size):
+    """Create LabResult rows for reports stored before dual-writes.
+
+    Converted reports are marked (lab_results_written), including those with
+    no numeric values, so a re-run only picks up what is left; the command
+    can be stopped at any time, as each chunk commits on its own.
+    """
+    last_id = 0
+    converted = 0
+    inserted = 0
+    while True:
+        reports = HealthReport.query.filter(HealthReport.id > last_id, HealthReport.lab_results_written.is_(False)) \
+            .order_by(HealthReport.id).limit(chunk_size).all()
+        if not reports:
+            break
+        # Written by a dual-write whose flag never got set (e.g. a restored dump): only mark them
+        present = {report_id for report_id, in db.session.query(LabResult.report_id)
+                   .filter(LabResult.report_id.in_([report.id for report in reports])).distinct()}
+        for report in reports:
+            if report.id not in present:
+                inserted += add_lab_results(report, json.loads(report.extracted_values or '{}'))
+            report.lab_results_written = True
+        db.session.commit()
+        last_id = reports[-1].id
+        converted += len(reports)
+        print(f"Backfilled {converted} reports ({inserted} lab results), up to report id {last_id}")
+    print(f"Done: {converted} reports, {inserted} lab results")
+
+@app.cli.command('repair-user-stats')
+@click.option('--chunk-size', default=1000, show_default=True, help='Users recomputed per transaction.')
+def repair_user_stats(chunk_size):
+    """Recompute every user's stats row and unread counter from the raw data.
+
+    Safe to run at any time (e.g. after backdated imports or manual edits);
+    users are processed in id order and each chunk commits on its own.
+    """
+    last_id = 0
+    repaired = 0
+    while True:
+        user_ids = [row.id for row in db.session.query(User.id).filter(User.id > last_id)
+                    .order_by(User.id).limit(chunk_size)]
+        if not user_ids:
+            break
+        compute_user_stats(user_ids)
+        compute_inbox_counters(user_ids)
+        db.session.commit()
+        last_id = user_ids[-1]
+        repaired += len(user_ids)
+        print(f"Repaired stats for {repaired} users, up to user id {last_id}")
+    print(f"Done: {repaired} users")
+
+@app.cli.command('import-patients')
+@click.argument('csv_file', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--chunk-size', default=500, show_default=True, help='Patients inserted per transaction.')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True,
+              help='Processes hashing passwords; 0 hashes in this process.')
+@click.option('--allow-doctors', is_flag=True, help="Also create accounts for rows with role 'doctor'.")
+def import_patients(csv_file, chunk_size, workers, allow_doctors):
+    """Register the patients in CSV_FILE (columns: username, password, age,
+    gender, height, weight, and optionally goal and role).
+
+    Rows with errors or an existing username are reported and skipped, as
+    are doctor rows unless --allow-doctors is given. Each
+    chunk commits on its own, so re-running the same file after a failure
+    only adds the patients that are still missing. Their Supabase rows wait
+    in the outbox for the web workers (or flask drain-supabase-outbox).
+    """
+    started = time.perf_counter()
+    imported = skipped = 0
+    with PasswordHasher(workers) as hasher:
+        try:
+            for patients, errors in read_patient_chunks(csv_file, chunk_size, allow_doctors):
+                for line, error in errors:
+                    print(f"Line {line}: {error}, skipped")
+                skipped += len(errors)
+                usernames = [patient['username'] for patient in patients]
+                existing = {name for name, in db.session.query(User.username).filter(User.username.in_(usernames))}
+                if existing:
+                    print(f"Already registered, skipped: {', '.join(sorted(existing))}")
+                    skipped += len(existing)
+                    patients = [patient for patient in patients if patient['username'] not in existing]
+                if not patients:
+                    continue
+                hashes = hasher.hash([patient['password'] for patient in patients])
+                for patient, password_hash, patient_id in zip(patients, hashes, generate_patient_ids(len(patients))):
+                    patient.update(password=password_hash, patient_id=patient_id)
+                db.session.execute(User.__table__.insert(), patients)
+                # One query for the new ids, which the Supabase rows are keyed by
+                ids = dict(db.session.query(User.username, User.id).filter(User.username.in_(usernames)))
+                created_at = datetime.now().isoformat()
+                for patient in patients:
+                    supabase_service.create_user({
+                        'id': ids[patient['username']],
+                        'username': patient['username'],
+                        'patient_id': patient['patient_id'],
+                        'age': patient['age'],
+                        'gender': patient['gender'],
+                        'height': patient['height'],
+                        'weight': patient['weight'],
+                        'role': patient['role'],
+                        'created_at': created_at
+                    })
+                db.session.commit()
+                imported += len(patients)
+                elapsed = time.perf_counter() - started
+                print(f"Imported {imported} patients ({imported / elapsed:.0f} rows/s)")
+        except ImportFileError as e:
+            raise click.ClickException(str(e))
+    elapsed = time.perf_counter() - started
+    print(f"Done: {imported} imported, {skipped} skipped in {elapsed:.1f}s ({imported / elapsed if elapsed else 0:.0f} rows/s)")
+
+@app.cli.command('ingest-reports')
+@click.argument('source', type=click.Path(exists=True))
+@click.option('--patient-id', help='Patient all reports in a SOURCE directory belong to.')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True,
+              help='Extraction processes; 0 extracts in this process.')
+@click.option('--batch-size', default=50, show_default=True, help='Reports committed per transaction.')
+@click.option('--ocr-language', default='eng', show_default=True)
+@click.option('--shared-with-doctor', is_flag=True, help='Share the ingested reports with doctors.')
+def ingest_reports(source, patient_id, workers, batch_size, ocr_language, shared_with_doctor):
+    """Ingest historical lab reports from SOURCE, a directory or manifest CSV.
+
+    A directory holds the reports of --patient-id, or one subdirectory per
+    patient ID; a manifest lists file, patient_id and optionally the date
+    each report was taken (see report_ingest.py). Extraction runs the same
+    code as web uploads, duplicates of already-processed files come from the
+    extraction cache, and every file is recorded as a ReportJob. A file whose
+    content a patient already has a finished job for is skipped, so after a
+    crash the command can be re-run and resumes where it stopped.
+    """
+    try:
+        plan = plan_manifest(source, allowed_file) if os.path.isfile(source) \
+            else plan_directory(source, allowed_file, patient_id)
+    except ManifestError as e:
+        raise click.ClickException(str(e))
+    user_ids = dict(db.session.query(User.patient_id, User.id)
+                    .filter(User.patient_id.in_({patient for _, patient, _ in plan})))
+    done = {(user_id, content_hash) for user_id, content_hash in db.session.query(ReportJob.user_id, ReportJob.content_hash)
+            .filter(ReportJob.user_id.in_(set(user_ids.values())), ReportJob.status == 'done')}
+    planned = []
+    skipped = 0
+    for path, patient, taken_at in plan:
+        if patient not in user_ids:
+            print(f"{path}: unknown patient ID {patient!r}, skipped")
+            skipped += 1
+            continue
+        key = (user_ids[patient], file_sha256(path))
+        if key in done:
+            skipped += 1
+            continue
+        done.add(key)  # The same file twice for one patient is ingested once
+        planned.append((path, user_ids[patient], taken_at, key[1]))
+    # Files processed before (by an upload or another patient's ingest) skip extraction
+    cached_hashes = {content_hash for content_hash, in db.session.query(ExtractionCache.content_hash).filter(
+        ExtractionCache.content_hash.in_({item[3] for item in planned}),
+        ExtractionCache.ocr_language == ocr_language, ExtractionCache.extractor_version == EXTRACTOR_VERSION)}
+    cached = [item for item in planned if item[3] in cached_hashes]
+    to_extract = [item for item in planned if item[3] not in cached_hashes]
+    total = len(planned)
+    print(f"{len(plan)} files: {skipped} skipped, {len(cached)} in the extraction cache, {len(to_extract)} to extract")
+
+    started = time.perf_counter()
+    batch = []
+    finished = failed = 0
+
+    def commit_batch():
+        new_reports = {}
+        for (path, user_id, taken_at, content_hash), result, error, from_cache in batch:
+            job = ReportJob(id=uuid.uuid4().hex, user_id=user_id, filename=os.path.basename(path), filepath=path,
+                            ocr_language=ocr_language, shared_with_doctor=shared_with_doctor,
+                            content_hash=content_hash, from_cache=from_cache, finished_at=datetime.utcnow())
+            if error is not None:
+                job.status, job.error = 'failed', str(error)
+            else:
+                text, values, conditions, page_timings = result
+                report = add_health_report(user_id, job.filename, text, values, conditions, shared_with_doctor, taken_at)
+                job.status, job.report_id, job.page_timings = 'done', report.id, json.dumps(page_timings)
+                new_reports[user_id] = new_reports.get(user_id, 0) + 1
+            db.session.add(job)
+        # Stats, diet plan and chatbot context once per patient per batch, not per report
+        for user_id, count in new_reports.items():
+            record_report(user_id, count)
+            user = User.query.get(user_id)
+            refresh_diet_plan(user)
+            refresh_chat_context(user)
+        db.session.commit()
+        for user_id in new_reports:
+            chat_cache.invalidate_user(user_id)
+        for (path, user_id, taken_at, content_hash), result, error, from_cache in batch:
+            if error is None and not from_cache:
+                store_extraction(content_hash, ocr_language, *result[:3])
+        print(f"Committed {finished} of {total} reports ({finished / (time.perf_counter() - started):.1f} files/s)")
+        batch.clear()
+
+    for item in cached:
+        extraction = cached_extraction(item[3], ocr_language)
+        if extraction is None:
+            to_extract.append(item)  # Evicted since planning
+            continue
+        batch.append((item, (*extraction, []), None, True))
+        finished += 1
+        print(f"[{finished}/{total}] {item[0]}: from the extraction cache")
+        if len(batch) >= batch_size:
+            commit_batch()
+    jobs = ((item, (item[0], ocr_language)) for item in to_extract)
+    for item, result, error in bounded_map(extract_report, jobs, workers):
+        path = item[0]
+        finished += 1
+        if error is not None:
+            failed += 1
+            print(f"[{finished}/{total}] {path}: failed: {error}")
+            batch.append((item, None, error, False))
+        else:
+            text, values, conditions, page_timings, seconds = result
+            ocr_pages = sum(1 for entry in page_timings if entry['method'] == 'ocr')
+            pages = f", {len(page_timings)} pages ({ocr_pages} OCR'd)" if page_timings else ''
+            print(f"[{finished}/{total}] {path}: {seconds:.2f}s, {len(values)} values{pages}")
+            batch.append((item, (text, values, conditions, page_timings), None, False))
+        if len(batch) >= batch_size:
+            commit_batch()
+    if batch:
+        commit_batch()
+    elapsed = time.perf_counter() - started
+    print(f"Done: {finished - failed} ingested, {failed} failed, {skipped} skipped in {elapsed:.1f}s")
+
+@app.cli.command('drain-supabase-outbox')
+def drain_supabase_outbox_command():
+    """Push every due outbox row to Supabase now (e.g. from a cron job)"""
+    total = 0
+    while True:
+        handled = drain_supabase_outbox()
+        if not handled:
+            break
+        total += handled
+    pending = SupabaseOutbox.query.filter_by(status='pending').count()
+    dead = SupabaseOutbox.query.filter_by(status='dead').count()
+    print(f"Done: {total} rows handled, {pending} pending (retrying later), {dead} dead")
+
+@app.cli.command('migrate-db')
+def migrate_db():
+    """Apply pending schema migrations (see migrations.py)."""
+    applied = migrate(db.engine)
+    print(f"Done: {len(applied)} migrations applied, schema at version {current_version(db.engine)}")
+
 @app.route('/')
 def home():
     return redirect(url_for('login'))
@@ -1064,4 +2116,7 @@ def home():
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+    if job_pool.workers <= 0:
+        reader_pool.warm_up_from_env()
+    outbox_drainer.start()
     app.run(debug=True) 
\ No newline at end of file
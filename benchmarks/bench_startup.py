@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cost of `import app` in a fresh interpreter (what every gunicorn
+worker, job process and test run pays), then what each heavy dependency
+costs when it is first used.
+
+Each measurement runs in its own subprocess so nothing is cached between
+rounds. RSS is the child's own peak resident set size.
+
+Run from the project root:
+    python benchmarks/bench_startup.py
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROUNDS = 3
+
+# Loaded on demand by the upload/OCR path, the dashboard trends and Supabase sync
+HEAVY_MODULES = ['easyocr', 'torch', 'pandas', 'numpy', 'pdfplumber', 'pytesseract',
+                 'pdf2image', 'supabase', 'postgrest']
+
+
+def run_child(code):
+    """Run code in a fresh interpreter; returns (wall seconds, stdout lines)"""
+    start = time.perf_counter()
+    # In-memory database: the benchmark must not create or touch healthapp.db
+    env = dict(os.environ, DATABASE_URL='sqlite://')
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env,
+                            capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return seconds, result.stdout.strip().splitlines()
+
+
+def best_of(code):
+    runs = [run_child(code) for _ in range(ROUNDS)]
+    return min(seconds for seconds, _ in runs), runs[-1][1]
+
+
+def main():
+    # ru_maxrss is in KiB on Linux
+    probe = ('import sys, resource, app\n'
+             'print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)\n'
+             f'print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))')
+    seconds, (rss, *loaded) = best_of(probe)
+    print(f'import app:     {seconds * 1000:8.1f} ms  {float(rss):7.1f} MB RSS')
+    print(f'heavy modules loaded at import: {"".join(loaded) or "none"}')
+    print()
+    print('First use (on top of import app):')
+    for name in HEAVY_MODULES:
+        code = ('import time, resource, app\n'
+                'start = time.perf_counter()\n'
+                f'import {name}\n'
+                'print(time.perf_counter() - start)\n'
+                'print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)')
+        try:
+            _, (first_use, rss) = best_of(code)
+        except RuntimeError as e:
+            print(f'  {name:12} not available ({e})')
+            continue
+        print(f'  {name:12} {float(first_use) * 1000:8.1f} ms  {float(rss):7.1f} MB RSS')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark: vectorized trend builder over LabResult rows vs. the
+per-key/per-report JSON loop the dashboard used before, for a user with
+500 reports and 53 parameters.
+
+Run from the project root:
+    python benchmarks/bench_trends.py
+
+test_trends.py checks that both produce the same series.
+"""
+
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from trends import build_trend_series
+
+REPORTS = 500
+PARAMETERS = 53
+ROUNDS = 5
+
+
+def legacy_trends(reports):
+    """The pre-vectorization dashboard code: a json.loads per key and report"""
+    all_keys = set()
+    for report in reports:
+        all_keys.update(report.values_dict.keys())
+    trend_keys = sorted(all_keys)
+    trend_data = {}
+    reversed_reports = list(reversed(reports))
+    for key in trend_keys:
+        values = []
+        last_value = None
+        for r in reversed_reports:
+            vals = json.loads(r.extracted_values or '{}')
+            if key in vals and vals[key] not in [None, '', 'null']:
+                last_value = float(vals[key])
+            values.append(last_value if last_value is not None else 0)
+        trend_data[key] = values
+    trend_labels = [r.timestamp.strftime('%Y-%m-%d') for r in reversed_reports]
+    comparison = {}
+    if len(reports) >= 2:
+        latest = json.loads(reports[0].extracted_values)
+        prev = json.loads(reports[1].extracted_values)
+        for key in set(latest.keys()).union(prev.keys()):
+            v_new = float(latest.get(key, prev.get(key, 0)))
+            v_old = float(prev.get(key, v_new))
+            if v_new > v_old:
+                status = 'worse'
+            elif v_new < v_old:
+                status = 'improved'
+            else:
+                status = 'no_change'
+            comparison[key] = {'latest': v_new, 'previous': v_old, 'status': status}
+    return trend_data, trend_labels, comparison
+
+
+def synthetic_reports(count=REPORTS, parameters=PARAMETERS, seed=7):
+    """Newest-first reports, each carrying a random subset of parameters"""
+    rng = random.Random(seed)
+    keys = [f'param_{i:02d}' for i in range(parameters)]
+    start = datetime(2020, 1, 1)
+    reports = []
+    for i in range(count):
+        values = {k: f'{rng.uniform(1, 300):.1f}' for k in rng.sample(keys, rng.randint(10, parameters))}
+        reports.append(SimpleNamespace(extracted_values=json.dumps(values), timestamp=start + timedelta(days=3 * i)))
+    return list(reversed(reports))
+
+
+def lab_result_rows(reports):
+    """The LabResult rows of newest-first reports: (report_id, measured_at, key, value), oldest first"""
+    rows = []
+    for report_id, report in enumerate(reversed(reports), start=1):
+        for key, value in sorted(json.loads(report.extracted_values).items()):
+            rows.append((report_id, report.timestamp, key, float(value)))
+    return rows
+
+
+def best_of(fn, make_input):
+    timings = []
+    for _ in range(ROUNDS):
+        reports = make_input()
+        start = time.perf_counter()
+        result = fn(reports)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def decoded_reports():
+    """The dashboard decodes values_dict for its template before building trends"""
+    reports = synthetic_reports()
+    for report in reports:
+        report.values_dict = json.loads(report.extracted_values)
+    return reports
+
+
+def main():
+    legacy_time, _ = best_of(legacy_trends, decoded_reports)
+    vector_time, _ = best_of(build_trend_series, lambda: lab_result_rows(synthetic_reports()))
+
+    print(f'User: {REPORTS} reports x {PARAMETERS} parameters')
+    print(f'Legacy per-key loop:       {legacy_time * 1000:.1f} ms')
+    print(f'Vectorized trend builder:  {vector_time * 1000:.1f} ms')
+    print(f'Speedup: {legacy_time / vector_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
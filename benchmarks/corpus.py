@@ -0,0 +1,234 @@
+"""
+Synthetic lab-report corpus for the benchmarks.
+
+Reports use the test names, reference ranges and units in
+medical_test_parameters.csv, with most values inside the normal range and
+some outside it, and come out as plain text, as PDFs with a text layer, as
+scanned (image-only) PDFs and as PNG images. Each report also carries the
+values parse_medical_values should find in it.
+
+create_synthetic_user() fills the app database with a patient who has N
+reports, M activity logs and messages from a doctor.
+
+Everything is seeded, so the same arguments produce the same corpus.
+"""
+
+import csv
+import json
+import os
+import random
+import re
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from lab_matcher import ABBREVIATIONS, parameter_key
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PARAMETERS_PATH = os.path.join(ROOT, 'medical_test_parameters.csv')
+
+FILLER = [
+    'Sample collected at the main laboratory. Report verified by pathologist.',
+    'Method: automated analyser. Values outside reference range are flagged.',
+    'Patient instructions: fasting for 10-12 hours prior to sample collection.',
+    'Please correlate clinically. This is an electronically generated report.',
+]
+LINES_PER_PAGE = 45
+_NUMBER = re.compile(r'\d[\d,]*(?:\.\d+)?')
+
+
+@dataclass
+class Parameter:
+    name: str
+    key: str
+    low: float
+    high: float
+    unit: str
+
+
+@dataclass
+class SyntheticReport:
+    pages: list  # Lines of text per page
+    values: dict = field(default_factory=dict)  # parameter key -> value string, as parsed
+
+    @property
+    def text(self):
+        return '\n'.join('\n'.join(lines) for lines in self.pages)
+
+
+def normal_range(text):
+    """(low, high) from a reference range like '13.5–17.5 g/dL (M), ...' or 'Less than 200 mg/dL'"""
+    numbers = [float(n.replace(',', '')) for n in _NUMBER.findall(text)]
+    if text.strip().lower().startswith('less than'):
+        return numbers[0] / 2, numbers[0]
+    return numbers[0], numbers[1]
+
+
+def load_parameters(path=PARAMETERS_PATH):
+    with open(path, encoding='utf-8') as handle:
+        rows = list(csv.DictReader(handle, skipinitialspace=True))
+    return [Parameter(row['Test Name'], parameter_key(row['Test Name']), *normal_range(row['Normal Range']), row['Unit'])
+            for row in rows]
+
+
+def names(parameter):
+    return [name.lower() for name in ABBREVIATIONS.get(parameter.name, [parameter.name])]
+
+
+def unambiguous(parameters):
+    """Parameters whose printed name contains no other test's name.
+
+    'MCHC : 34' also reads as MCH, and 'HbA1c' as Hb, so reports with those
+    tests could not be checked against what the parser finds; they are left
+    out of the corpus.
+    """
+    return [p for p in parameters
+            if not any(name in names(p)[0] for other in parameters if other is not p for name in names(other))]
+
+
+class LabReportGenerator:
+    def __init__(self, seed=42, parameters=None, abnormal_rate=0.2):
+        self.rng = random.Random(seed)
+        self.parameters = unambiguous(parameters or load_parameters())
+        self.abnormal_rate = abnormal_rate
+
+    def value(self, parameter):
+        """A value string for parameter: in range, or 40% beyond one end of it"""
+        low, high = parameter.low, parameter.high
+        if self.rng.random() < self.abnormal_rate:
+            low, high = (high, high * 1.4) if self.rng.random() < 0.5 else (low * 0.6, low)
+        value = self.rng.uniform(low, high)
+        decimals = 0 if parameter.high >= 1000 else 1 if parameter.high >= 10 else 2
+        return f'{value:.{decimals}f}'
+
+    def report(self, pages=1, tests=12):
+        """A report with `tests` results spread over `pages` pages of filler text"""
+        chosen = self.rng.sample(self.parameters, min(tests, len(self.parameters)))
+        report = SyntheticReport(pages=[])
+        for page in range(pages):
+            lines = [f'CITY DIAGNOSTICS - Page {page + 1} of {pages}']
+            results = chosen[page::pages]
+            for _ in range(LINES_PER_PAGE - len(results) - 1):
+                lines.append(self.rng.choice(FILLER))
+            for parameter in results:
+                name = ABBREVIATIONS.get(parameter.name, [parameter.name])[0]
+                value = self.value(parameter)
+                lines.insert(self.rng.randint(1, len(lines)), f'{name} : {value} {parameter.unit}')
+                report.values[parameter.key] = value
+            report.pages.append(lines)
+        return report
+
+
+def _pdf_text(line):
+    # Helvetica with WinAnsi encoding: Latin-1 covers the micro sign; escape PDF string syntax
+    line = line.replace('μ', 'µ').encode('latin-1', 'replace').decode('latin-1')
+    return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_text_pdf(path, report):
+    """A PDF with a real text layer, one page per report page"""
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None,
+               '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>']
+    kids = []
+    for lines in report.pages:
+        content = 'BT /F1 10 Tf 12 TL 50 760 Td ' + ' '.join(f'({_pdf_text(line)}) Tj T*' for line in lines) + ' ET'
+        content = content.encode('latin-1')
+        objects.append(f'<< /Length {len(content)} >>\nstream\n'.encode('latin-1') + content + b'\nendstream')
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {len(objects)} 0 R '
+                       f'/Resources << /Font << /F1 3 0 R >> >> >>')
+        kids.append(f'{len(objects)} 0 R')
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        body = body if isinstance(body, bytes) else body.encode('latin-1')
+        out += f'{number} 0 obj\n'.encode() + body + b'\nendobj\n'
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    out += b''.join(f'{offset:010d} 00000 n \n'.encode() for offset in offsets)
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    with open(path, 'wb') as handle:
+        handle.write(out)
+    return path
+
+
+def render_page(lines, width=1275, height=1650):
+    """One report page as a white 150 dpi letter-size image"""
+    from PIL import Image, ImageDraw, ImageFont
+    image = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    try:
+        font = ImageFont.load_default(size=24)
+    except TypeError:  # Pillow < 10.1 has a single bitmap size
+        font = ImageFont.load_default()
+    y = 80
+    for line in lines:
+        draw.text((80, y), line.replace('μ', 'u').replace('µ', 'u'), fill=0, font=font)
+        y += 32
+    return image
+
+
+def write_image(path, report):
+    """The first page of the report as a PNG, like a phone photo of a printout"""
+    render_page(report.pages[0]).save(path)
+    return path
+
+
+def write_scanned_pdf(path, report):
+    """A PDF of page images without a text layer, so every page needs OCR"""
+    images = [render_page(lines) for lines in report.pages]
+    images[0].save(path, 'PDF', resolution=150, save_all=True, append_images=images[1:])
+    return path
+
+
+def create_synthetic_user(app_module, name, reports=50, activity_logs=90, messages=30, seed=7):
+    """A patient with reports, daily activity logs and messages from a doctor; returns (patient, doctor) ids.
+
+    Rows (reports with their LabResult rows) are bulk-inserted with the
+    app's models. The stats, diet plan and
+    chat context rows are left for the app to build on first use, as for a
+    patient whose data predates them.
+    """
+    from werkzeug.security import generate_password_hash
+    db = app_module.db
+    generator = LabReportGenerator(seed=seed)
+    rng = generator.rng
+    password = generate_password_hash('benchmark')
+    with app_module.app.app_context():
+        patient = app_module.User(username=name, password=password, patient_id=f'BP{seed:06d}'[:16],
+                                  age=45, gender='female', height=162, weight=70)
+        doctor = app_module.User(username=f'{name}-doctor', password=password, patient_id=f'BD{seed:06d}'[:16],
+                                 role='doctor')
+        db.session.add_all([patient, doctor])
+        db.session.flush()
+        start = datetime(2023, 1, 1)
+        report_rows = []
+        for i in range(reports):
+            report = generator.report(tests=rng.randint(8, 20))
+            report_rows.append({'user_id': patient.id, 'filename': f'report_{i:04d}.pdf',
+                                'timestamp': start + timedelta(days=7 * i),
+                                'extracted_values': json.dumps(report.values), 'conditions': '[]',
+                                'diet_plan': '{}', 'shared_with_doctor': True, 'lab_results_written': True})
+        if report_rows:
+            db.session.execute(app_module.HealthReport.__table__.insert(), report_rows)
+            # The normalized lab results the app dual-writes with each report
+            report_ids = [row.id for row in db.session.query(app_module.HealthReport.id)
+                          .filter_by(user_id=patient.id).order_by(app_module.HealthReport.id)]
+            units = app_module.lab_test_parameters().units
+            lab_rows = [{'report_id': report_id, 'user_id': patient.id, 'parameter_key': key,
+                         'numeric_value': float(value), 'unit': units.get(key), 'measured_at': row['timestamp']}
+                        for report_id, row in zip(report_ids, report_rows)
+                        for key, value in json.loads(row['extracted_values']).items()]
+            db.session.execute(app_module.LabResult.__table__.insert(), lab_rows)
+        log_rows = [{'user_id': patient.id, 'date': (start + timedelta(days=i)).date(),
+                     'steps': rng.randint(2000, 14000), 'exercise': rng.choice(['walk', 'yoga', 'cycling', 'run']),
+                     'calories': rng.randint(100, 600)} for i in range(activity_logs)]
+        if log_rows:
+            db.session.execute(app_module.ActivityLog.__table__.insert(), log_rows)
+        message_rows = [{'sender_id': doctor.id, 'receiver_id': patient.id, 'message_type': 'comment',
+                         'content': f'Note {i}: keep up the diet plan', 'timestamp': start + timedelta(hours=6 * i),
+                         'is_read': rng.random() < 0.7} for i in range(messages)]
+        if message_rows:
+            db.session.execute(app_module.Message.__table__.insert(), message_rows)
+        db.session.commit()
+        return patient.id, doctor.id
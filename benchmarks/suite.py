@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: report parsing, file extraction and the dashboard and
+/messages routes, on a synthetic corpus (see corpus.py) in a throwaway
+SQLite database.
+
+Results are written as JSON (by default benchmarks/results/<commit>.json),
+so two commits can be compared:
+
+    python -m benchmarks.suite
+    git checkout other-branch && python -m benchmarks.suite
+    python -m benchmarks.suite --compare benchmarks/results/<a>.json benchmarks/results/<b>.json
+
+Run from the project root. Extraction of scanned PDFs and images needs an
+OCR engine (EasyOCR or Tesseract); without one those cases are recorded
+as skipped.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def measure(fn, rounds, warmup=1):
+    """Timings of fn() in milliseconds; warm-up calls are not counted"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'best_ms': round(min(timings), 3), 'median_ms': round(statistics.median(timings), 3), 'rounds': rounds}
+
+
+def quiet(fn):
+    """fn with its stdout discarded (parse_medical_values prints every report it parses)"""
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn()
+    return run
+
+
+def count_statements(app_module, fn):
+    """Number of SQL statements fn() executes"""
+    from sqlalchemy import event
+    statements = []
+
+    def count(*args):
+        statements.append(args[2])
+
+    with app_module.app.app_context():
+        engine = app_module.db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        fn()
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    return len(statements)
+
+
+def bench_parsing(app_module, generator, rounds):
+    results = {}
+    for pages in (1, 20):
+        report = generator.report(pages=pages, tests=min(40, len(generator.parameters)))
+        text = report.text
+        values, _ = quiet(lambda: app_module.parse_medical_values(text))()
+        assert values == report.values, 'parser disagrees with the synthetic report'
+        results[f'parse_medical_values[{pages}p]'] = {
+            **measure(quiet(lambda: app_module.parse_medical_values(text)), rounds),
+            'chars': len(text), 'values': len(values)}
+    return results
+
+
+def bench_extraction(app_module, corpus, generator, workdir, rounds):
+    report = generator.report(pages=3, tests=30)
+    files = {
+        'text_pdf': corpus.write_text_pdf(os.path.join(workdir, 'report.pdf'), report),
+        'scanned_pdf': corpus.write_scanned_pdf(os.path.join(workdir, 'scanned.pdf'), report),
+        'image': corpus.write_image(os.path.join(workdir, 'report.png'), report),
+    }
+    results = {}
+    for kind, path in files.items():
+        name = f'extract_text_from_file[{kind}]'
+        extract = quiet(lambda: app_module.extract_text_from_file(path))
+        try:
+            text = extract()
+        except Exception as e:
+            results[name] = {'skipped': f'{type(e).__name__}: {e}'[:200]}
+            continue
+        # OCR output is fuzzy; report how much of the ground truth it recovered
+        values, _ = quiet(lambda: app_module.parse_medical_values(text))()
+        expected = report.values if kind != 'image' else {
+            key: value for key, value in report.values.items()
+            if any(value in line for line in report.pages[0])}
+        found = sum(1 for key, value in expected.items() if values.get(key) == value)
+        # OCR runs take seconds; a couple of rounds is enough
+        results[name] = {**measure(extract, rounds if kind == 'text_pdf' else min(rounds, 2), warmup=0),
+                         'values_found': found, 'values_expected': len(expected)}
+    return results
+
+
+def bench_routes(app_module, corpus, reports, activity_logs, messages, rounds):
+    patient_id, _ = corpus.create_synthetic_user(app_module, 'bench-patient', reports, activity_logs, messages)
+    client = app_module.app.test_client()
+    response = client.post('/login', data={'username': 'bench-patient', 'password': 'benchmark'})
+    assert response.status_code == 302, 'login failed'
+    results = {}
+    for name, path in [('dashboard', '/dashboard'), ('messages', '/messages'),
+                       ('messages[box=received]', '/messages?box=received')]:
+        def get():
+            response = client.get(path)
+            assert response.status_code == 200, f'{path} returned {response.status_code}'
+        # The first request builds the stats, diet plan and unread counter rows
+        get()
+        results[f'GET {name}'] = {**measure(get, rounds, warmup=0),
+                                  'statements': count_statements(app_module, get)}
+    return results
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='nutripattern-bench-')
+    # The app reads its configuration at import: point it at a scratch database first
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault('NOTIFY_FEED_PATH', os.path.join(workdir, 'message-events.log'))
+    os.environ['REPORT_JOB_WORKERS'] = '0'
+    sys.path.insert(0, ROOT)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as app_module
+    from benchmarks import corpus
+
+    generator = corpus.LabReportGenerator(seed=args.seed)
+    results = {}
+    results.update(bench_parsing(app_module, generator, args.rounds))
+    results.update(bench_extraction(app_module, corpus, generator, workdir, args.rounds))
+    with contextlib.redirect_stdout(io.StringIO()):
+        results.update(bench_routes(app_module, corpus, args.reports, args.activity_logs, args.messages, args.rounds))
+    return {
+        'commit': git_commit(),
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {'reports': args.reports, 'activity_logs': args.activity_logs, 'messages': args.messages,
+                       'rounds': args.rounds, 'seed': args.seed},
+        'results': results,
+    }
+
+
+def print_results(run_data):
+    print(f"Commit {run_data['commit']}, {run_data['parameters']}")
+    for name, result in run_data['results'].items():
+        if 'skipped' in result:
+            print(f'  {name:40} skipped ({result["skipped"]})')
+            continue
+        extra = ', '.join(f'{key}={value}' for key, value in result.items() if not key.endswith('_ms') and key != 'rounds')
+        print(f"  {name:40} {result['median_ms']:10.2f} ms median {result['best_ms']:10.2f} ms best  {extra}")
+
+
+def compare(old_path, new_path):
+    with open(old_path) as handle:
+        old = json.load(handle)
+    with open(new_path) as handle:
+        new = json.load(handle)
+    print(f"{'benchmark':40} {old['commit']:>12} {new['commit']:>12}   change")
+    for name in sorted(set(old['results']) | set(new['results'])):
+        before = old['results'].get(name, {}).get('median_ms')
+        after = new['results'].get(name, {}).get('median_ms')
+        if before is None or after is None:
+            print(f"{name:40} {before or '-':>12} {after or '-':>12}")
+            continue
+        change = (after - before) / before * 100 if before else 0.0
+        print(f'{name:40} {before:10.2f}ms {after:10.2f}ms {change:+7.1f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reports', type=int, default=200, help='reports of the synthetic patient')
+    parser.add_argument('--activity-logs', type=int, default=365, help='activity logs of the synthetic patient')
+    parser.add_argument('--messages', type=int, default=200, help='messages the patient received')
+    parser.add_argument('--rounds', type=int, default=10, help='timed runs per benchmark')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='results file (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two results files and exit')
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+    run_data = run(args)
+    print_results(run_data)
+    output = args.output or os.path.join(RESULTS_DIR, f"{run_data['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as handle:
+        json.dump(run_data, handle, indent=2)
+    print(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
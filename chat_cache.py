@@ -0,0 +1,108 @@
+"""
+In-process cache of chatbot replies.
+
+Patients keep asking the same things ("what should I eat for breakfast",
+"is my sugar ok"). A reply is cached under the user, the normalized question
+and a hash of what else the prompt was built from: the context string
+(profile, latest report values and conditions, latest activity) and the
+recent exchanges quoted in it. Any write that changes the context changes the
+hash, so a new report or activity log can never be answered from a reply
+built on the old data, even when the write happened in another process; a
+question asked again later in the conversation misses too, as the model saw
+a different conversation. Writes in this process also drop the user's entries
+eagerly (invalidate_user) so stale replies don't wait for eviction.
+
+Entries expire after CHAT_CACHE_TTL_SECONDS (default 3600) and the least
+recently used are evicted beyond CHAT_CACHE_MAX_ENTRIES (default 1000).
+stats() reports hits, misses and the LLM time the hits saved.
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_NOT_WORD = re.compile(r'[^\w]+')
+
+
+def normalize_question(question):
+    """Case, punctuation and spacing don't change what is being asked"""
+    return ' '.join(_NOT_WORD.sub(' ', question.casefold()).split())
+
+
+def context_hash(context, history=''):
+    return hashlib.sha256(f'{context}\0{history}'.encode('utf-8')).hexdigest()[:16]
+
+
+class ChatResponseCache:
+    def __init__(self, max_entries=None, ttl=None, clock=time.monotonic):
+        self.max_entries = max_entries or int(os.getenv('CHAT_CACHE_MAX_ENTRIES', '1000'))
+        self.ttl = ttl if ttl is not None else float(os.getenv('CHAT_CACHE_TTL_SECONDS', '3600'))
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (reply, llm_seconds, stored_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def key(user_id, question, context, history=''):
+        return (user_id, normalize_question(question), context_hash(context, history))
+
+    def get(self, user_id, question, context, history=''):
+        """Cached reply for this question, context and prompt history text, or None"""
+        key = self.key(user_id, question, context, history)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._clock() - entry[2] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry[1]
+            return entry[0]
+
+    def put(self, user_id, question, context, reply, llm_seconds=0.0, history=''):
+        """Store a reply the LLM produced in llm_seconds"""
+        key = self.key(user_id, question, context, history)
+        with self._lock:
+            self._entries[key] = (reply, llm_seconds, self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id):
+        """Drop a user's replies after a write that changed their context"""
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == user_id]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'saved_seconds': round(self.saved_seconds, 3),
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+chat_cache = ChatResponseCache()
@@ -0,0 +1,63 @@
+# Gunicorn picks this file up automatically from the working directory.
+# Worker counts stay in the Procfile; this sets the worker class and hooks.
+
+import importlib
+import os
+
+# Gevent workers: a streamed chatbot reply or an open notification stream
+# waits cooperatively instead of holding one of a handful of threads for the
+# whole round trip. Patch here, before --preload imports the app, so socket,
+# ssl and threading (the job pool's management thread, the outbox drainer and
+# the notification listener) are gevent's from the start; test_gunicorn_config.py
+# runs the app under this configuration. psycopg2 talks to Postgres in C, so
+# psycogreen makes its waits yield to the hub too. SQLite calls still block the
+# worker while they run, which is fine for development only.
+# GUNICORN_WORKER_CLASS=gthread reverts to GUNICORN_THREADS threads per worker.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '100'))
+threads = int(os.getenv('GUNICORN_THREADS', '2'))
+if worker_class == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+    if os.getenv('DATABASE_URL', '').startswith('postgres'):
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+# Workers (and their report-job processes) write /metrics samples to files in
+# one directory, which /metrics adds up (see metrics.py). prometheus_client
+# reads this when --preload first imports it.
+metrics_dir = os.getenv('METRICS_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'metrics')
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', metrics_dir)
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+
+def on_starting(server):
+    # Counts from the previous run would otherwise be added to this one's
+    from metrics import clear_multiprocess_dir
+    clear_multiprocess_dir(os.environ['PROMETHEUS_MULTIPROC_DIR'])
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    # Start report-job processes per worker (not in the --preload master),
+    # and pick up uploads that were still queued when the server stopped.
+    # OCR models load inside the job processes, or here when uploads are
+    # processed inline (REPORT_JOB_WORKERS=0).
+    from app import job_pool, outbox_drainer, requeue_report_jobs
+    from ocr_readers import reader_pool
+    if job_pool.workers <= 0:
+        reader_pool.warm_up_from_env()
+    else:
+        job_pool.start()
+    requeue_report_jobs()
+    # Heavy libraries load on first use (see benchmarks/bench_startup.py); list any the
+    # worker should import before serving, e.g. WARM_UP_IMPORTS=pandas,pdfplumber
+    for name in os.getenv('WARM_UP_IMPORTS', '').split(','):
+        if name.strip():
+            importlib.import_module(name.strip())
+    # Each worker drains the Supabase outbox; claims keep them from overlapping
+    outbox_drainer.start()
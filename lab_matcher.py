@@ -0,0 +1,176 @@
+"""
+Compiled lab-value matcher for OCR'd medical reports.
+
+Every known test name and abbreviation is fused into one regular expression
+that is compiled once per process. A report is scanned a single time to find
+every name occurrence, and the value after each occurrence is read with a
+small anchored tail pattern, instead of running a separate full-text search
+for every name/pattern pair.
+"""
+
+import hashlib
+import re
+
+# Common abbreviations used on lab reports, keyed by the CSV 'Test Name'
+ABBREVIATIONS = {
+    'Hemoglobin (Hb)': ['Hemoglobin', 'Hb'],
+    'RBC Count': ['RBC Count', 'RBC'],
+    'WBC Count': ['WBC Count', 'WBC'],
+    'Platelet Count': ['Platelet Count', 'Platelets'],
+    'Hematocrit (HCT)': ['Hematocrit', 'HCT'],
+    'MCV': ['MCV'],
+    'MCH': ['MCH'],
+    'MCHC': ['MCHC'],
+    'RDW': ['RDW'],
+    'Neutrophils (%)': ['Neutrophils'],
+    'Lymphocytes (%)': ['Lymphocytes'],
+    'Monocytes (%)': ['Monocytes'],
+    'Eosinophils (%)': ['Eosinophils'],
+    'Basophils (%)': ['Basophils'],
+    'SGOT / AST': ['SGOT', 'AST'],
+    'SGPT / ALT': ['SGPT', 'ALT'],
+    'ALP': ['ALP'],
+    'Total Bilirubin': ['Total Bilirubin', 'Bilirubin'],
+    'Direct Bilirubin': ['Direct Bilirubin'],
+    'Albumin': ['Albumin'],
+    'Globulin': ['Globulin'],
+    'A/G Ratio': ['A/G Ratio'],
+    'Creatinine': ['Creatinine'],
+    'Urea / BUN': ['Urea', 'BUN'],
+    'Uric Acid': ['Uric Acid'],
+    'Sodium (Na+)': ['Sodium', 'Na+'],
+    'Potassium (K+)': ['Potassium', 'K+'],
+    'Chloride (Cl-)': ['Chloride', 'Cl-'],
+    'Fasting Blood Sugar (FBS)': ['Fasting Blood Sugar', 'FBS'],
+    'Postprandial Blood Sugar (PPBS)': ['Postprandial Blood Sugar', 'PPBS'],
+    'HbA1c': ['HbA1c'],
+    'Random Blood Sugar (RBS)': ['Random Blood Sugar', 'RBS'],
+    'Insulin (Fasting)': ['Insulin'],
+    'Total Cholesterol': ['Total Cholesterol', 'Cholesterol'],
+    'HDL': ['HDL'],
+    'LDL': ['LDL'],
+    'VLDL': ['VLDL'],
+    'Triglycerides': ['Triglycerides'],
+    'Cholesterol/HDL Ratio': ['Cholesterol/HDL Ratio'],
+    'Vitamin D (25-OH)': ['Vitamin D', '25-OH'],
+    'Vitamin B12': ['Vitamin B12', 'B12'],
+    'Calcium': ['Calcium'],
+    'Iron': ['Iron'],
+    'Ferritin': ['Ferritin'],
+    'TIBC': ['TIBC'],
+    'Magnesium': ['Magnesium'],
+    'Phosphorus': ['Phosphorus'],
+    'TSH': ['TSH'],
+    'T3': ['T3'],
+    'T4': ['T4'],
+    'Free T3': ['Free T3'],
+    'Free T4': ['Free T4'],
+}
+
+# What may follow a test name before its value, tried in this order
+VALUE_TAILS = (
+    re.compile(r"\s*[:=\-]?\s*([\d.]+)", re.IGNORECASE),
+    re.compile(r"\s*[a-zA-Z]*\s*[:=\-]?\s*([\d.]+)", re.IGNORECASE),
+)
+
+
+def parameter_key(test_name):
+    """Turn a CSV 'Test Name' into the key stored in extracted_values"""
+    return test_name.lower().replace(' ', '_').replace('(', '').replace(')', '').replace('/', '_').replace('%', 'percent').replace('-', '_').replace('.', '').replace(',', '').replace('__', '_')
+
+
+# Characters that re.IGNORECASE treats as equal to an ASCII letter but that
+# str.lower() does not fold (or folds to more than one character)
+_CASE_FIXES = str.maketrans({'\u0130': 'i', '\u0131': 'i', '\u017f': 's'})
+
+
+def _trie_pattern(words):
+    """Build a regex for a set of lowercase words, factored as a prefix trie"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def emit(node):
+        alternatives = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ''
+        body = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+        # Greedy optional tail: the longest word matching at a position wins
+        return f'(?:{body})?' if '' in node else body
+
+    return emit(trie)
+
+
+class LabValueMatcher:
+    def __init__(self, test_names, aliases=None):
+        aliases = ABBREVIATIONS if aliases is None else aliases
+        # (key, names) in CSV order; later parameters win on duplicate keys
+        self.parameters = []
+        self._names_by_lower = {}
+        for test_name in test_names:
+            param_names = list(aliases.get(test_name, [test_name]))
+            self.parameters.append((parameter_key(test_name), param_names))
+            for name in param_names:
+                same = self._names_by_lower.setdefault(name.lower(), [])
+                if name not in same:
+                    same.append(name)
+        # The scanner reports the longest name at each position; every other
+        # name matching there is a prefix of it and is recovered from here.
+        lowered = list(self._names_by_lower)
+        self._prefixes = {
+            word: [other for other in lowered if len(other) < len(word) and word.startswith(other)]
+            for word in lowered
+        }
+        self._scanner = re.compile(_trie_pattern(lowered))
+        # Changes whenever the parameter table, aliases or value patterns do,
+        # so results cached under an older matcher can be told apart
+        fingerprint = repr((self.parameters, [tail.pattern for tail in VALUE_TAILS]))
+        self.version = hashlib.sha256(fingerprint.encode()).hexdigest()[:16]
+
+    def find_names(self, text):
+        """Map each known name to the ascending start offsets where it occurs"""
+        if not text.isascii():
+            text = text.translate(_CASE_FIXES)
+        folded = text.lower()
+        positions = {}
+        pos = 0
+        while True:
+            m = self._scanner.search(folded, pos)
+            if not m:
+                break
+            start = m.start()
+            word = m.group()
+            for lw in [word] + self._prefixes[word]:
+                for name in self._names_by_lower[lw]:
+                    positions.setdefault(name, []).append(start)
+            # Restart one character later so overlapping names are found too
+            # (e.g. 'LDL' inside 'VLDL'), as a separate search per name would
+            pos = start + 1
+        return positions
+
+    def match(self, text):
+        """Return {parameter_key: value string} for every test found in text"""
+        positions = self.find_names(text)
+        values = {}
+        for key, param_names in self.parameters:
+            found = None
+            for name in param_names:
+                starts = positions.get(name)
+                if not starts:
+                    continue
+                for tail in VALUE_TAILS:
+                    for start in starts:
+                        m = tail.match(text, start + len(name))
+                        if m:
+                            found = m.group(1)
+                            break
+                    if found is not None:
+                        break
+                if found is not None:
+                    break
+            if found is not None:
+                values[key] = found
+        return values
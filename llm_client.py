@@ -0,0 +1,115 @@
+"""
+OpenRouter chat-completions client with a pooled keep-alive session.
+
+All chatbot calls in a worker share one requests.Session, so consecutive
+messages reuse open HTTPS connections instead of paying a TCP and TLS
+handshake each time. stream_chat() asks for a streamed completion and yields
+the reply's text as it arrives, parsed from OpenRouter's Server-Sent Events
+("data: {...}" lines, ": ..." keep-alive comments, "data: [DONE]" at the end).
+
+Under the gevent gunicorn worker (see gunicorn.conf.py) the socket reads are
+cooperative, so a slow LLM call waits without occupying a worker thread.
+Call latency (and a stream's time to first text) is recorded for /metrics.
+
+Configuration (environment variables):
+    OPENROUTER_API_KEY   API key
+    OPENROUTER_BASE_URL  API root (default https://openrouter.ai/api/v1)
+    OPENROUTER_MODEL     model id (default deepseek/deepseek-r1-0528:free)
+    LLM_POOL_SIZE        keep-alive connections per worker (default 10)
+    LLM_TIMEOUT          seconds to connect / between streamed chunks (default 30)
+"""
+
+import json
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+DEFAULT_BASE_URL = 'https://openrouter.ai/api/v1'
+DEFAULT_MODEL = 'deepseek/deepseek-r1-0528:free'
+
+
+class LLMError(Exception):
+    pass
+
+
+class OpenRouterClient:
+    def __init__(self, api_key=None, base_url=None, model=None, pool_size=None, timeout=None):
+        self.api_key = api_key if api_key is not None else os.getenv('OPENROUTER_API_KEY', '')
+        self.base_url = (base_url or os.getenv('OPENROUTER_BASE_URL', DEFAULT_BASE_URL)).rstrip('/')
+        self.model = model or os.getenv('OPENROUTER_MODEL', DEFAULT_MODEL)
+        self.timeout = timeout or float(os.getenv('LLM_TIMEOUT', '30'))
+        pool_size = pool_size or int(os.getenv('LLM_POOL_SIZE', '10'))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def payload(self, messages, max_tokens=150, stream=False):
+        data = {'model': self.model, 'messages': messages, 'max_tokens': max_tokens}
+        if stream:
+            data['stream'] = True
+        return data
+
+    def post(self, data, stream=False, timeout=None):
+        """POST a chat-completions request on the pooled session; returns the Response"""
+        headers = {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json',
+        }
+        if stream:
+            # Timed by stream_chat, which reads the body
+            return self.session.post(f'{self.base_url}/chat/completions', headers=headers, json=data,
+                                     stream=True, timeout=timeout or self.timeout)
+        with metrics.timed('llm', mode='complete') as labels:
+            response = self.session.post(f'{self.base_url}/chat/completions', headers=headers, json=data,
+                                         timeout=timeout or self.timeout)
+            if response.status_code != 200:
+                labels['outcome'] = 'error'
+        return response
+
+    def stream_chat(self, messages, max_tokens=150):
+        """Yield the reply text chunk by chunk as the model produces it.
+
+        Raises LLMError for an HTTP error status or an error event in the
+        stream, and requests exceptions for connection problems and timeouts.
+        """
+        with metrics.timed('llm', mode='stream'):
+            yield from self._stream_chat(messages, max_tokens)
+
+    def _stream_chat(self, messages, max_tokens):
+        started = time.perf_counter()
+        first = True
+        response = self.post(self.payload(messages, max_tokens, stream=True), stream=True)
+        with response:
+            if response.status_code != 200:
+                raise LLMError(f'API Error {response.status_code}: {response.text[:100]}')
+            # SSE is always UTF-8, whatever charset the Content-Type implies
+            response.encoding = 'utf-8'
+            done = False
+            for line in response.iter_lines(decode_unicode=True):
+                # Blank lines separate events; ':' lines are keep-alive comments.
+                # Read on past [DONE] to the end of the body so the connection
+                # goes back to the pool instead of being closed.
+                if done or not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    done = True
+                    continue
+                chunk = json.loads(data)
+                if 'error' in chunk:
+                    raise LLMError(f"API Error: {chunk['error'].get('message', chunk['error'])}")
+                for choice in chunk.get('choices', []):
+                    text = (choice.get('delta') or {}).get('content')
+                    if text:
+                        if first:
+                            metrics.LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
+                            first = False
+                        yield text
+
+
+llm_client = OpenRouterClient()
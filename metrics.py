@@ -0,0 +1,199 @@
+"""
+Where request time goes: route latency, SQL, report extraction, LLM and
+Supabase timings, exported in Prometheus text format on /metrics.
+
+app.py wraps every request in start_request() / finish_request() and hooks
+the SQLAlchemy engine with instrument_engine(), so each request counts its
+SQL statements and their time. Code that calls out (OCR, the LLM, Supabase)
+reports through observe() or timed(); inside a request the time is also
+added to that request's breakdown. A request slower than SLOW_REQUEST_MS
+logs its breakdown as a warning (logger "metrics"), e.g.
+
+    Slow request POST /upload -> 200 in 2350 ms: sql 14 queries 120 ms
+    (slowest 45 ms: UPDATE user_stats ...), extraction pdf_ocr 2105 ms, other 125 ms
+
+Gunicorn workers are separate processes, so gunicorn.conf.py points
+PROMETHEUS_MULTIPROC_DIR at a local directory before the app is imported:
+each worker and report-job process writes its samples to its own files
+there, and /metrics adds them up across all of them. Without it (flask run,
+tests) /metrics shows this process only.
+
+/metrics exposes route names and traffic, so outside debug mode it answers
+only with METRICS_TOKEN set and sent as a bearer token; without a token it
+is switched off (404).
+
+Configuration (environment variables):
+    METRICS_DIR                multiprocess directory under gunicorn
+                               (default instance/metrics)
+    METRICS_TOKEN              /metrics needs "Authorization: Bearer <token>"; required
+                               for /metrics to be served outside debug mode
+    SLOW_REQUEST_MS            breakdown threshold in milliseconds (default 1000, 0 = off)
+    SLOW_REQUEST_SAMPLE_RATE   fraction of slow requests logged (default 1)
+"""
+
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_MS', '1000')) / 1000
+SLOW_REQUEST_SAMPLE_RATE = float(os.getenv('SLOW_REQUEST_SAMPLE_RATE', '1'))
+
+REQUEST_SECONDS = Histogram(
+    'nutripattern_http_request_duration_seconds', 'Time to build the response, by route',
+    ['route', 'method', 'status'])
+SLOW_REQUESTS = Counter(
+    'nutripattern_slow_requests_total', 'Requests slower than SLOW_REQUEST_MS', ['route', 'method'])
+REQUEST_QUERIES = Histogram(
+    'nutripattern_db_queries_per_request', 'SQL statements per request', ['route'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, float('inf')))
+REQUEST_DB_SECONDS = Histogram(
+    'nutripattern_db_seconds_per_request', 'Time spent in SQL statements per request', ['route'])
+QUERY_SECONDS = Histogram(
+    'nutripattern_db_query_duration_seconds', 'Time per SQL statement, requests and background work',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, float('inf')))
+HISTOGRAMS = {
+    'extraction': Histogram(
+        'nutripattern_extraction_seconds', 'Report extraction time by stage (pdf_text, pdf_ocr, image_ocr, parse)',
+        ['stage'], buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float('inf'))),
+    'llm': Histogram(
+        'nutripattern_llm_request_seconds', 'LLM calls, whole reply (complete) or whole stream (stream)',
+        ['mode', 'outcome'], buckets=(0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120, float('inf'))),
+    'supabase': Histogram(
+        'nutripattern_supabase_request_seconds', 'Supabase calls by operation and table',
+        ['operation', 'table', 'outcome']),
+}
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    'nutripattern_llm_first_token_seconds', 'Time until a streamed LLM reply produces its first text',
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 15, 30, float('inf')))
+
+
+class RequestSample:
+    """Running totals for the request being served"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slowest_query = (0.0, '')
+        self.timings = {}  # 'llm complete' -> seconds
+
+    def add_query(self, seconds, statement):
+        self.queries += 1
+        self.db_seconds += seconds
+        if seconds > self.slowest_query[0]:
+            self.slowest_query = (seconds, statement)
+
+    def breakdown(self, seconds):
+        parts = [f'sql {self.queries} queries {self.db_seconds * 1000:.0f} ms']
+        if self.slowest_query[1]:
+            statement = ' '.join(self.slowest_query[1].split())
+            parts[0] += f' (slowest {self.slowest_query[0] * 1000:.0f} ms: {statement[:120]})'
+        parts.extend(f'{name} {spent * 1000:.0f} ms' for name, spent in
+                     sorted(self.timings.items(), key=lambda item: -item[1]))
+        other = seconds - self.db_seconds - sum(self.timings.values())
+        parts.append(f'other {max(other, 0.0) * 1000:.0f} ms')
+        return ', '.join(parts)
+
+
+_current = ContextVar('request_sample', default=None)
+
+
+def start_request():
+    _current.set(RequestSample())
+
+
+def finish_request(method, route, status):
+    """Record the current request; logs its breakdown when it was slow"""
+    sample = _current.get()
+    if sample is None:
+        return
+    _current.set(None)
+    seconds = time.perf_counter() - sample.started
+    REQUEST_SECONDS.labels(route=route, method=method, status=str(status)).observe(seconds)
+    REQUEST_QUERIES.labels(route=route).observe(sample.queries)
+    REQUEST_DB_SECONDS.labels(route=route).observe(sample.db_seconds)
+    if SLOW_REQUEST_SECONDS and seconds >= SLOW_REQUEST_SECONDS:
+        SLOW_REQUESTS.labels(route=route, method=method).inc()
+        if random.random() < SLOW_REQUEST_SAMPLE_RATE:
+            logger.warning('Slow request %s %s -> %s in %.0f ms: %s',
+                           method, route, status, seconds * 1000, sample.breakdown(seconds))
+
+
+def observe(kind, seconds, **labels):
+    """Record seconds in the 'extraction', 'llm' or 'supabase' histogram and the request's breakdown"""
+    HISTOGRAMS[kind].labels(**labels).observe(seconds)
+    sample = _current.get()
+    if sample is not None:
+        name = ' '.join([kind] + [value for label, value in labels.items() if label != 'outcome'])
+        sample.timings[name] = sample.timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def timed(kind, **labels):
+    """Time the block into an 'llm' or 'supabase' histogram.
+
+    Yields the labels: outcome is 'ok', or 'error' if the block raises, and
+    the block can set it itself (e.g. for an error status).
+    """
+    labels.setdefault('outcome', 'ok')
+    started = time.perf_counter()
+    try:
+        yield labels
+    except Exception:
+        labels['outcome'] = 'error'
+        raise
+    finally:
+        observe(kind, time.perf_counter() - started, **labels)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['metrics_started'].pop()
+    QUERY_SECONDS.observe(seconds)
+    sample = _current.get()
+    if sample is not None:
+        sample.add_query(seconds, statement)
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    started = exception_context.connection.info.get('metrics_started') if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine):
+    """Count and time every SQL statement engine runs"""
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+
+
+def render():
+    """(body, content type) of the Prometheus text exposition, across processes when multiprocess"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def clear_multiprocess_dir(path):
+    """Remove the sample files of a previous run (gunicorn calls this on start)"""
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.endswith('.db'):
+            os.remove(os.path.join(path, name))
@@ -0,0 +1,98 @@
+"""
+Versioned schema migrations.
+
+db.create_all() creates missing tables but never changes existing ones, so
+an index or column added to a model only reaches databases created after
+the change. Schema changes for existing databases are listed here instead,
+as numbered steps of plain SQL that work on SQLite and Postgres. The
+schema_migrations table records which steps a database has had; migrate()
+applies the rest in order, each in its own transaction.
+
+New models and indexes are still declared on the models (so a fresh database
+gets them from create_all) and added here as well, with IF NOT EXISTS so the
+step is a no-op where create_all already did the work. Column additions
+have no portable IF NOT EXISTS, so add_column() builds a step that checks
+first. Never edit a step that has shipped; add a new one.
+
+Run with `flask migrate-db`; app startup applies pending steps too.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, exc, inspect, select
+
+metadata = MetaData()
+
+schema_migrations = Table(
+    'schema_migrations', metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def add_column(table, column, definition):
+    """Step adding table.column unless it exists (create_all made it on a fresh database)"""
+    def step(connection):
+        if column not in {c['name'] for c in inspect(connection).get_columns(table)}:
+            connection.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return step
+
+
+MIGRATIONS = [
+    (1, 'Composite indexes for the per-user list, count and unread queries', [
+        # Newest-first pages and latest-row lookups; id breaks timestamp ties in keyset pages
+        'CREATE INDEX IF NOT EXISTS ix_health_report_user_time ON health_report (user_id, timestamp, id)',
+        'CREATE INDEX IF NOT EXISTS ix_activity_log_user_date ON activity_log (user_id, date, id)',
+        'CREATE INDEX IF NOT EXISTS ix_chat_history_user_time ON chat_history (user_id, timestamp, id)',
+        # Unread count on the dashboard, inbox and sent lists
+        'CREATE INDEX IF NOT EXISTS ix_message_receiver_read ON message (receiver_id, is_read)',
+        'CREATE INDEX IF NOT EXISTS ix_message_receiver_time ON message (receiver_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS ix_message_sender_time ON message (sender_id, timestamp)',
+        # Pending uploads on the dashboard, queued jobs on restart
+        'CREATE INDEX IF NOT EXISTS ix_report_job_user_status ON report_job (user_id, status)',
+        'CREATE INDEX IF NOT EXISTS ix_report_job_status ON report_job (status)',
+    ]),
+    (2, 'Claim count for report jobs, so interrupted jobs are retried a limited number of times', [
+        add_column('report_job', 'attempts', 'INTEGER NOT NULL DEFAULT 0'),
+    ]),
+    (3, 'Mark reports whose LabResult rows exist, so backfill-lab-results skips them', [
+        add_column('health_report', 'lab_results_written', 'BOOLEAN NOT NULL DEFAULT false'),
+        'UPDATE health_report SET lab_results_written = true WHERE id IN (SELECT report_id FROM lab_result)',
+    ]),
+]
+
+
+def applied_versions(connection):
+    return {row.version for row in connection.execute(select(schema_migrations.c.version))}
+
+
+def migrate(engine, migrations=MIGRATIONS):
+    """Apply pending migrations in version order; returns the versions applied"""
+    metadata.create_all(engine)
+    with engine.connect() as connection:
+        done = applied_versions(connection)
+    applied = []
+    for version, name, statements in sorted(migrations, key=lambda m: m[0]):
+        if version in done:
+            continue
+        try:
+            with engine.begin() as connection:
+                for statement in statements:
+                    if callable(statement):
+                        statement(connection)
+                    else:
+                        connection.exec_driver_sql(statement)
+                connection.execute(schema_migrations.insert().values(
+                    version=version, name=name, applied_at=datetime.utcnow()))
+        except exc.IntegrityError:
+            # Another process (worker, job process) applied it first
+            continue
+        print(f"Applied migration {version}: {name}")
+        applied.append(version)
+    return applied
+
+
+def current_version(engine):
+    with engine.connect() as connection:
+        return max(applied_versions(connection), default=0)
@@ -0,0 +1,288 @@
+"""
+Push notifications for new messages.
+
+Instead of every page view counting unread messages and every client
+re-fetching the inbox, writes publish a small event ({"user_id", "type",
+"message_id", "unread"}) once per new or read message, and each web worker
+relays the events for the users connected to it over Server-Sent Events
+(/notifications/stream).
+
+Within a worker, NotificationHub keeps one bounded queue per open stream.
+Across workers (and processes that only write, like CLI commands) events go
+through a local feed that every worker's listener thread follows:
+
+    PostgresFeed  LISTEN/NOTIFY on the app database, used with Postgres
+    FileFeed      an append-only file of JSON lines, used with SQLite; all
+                  workers must share the host (which SQLite needs anyway)
+
+A hub starts following the feed when its first stream subscribes, and
+subscribe() returns only once the listener is in place, so an event
+published right after a stream opens is never lost to the listener's
+start-up.
+
+Delivery is best-effort: a stream that reconnects fetches what it missed
+from /messages?since=, and the unread count in each event comes from the
+maintained counter in the database, so a dropped event never leaves the
+badge wrong for longer than the next one.
+
+Configuration (environment variables):
+    NOTIFY_BACKEND         'postgres' or 'file' (default: postgres for a
+                           Postgres DATABASE_URL, file otherwise)
+    NOTIFY_FEED_PATH       file feed location (default: message-events.log
+                           in the Flask instance folder)
+    NOTIFY_POLL_INTERVAL   seconds between file feed checks (default 0.5)
+    NOTIFY_KEEPALIVE       seconds between keep-alive comments on an idle
+                           stream (default 20)
+    NOTIFY_STREAM_SECONDS  how long a stream stays open before the browser
+                           reconnects (default 300)
+"""
+
+import json
+import os
+import queue
+import re
+import select
+import threading
+
+CHANNEL = 'message_events'
+FILE_FEED_MAX_BYTES = 1024 * 1024
+LISTEN_WAIT_SECONDS = 5  # How long a new stream waits for the listener to start
+
+
+class FileFeed:
+    """Events appended as JSON lines to a file that every worker tails.
+
+    Each event is a single O_APPEND write, so lines from concurrent writers
+    never interleave. Past max_bytes a writer rotates the file to <path>.1;
+    readers finish the old file before moving on to the new one.
+    """
+
+    def __init__(self, path, poll_interval=None, max_bytes=FILE_FEED_MAX_BYTES):
+        self.path = path
+        self.poll_interval = poll_interval or float(os.getenv('NOTIFY_POLL_INTERVAL', '0.5'))
+        self.max_bytes = max_bytes
+
+    def publish(self, event):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        line = (json.dumps(event) + '\n').encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, line)
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        if size > self.max_bytes:
+            try:
+                os.replace(self.path, self.path + '.1')
+            except OSError:
+                pass  # Another writer rotated it first, or the platform refuses while it is open
+
+    def _open(self, at_end):
+        try:
+            handle = open(self.path, 'rb')
+        except FileNotFoundError:
+            return None
+        if at_end:
+            handle.seek(0, os.SEEK_END)
+        return handle
+
+    @staticmethod
+    def _read(handle, pending, dispatch):
+        """Dispatch the complete lines written since the last read; returns the partial rest"""
+        *lines, pending = (pending + handle.read()).split(b'\n')
+        for line in lines:
+            if line.strip():
+                dispatch(json.loads(line))
+        return pending
+
+    def listen(self, dispatch, stop, ready=None):
+        """Call dispatch(event) for every event published after ready is set, until stop is set"""
+        handle = self._open(at_end=True)
+        pending = b''
+        if ready is not None:
+            # At the end of the file, or reading a file created later from its start
+            ready.set()
+        try:
+            while not stop.is_set():
+                if handle is None:
+                    handle = self._open(at_end=False)
+                if handle is not None:
+                    pending = self._read(handle, pending, dispatch)
+                    try:
+                        rotated = os.stat(self.path).st_ino != os.fstat(handle.fileno()).st_ino
+                    except FileNotFoundError:
+                        rotated = True
+                    if rotated:
+                        # Finish the old file, then follow the new one from its start
+                        self._read(handle, pending, dispatch)
+                        handle.close()
+                        handle, pending = self._open(at_end=False), b''
+                        continue
+                stop.wait(self.poll_interval)
+        finally:
+            if handle is not None:
+                handle.close()
+
+
+class PostgresFeed:
+    """Events sent with NOTIFY and received with LISTEN on the app database"""
+
+    def __init__(self, database_url, poll_interval=5.0):
+        # libpq takes the URL as-is, minus SQLAlchemy's driver suffix
+        self.dsn = re.sub(r'^postgresql\+\w+://', 'postgresql://', database_url)
+        self.poll_interval = poll_interval
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        import psycopg2
+        connection = psycopg2.connect(self.dsn)
+        connection.autocommit = True
+        return connection
+
+    def publish(self, event):
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._connection is None or self._connection.closed:
+                        self._connection = self._connect()
+                    with self._connection.cursor() as cursor:
+                        cursor.execute('SELECT pg_notify(%s, %s)', (CHANNEL, json.dumps(event)))
+                    return
+                except Exception:
+                    # The connection went away (e.g. a server restart); retry once on a new one
+                    self._connection = None
+                    if attempt == 2:
+                        raise
+
+    def listen(self, dispatch, stop, ready=None):
+        connection = self._connect()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            if ready is not None:
+                ready.set()
+            while not stop.is_set():
+                if select.select([connection], [], [], self.poll_interval) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    dispatch(json.loads(connection.notifies.pop(0).payload))
+        finally:
+            connection.close()
+
+
+def feed_from_env(database_url, default_path):
+    backend = os.getenv('NOTIFY_BACKEND') or ('postgres' if database_url.startswith('postgresql') else 'file')
+    if backend == 'postgres':
+        return PostgresFeed(database_url)
+    return FileFeed(os.getenv('NOTIFY_FEED_PATH') or default_path)
+
+
+class Subscription:
+    """Events for one user, for one open stream"""
+
+    def __init__(self, hub, user_id, maxsize):
+        self.hub = hub
+        self.user_id = user_id
+        self._queue = queue.Queue(maxsize)
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # A stalled client: drop its oldest event rather than block the listener
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._queue.put_nowait(event)
+
+    def get(self, timeout=None):
+        """Next event, or None if none arrived within timeout seconds"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class NotificationHub:
+    """Fans events from the feed out to the streams open in this process"""
+
+    def __init__(self, feed, queue_size=100, keepalive=None, stream_seconds=None):
+        self.feed = feed
+        self.queue_size = queue_size
+        self.keepalive = keepalive or float(os.getenv('NOTIFY_KEEPALIVE', '20'))
+        self.stream_seconds = stream_seconds or float(os.getenv('NOTIFY_STREAM_SECONDS', '300'))
+        self._subscribers = {}  # user_id -> set of Subscription
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._listening = threading.Event()
+        self._thread = None
+        self.published = 0
+        self.delivered = 0
+
+    def publish(self, user_id, event_type, **data):
+        """Send an event to every stream of user_id, in any worker"""
+        try:
+            self.feed.publish({'user_id': user_id, 'type': event_type, **data})
+            self.published += 1
+        except Exception as e:
+            # The write it reports is already committed; the client catches up on reconnect
+            print(f"Notification publish failed: {e}")
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+            # Only processes that serve streams follow the feed
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._listening.clear()
+                self._thread = threading.Thread(target=self._run, name='message-notifications', daemon=True)
+                self._thread.start()
+        # Events published from here on must reach this stream
+        if not self._listening.wait(LISTEN_WAIT_SECONDS):
+            print("Notification listener not ready; the stream may miss early events")
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            streams = self._subscribers.get(subscription.user_id)
+            if streams is not None:
+                streams.discard(subscription)
+                if not streams:
+                    del self._subscribers[subscription.user_id]
+
+    def dispatch(self, event):
+        with self._lock:
+            streams = list(self._subscribers.get(event.get('user_id'), ()))
+        for subscription in streams:
+            subscription.put(event)
+        self.delivered += len(streams)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.feed.listen(self.dispatch, self._stop, self._listening)
+            except Exception as e:
+                self._listening.clear()
+                print(f"Notification listener failed, restarting: {e}")
+                self._stop.wait(1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users': len(self._subscribers),
+                'streams': sum(len(streams) for streams in self._subscribers.values()),
+                'published': self.published,
+                'delivered': self.delivered,
+            }
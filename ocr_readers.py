@@ -0,0 +1,93 @@
+"""
+Per-process pool of EasyOCR readers, keyed by language.
+
+Building an easyocr.Reader loads the detection and recognition models from
+disk, which takes seconds. Readers are created once per worker process (on
+first use, or up front at worker start) and reused for every image upload.
+easyocr (and the torch it pulls in) is only imported when the first reader
+is built, so processes that never OCR an image don't pay for it.
+
+Configuration (environment variables):
+    OCR_READER_INIT    'lazy' (default) loads a language on first use;
+                       'eager' loads OCR_PRELOAD_LANGS when the worker starts
+    OCR_PRELOAD_LANGS  comma-separated languages to pre-warm, e.g. 'eng,hin'
+"""
+
+import os
+import threading
+
+# The upload form sends Tesseract codes; EasyOCR uses ISO 639-1 codes
+EASYOCR_LANGS = {
+    'eng': 'en',
+    'hin': 'hi',
+    'tel': 'te',
+}
+
+
+def easyocr_lang(lang):
+    """Map a Tesseract language code to the EasyOCR equivalent"""
+    return EASYOCR_LANGS.get(lang, lang)
+
+
+class EasyOCRReaderPool:
+    def __init__(self):
+        self._readers = {}
+        self._unsupported = {}
+        self._locks = {}
+        self._registry_lock = threading.Lock()
+
+    def _lock_for(self, code):
+        with self._registry_lock:
+            return self._locks.setdefault(code, threading.Lock())
+
+    def get(self, lang):
+        """Return the shared reader for a language, creating it if needed"""
+        code = easyocr_lang(lang)
+        reader = self._readers.get(code)
+        if reader is not None:
+            return reader
+        if code in self._unsupported:
+            raise ValueError(self._unsupported[code])
+        # Only one thread loads a given language; others wait for it
+        with self._lock_for(code):
+            reader = self._readers.get(code)
+            if reader is None:
+                import easyocr
+                try:
+                    reader = easyocr.Reader([code])
+                except ValueError as e:
+                    # Unsupported language: remember so we fail fast next time
+                    self._unsupported[code] = str(e)
+                    raise
+                self._readers[code] = reader
+        return reader
+
+    def readtext(self, lang, image, **kwargs):
+        """Run OCR with the pooled reader for lang (serialised per reader)"""
+        reader = self.get(lang)
+        with self._lock_for(easyocr_lang(lang)):
+            return reader.readtext(image, **kwargs)
+
+    def warm_up(self, langs):
+        """Load readers for langs and run a tiny inference to initialise them"""
+        import numpy as np
+        blank = np.full((32, 32, 3), 255, dtype=np.uint8)
+        for lang in langs:
+            try:
+                self.readtext(lang, blank, detail=0)
+                print(f"OCR reader ready for '{lang}'")
+            except Exception as e:
+                print(f"OCR reader warm-up failed for '{lang}': {e}")
+
+    def warm_up_from_env(self):
+        """Pre-warm OCR_PRELOAD_LANGS when OCR_READER_INIT=eager"""
+        if os.getenv('OCR_READER_INIT', 'lazy').lower() != 'eager':
+            return
+        langs = [l.strip() for l in os.getenv('OCR_PRELOAD_LANGS', 'eng').split(',') if l.strip()]
+        self.warm_up(langs)
+
+    def loaded_languages(self):
+        return sorted(self._readers)
+
+
+reader_pool = EasyOCRReaderPool()
@@ -0,0 +1,207 @@
+"""
+Transactional outbox for syncing rows to Supabase.
+
+Rows bound for Supabase are written to a local outbox table in the same
+transaction as the data they mirror, so a signup or report is never stored
+without its sync record (and a request never waits on the remote call). A
+background drainer in each web worker claims due rows, pushes them to
+Supabase as one bulk upsert per table, and retries failures with
+exponential backoff. Pushed rows stay as 'sent' for OUTBOX_SENT_RETENTION
+hours, a record of what went out, and are then deleted so the table only
+holds recent traffic and rows still waiting.
+
+Every row carries an idempotency key and its remote primary key is the local
+one, so pushes are upserts that ignore duplicates: a batch replayed after a
+crash or an expired claim is a no-op on the remote side.
+
+Configuration (environment variables):
+    OUTBOX_DRAIN_INTERVAL  seconds between drains when idle (default 5)
+    OUTBOX_BATCH_SIZE      rows claimed per drain (default 100)
+    OUTBOX_MAX_ATTEMPTS    attempts before a row is marked dead (default 10)
+    OUTBOX_SENT_RETENTION  hours sent rows are kept before deletion
+                           (default 24, 0 = delete once pushed)
+"""
+
+import json
+import os
+import random
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text
+from sqlalchemy.orm import declared_attr
+
+# Parents before children, so a report's user exists remotely before the report
+TABLE_ORDER = ('users', 'health_reports', 'messages')
+
+BACKOFF_BASE_SECONDS = 10
+BACKOFF_MAX_SECONDS = 3600
+CLAIM_SECONDS = 120
+
+
+class OutboxMixin:
+    id = Column(Integer, primary_key=True)
+    table_name = Column(String(40), nullable=False)
+    payload = Column(Text, nullable=False)  # JSON row for the remote table
+    idempotency_key = Column(String(80), unique=True, nullable=False)
+    status = Column(String(10), default='pending', nullable=False)  # pending, sent, dead
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    claimed_by = Column(String(32))  # Drain that holds the row until next_attempt_at
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+
+    @declared_attr
+    def __table_args__(cls):
+        return (Index(f'ix_{cls.__tablename__}_due', 'status', 'next_attempt_at'),)
+
+
+def enqueue(session, model, table_name, payload, idempotency_key):
+    """Add an outbox row to the caller's transaction (the caller commits)"""
+    row = model(table_name=table_name, payload=json.dumps(payload, default=str),
+                idempotency_key=idempotency_key, next_attempt_at=datetime.utcnow())
+    session.add(row)
+    return row
+
+
+def push_rows(client, table_name, rows):
+    """Bulk upsert rows into a Supabase table, ignoring ones already there"""
+    from postgrest.types import ReturnMethod
+    client.table(table_name).upsert(rows, on_conflict='id', ignore_duplicates=True,
+                                    returning=ReturnMethod.minimal).execute()
+
+
+def backoff_seconds(attempts):
+    """Exponential backoff with jitter: ~10s, 20s, 40s ... capped at an hour"""
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _mark_failed(row, error, max_attempts):
+    row.attempts += 1
+    row.last_error = str(error)[:500]
+    if row.attempts >= max_attempts:
+        row.status = 'dead'
+    else:
+        row.next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff_seconds(row.attempts))
+
+
+def drain(session, model, push, batch_size=None, max_attempts=None):
+    """Claim one batch of due outbox rows and push them; returns the rows handled.
+
+    push(table_name, rows) sends one bulk insert. When a batch is rejected
+    by the API (e.g. one row violates a constraint) its rows are retried
+    one by one so a single bad row cannot hold back the rest; a transport
+    error fails the whole batch, which is retried later.
+    """
+    batch_size = batch_size or int(os.getenv('OUTBOX_BATCH_SIZE', '100'))
+    max_attempts = max_attempts or int(os.getenv('OUTBOX_MAX_ATTEMPTS', '10'))
+    now = datetime.utcnow()
+    due = [row_id for row_id, in session.query(model.id)
+           .filter(model.status == 'pending', model.next_attempt_at <= now)
+           .order_by(model.id).limit(batch_size)]
+    if not due:
+        return 0
+    # postgrest comes with the Supabase client; import it only once there is work
+    from postgrest.exceptions import APIError
+    # Claim atomically; another worker draining at the same time skips these
+    token = uuid.uuid4().hex
+    session.query(model).filter(model.id.in_(due), model.status == 'pending', model.next_attempt_at <= now) \
+        .update({'claimed_by': token, 'next_attempt_at': now + timedelta(seconds=CLAIM_SECONDS)},
+                synchronize_session=False)
+    session.commit()
+    rows = session.query(model).filter_by(claimed_by=token).order_by(model.id).all()
+
+    by_table = {}
+    for row in rows:
+        by_table.setdefault(row.table_name, []).append(row)
+    order = {name: i for i, name in enumerate(TABLE_ORDER)}
+    sent = failed = 0
+    for table_name in sorted(by_table, key=lambda name: order.get(name, len(order))):
+        batch = by_table[table_name]
+        try:
+            push(table_name, [json.loads(row.payload) for row in batch])
+            done = batch
+        except APIError as e:
+            if len(batch) == 1:
+                _mark_failed(batch[0], e, max_attempts)
+                done = []
+            else:
+                done = []
+                for row in batch:
+                    try:
+                        push(table_name, [json.loads(row.payload)])
+                        done.append(row)
+                    except Exception as row_error:
+                        _mark_failed(row, row_error, max_attempts)
+        except Exception as e:
+            for row in batch:
+                _mark_failed(row, e, max_attempts)
+            done = []
+        for row in done:
+            row.status = 'sent'
+            row.sent_at = datetime.utcnow()
+        sent += len(done)
+        failed += len(batch) - len(done)
+    session.commit()
+    print(f"Supabase outbox: {sent} rows sent, {failed} failed")
+    return len(rows)
+
+
+def prune_sent(session, model, retention_hours=None, batch_size=1000):
+    """Delete up to batch_size rows pushed more than retention_hours ago; returns how many.
+
+    Dead rows are kept for inspection.
+    """
+    if retention_hours is None:
+        retention_hours = float(os.getenv('OUTBOX_SENT_RETENTION', '24'))
+    cutoff = datetime.utcnow() - timedelta(hours=retention_hours)
+    expired = [row_id for row_id, in session.query(model.id)
+               .filter(model.status == 'sent', model.sent_at <= cutoff).limit(batch_size)]
+    if expired:
+        session.query(model).filter(model.id.in_(expired)).delete(synchronize_session=False)
+        session.commit()
+    return len(expired)
+
+
+class OutboxDrainer:
+    """Background thread that drains the outbox every interval, or sooner when woken"""
+
+    def __init__(self, drain_once, interval=None):
+        self._drain_once = drain_once
+        self.interval = interval or float(os.getenv('OUTBOX_DRAIN_INTERVAL', '5'))
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='supabase-outbox', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        """Drain now instead of at the next interval (e.g. right after a commit)"""
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                handled = self._drain_once()
+            except Exception as e:
+                print(f"Supabase outbox drain failed: {e}")
+                handled = 0
+            if handled:
+                continue  # More rows may be due; keep going until a drain comes back empty
+            self._wake.wait(self.interval)
+            self._wake.clear()
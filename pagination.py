@@ -0,0 +1,84 @@
+"""
+Keyset (cursor) pagination for per-user history lists.
+
+Pages are ordered newest first on (sort column, id). The cursor is the
+position of the last row returned, so fetching the next page is a range
+scan starting just below that position: its cost depends on the page size,
+not on how far back the patient's history goes (unlike OFFSET, which
+re-reads every skipped row).
+
+keyset_after() walks the other way, oldest first from a position, for
+incremental fetches ("what arrived since"): rows sharing a timestamp are
+told apart by id, so none is skipped or returned twice across calls.
+
+Cursors are opaque to clients: URL-safe base64 of the JSON [value, id].
+"""
+
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(value, row_id):
+    payload = json.dumps([value.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, kind=datetime):
+    """Inverse of encode_cursor; kind is date or datetime (the sort column's type)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return kind.fromisoformat(value), int(row_id)
+    except (ValueError, TypeError, UnicodeDecodeError) as e:
+        raise InvalidCursor('invalid cursor') from e
+
+
+def page_size(value, default=DEFAULT_PAGE_SIZE):
+    """Clamp a requested page size (e.g. the limit query parameter)"""
+    try:
+        size = int(value) if value not in (None, '') else default
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def keyset_page(query, sort_column, id_column, cursor=None, limit=DEFAULT_PAGE_SIZE, kind=datetime):
+    """One page of query, newest first, starting after cursor.
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    Raises InvalidCursor for a malformed cursor.
+    """
+    if cursor:
+        value, row_id = decode_cursor(cursor, kind)
+        query = query.filter(or_(sort_column < value, and_(sort_column == value, id_column < row_id)))
+    # One extra row tells us whether another page exists
+    rows = query.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+    return rows, next_cursor
+
+
+def keyset_after(query, sort_column, id_column, cursor, limit=DEFAULT_PAGE_SIZE, kind=datetime):
+    """Rows of query after the cursor position, oldest first.
+
+    Returns (rows, more); more is True when rows beyond limit are left, to be
+    fetched from the cursor of the last row returned. Raises InvalidCursor
+    for a malformed cursor.
+    """
+    value, row_id = decode_cursor(cursor, kind)
+    query = query.filter(or_(sort_column > value, and_(sort_column == value, id_column > row_id)))
+    rows = query.order_by(sort_column, id_column).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
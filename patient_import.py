@@ -0,0 +1,137 @@
+"""
+Reading and preparing patients for the bulk import command (flask import-patients).
+
+The CSV has a header row with username, password, age, gender, height and
+weight; goal and role are optional. The profile columns are required in
+every row because the Supabase users table declares them NOT NULL: a row
+without them would be imported locally and then fail forever in the outbox.
+Only patients are imported unless doctor rows are explicitly allowed
+(--allow-doctors), so a stray role column can't create doctor accounts.
+Rows are read and validated a chunk at a time so a clinic's whole roster
+never sits in memory, and a bad row is reported by line number and skipped
+instead of failing the import.
+
+Password hashing is what makes registering patients slow (werkzeug's
+default method is deliberately CPU-heavy), so PasswordHasher spreads a
+chunk over a process pool.
+"""
+
+import csv
+import itertools
+import multiprocessing
+import random
+import string
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash
+
+REQUIRED_COLUMNS = ('username', 'password', 'age', 'gender', 'height', 'weight')
+GENDER_MAX_LENGTH = 10  # Supabase users.gender is VARCHAR(10)
+GOALS = ('weight_loss', 'muscle_gain', 'diabetes_control')
+ROLES = ('user', 'doctor')
+PATIENT_ID_ALPHABET = string.ascii_uppercase + string.digits
+PATIENT_ID_LENGTH = 8
+
+
+class ImportFileError(ValueError):
+    pass
+
+
+def random_patient_id(rng=random):
+    return ''.join(rng.choices(PATIENT_ID_ALPHABET, k=PATIENT_ID_LENGTH))
+
+
+def _number(value, kind, column):
+    value = (value or '').strip()
+    if not value:
+        raise ValueError(f'{column} is required')
+    try:
+        return kind(value)
+    except ValueError:
+        raise ValueError(f'{column} is not a number: {value!r}')
+
+
+def parse_patient(row, allow_doctors=False):
+    """Column values of a User from one CSV row; raises ValueError for a bad row"""
+    username = (row.get('username') or '').strip()
+    password = row.get('password') or ''
+    if not username or not password:
+        raise ValueError('username and password are required')
+    goal = (row.get('goal') or '').strip() or 'weight_loss'
+    if goal not in GOALS:
+        raise ValueError(f'unknown goal {goal!r}')
+    role = (row.get('role') or '').strip() or 'user'
+    if role not in ROLES:
+        raise ValueError(f'unknown role {role!r}')
+    if role == 'doctor' and not allow_doctors:
+        raise ValueError('doctor accounts are only imported with --allow-doctors')
+    gender = (row.get('gender') or '').strip()
+    if not gender:
+        raise ValueError('gender is required')
+    if len(gender) > GENDER_MAX_LENGTH:
+        raise ValueError(f'gender is longer than {GENDER_MAX_LENGTH} characters: {gender!r}')
+    return {
+        'username': username,
+        'password': password,
+        'age': _number(row.get('age'), int, 'age'),
+        'gender': gender,
+        'height': _number(row.get('height'), float, 'height'),
+        'weight': _number(row.get('weight'), float, 'weight'),
+        'goal': goal,
+        'role': role,
+    }
+
+
+def read_patient_chunks(handle, chunk_size, allow_doctors=False):
+    """Yield (patients, errors) per chunk of CSV rows.
+
+    errors lists (line number, message) for the rows left out, including
+    usernames repeated within the file (the first occurrence is kept).
+    """
+    reader = csv.DictReader(handle)
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+    if missing:
+        raise ImportFileError(f"missing column(s): {', '.join(missing)}")
+    numbered = ((reader.line_num, row) for row in reader)
+    seen = set()
+    while True:
+        rows = list(itertools.islice(numbered, chunk_size))
+        if not rows:
+            return
+        patients, errors = [], []
+        for line, row in rows:
+            try:
+                patient = parse_patient(row, allow_doctors)
+            except ValueError as e:
+                errors.append((line, str(e)))
+                continue
+            if patient['username'] in seen:
+                errors.append((line, f"duplicate username {patient['username']!r}"))
+                continue
+            seen.add(patient['username'])
+            patients.append(patient)
+        yield patients, errors
+
+
+class PasswordHasher:
+    """Hashes passwords in a process pool, or inline when workers is 0"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        # spawn, not fork: the pool must not inherit this process's DB connections
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) \
+            if workers > 0 else None
+
+    def hash(self, passwords):
+        """Hashes for passwords, in order"""
+        if self._executor is None:
+            return [generate_password_hash(password) for password in passwords]
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return list(self._executor.map(generate_password_hash, passwords, chunksize=chunksize))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._executor is not None:
+            self._executor.shutdown()
@@ -0,0 +1,135 @@
+"""
+PDF text extraction: text layer where a page has one, OCR where it doesn't.
+
+Each page is classified on its own. Pages with a usable text layer are read
+with pdfplumber; only the remaining (scanned) pages are rasterized and OCR'd,
+so a typed cover page plus scanned results costs OCR for the scans only.
+
+Scanned pages are rasterized one at a time (pdftoppm writes a temporary PNG)
+and handed straight to Tesseract by path, so no page image is decoded into
+this process. Both steps are external programs, so a small thread pool is
+enough to keep several pdftoppm/tesseract processes busy on separate cores;
+at most OCR_PAGE_WORKERS pages are on disk at any time, whatever the page
+count. Results are always returned in page order.
+
+pdfplumber, pytesseract and pdf2image are imported on first use, so importing
+this module (and the app) stays cheap until a PDF is actually processed.
+
+Configuration (environment variables):
+    OCR_PAGE_WORKERS  pages rasterized/OCR'd in parallel (default: CPU count, max 4)
+    OCR_PDF_DPI       rasterization resolution (default 200)
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# A page needs at least this many non-space characters in its text layer to
+# skip OCR; scanned pages often carry only a stamped header or page number
+MIN_TEXT_LAYER_CHARS = 20
+
+
+def warm_up():
+    """Import the PDF/OCR libraries now rather than on the first PDF"""
+    import pdf2image
+    import pdfplumber
+    import pytesseract
+
+
+def page_workers():
+    default = min(4, os.cpu_count() or 1)
+    return max(1, int(os.getenv('OCR_PAGE_WORKERS', default)))
+
+
+def has_text_layer(text):
+    return len(''.join(text.split())) >= MIN_TEXT_LAYER_CHARS
+
+
+def ocr_pdf_page(filepath, page_number, lang='eng', dpi=None):
+    """Rasterize one PDF page (1-based) and OCR it with Tesseract"""
+    import pytesseract
+    from pdf2image import convert_from_path
+    dpi = dpi or int(os.getenv('OCR_PDF_DPI', '200'))
+    tmpdir = tempfile.mkdtemp(prefix='ocr_page_')
+    try:
+        paths = convert_from_path(filepath, dpi=dpi, first_page=page_number, last_page=page_number,
+                                  output_folder=tmpdir, fmt='png', paths_only=True)
+        return ''.join(pytesseract.image_to_string(path, lang=lang) for path in paths)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def ocr_pdf_pages(filepath, page_numbers, lang='eng', workers=None, timings=None, errors=None):
+    """OCR the given 1-based pages in parallel; texts come back in the same order.
+
+    If timings is a dict it is filled with {page_number: seconds}. If errors
+    is a dict, a page whose OCR raises is recorded there as
+    {page_number: message} and comes back as None; otherwise the error
+    propagates.
+    """
+    page_numbers = list(page_numbers)
+    if not page_numbers:
+        return []
+
+    def run(page_number):
+        start = time.perf_counter()
+        try:
+            return ocr_pdf_page(filepath, page_number, lang)
+        except Exception as e:
+            if errors is None:
+                raise
+            errors[page_number] = f'{type(e).__name__}: {e}'
+            return None
+        finally:
+            if timings is not None:
+                timings[page_number] = time.perf_counter() - start
+
+    workers = min(workers or page_workers(), len(page_numbers))
+    if workers == 1:
+        return [run(n) for n in page_numbers]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run, page_numbers))
+
+
+def extract_pdf_text(filepath, lang='eng', page_timings=None):
+    """Extract a PDF's text, OCR'ing only the pages without a usable text layer.
+
+    If page_timings is a list, one entry per page is appended:
+    {'page': n, 'method': 'text' | 'ocr', 'seconds': ..., 'chars': ...}
+    plus 'error' for a page whose OCR failed. Such a page keeps whatever its
+    text layer had, so one bad page (or a missing OCR engine with a blank
+    trailing page) doesn't lose the rest of the report. Only when every page
+    needed OCR and none of it worked is the first error raised.
+    """
+    import pdfplumber
+    texts = []
+    entries = []
+    with pdfplumber.open(filepath) as pdf:
+        for number, page in enumerate(pdf.pages, start=1):
+            start = time.perf_counter()
+            text = page.extract_text() or ''
+            entries.append({'page': number, 'method': 'text', 'seconds': time.perf_counter() - start})
+            texts.append(text)
+    scanned = [entry['page'] for entry in entries if not has_text_layer(texts[entry['page'] - 1])]
+    if scanned:
+        ocr_seconds, ocr_errors = {}, {}
+        ocr_texts = ocr_pdf_pages(filepath, scanned, lang=lang, timings=ocr_seconds, errors=ocr_errors)
+        if len(ocr_errors) == len(entries):
+            raise RuntimeError(f'OCR failed for every page: {ocr_errors[scanned[0]]}')
+        for number, text in zip(scanned, ocr_texts):
+            entry = entries[number - 1]
+            entry['method'] = 'ocr'
+            entry['seconds'] += ocr_seconds.get(number, 0.0)
+            if number in ocr_errors:
+                entry['error'] = ocr_errors[number]
+            else:
+                texts[number - 1] = text
+    for entry, text in zip(entries, texts):
+        entry['seconds'] = round(entry['seconds'], 4)
+        entry['chars'] = len(text)
+    if page_timings is not None:
+        page_timings.extend(entries)
+    # Newline between pages so the last value on one page can't run into the next
+    return '\n'.join(texts)
@@ -0,0 +1,104 @@
+"""
+Reference data (food catalog and lab test parameters) loaded once per process.
+
+The CSVs are parsed into small indexed structures the first time they are
+needed and kept in memory. Each table re-checks its file's modification
+time at most every REFERENCE_DATA_CHECK_SECONDS (default 5) and reloads when
+the file has changed, so edits are picked up without restarting workers and
+request handlers never read the files themselves.
+"""
+
+import csv
+import hashlib
+import io
+import os
+import threading
+import time
+
+from lab_matcher import LabValueMatcher, parameter_key
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FOOD_DATA_PATH = os.path.join(BASE_DIR, 'food_data.csv')
+TEST_PARAMETERS_PATH = os.path.join(BASE_DIR, 'medical_test_parameters.csv')
+
+FOOD_NUMERIC_COLUMNS = ('calories', 'protein', 'iron', 'carbs')
+
+
+def _number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+class FoodCatalog:
+    def __init__(self, rows, version):
+        self.version = version
+        self.by_name = {}  # lower-cased food name -> row
+        self.by_tag = {}   # suitable_for tag -> [food names], in file order
+        for row in rows:
+            food = {'food': row['food'].strip()}
+            for column in FOOD_NUMERIC_COLUMNS:
+                food[column] = _number(row[column])
+            food['suitable_for'] = tuple(t.strip() for t in row['suitable_for'].split(',') if t.strip())
+            # First row wins on duplicate names
+            self.by_name.setdefault(food['food'].lower(), food)
+            for tag in food['suitable_for']:
+                self.by_tag.setdefault(tag, []).append(food['food'])
+
+    def get(self, name):
+        """Look up a food by name, case-insensitively"""
+        return self.by_name.get(name.lower())
+
+    def foods_for(self, tag):
+        return self.by_tag.get(tag, [])
+
+
+class LabTestParameters:
+    def __init__(self, rows, version):
+        self.version = version
+        self.rows = [{k: (v or '').strip() for k, v in row.items()} for row in rows]
+        self.names = [row['Test Name'] for row in self.rows]
+        self.by_name = {row['Test Name']: row for row in self.rows}
+        # extracted_values key -> unit, e.g. 'hemoglobin_hb' -> 'g/dL'
+        self.units = {parameter_key(row['Test Name']): row['Unit'] for row in self.rows}
+        # The lab-value matcher follows the table it was compiled from
+        self.matcher = LabValueMatcher(self.names)
+
+
+class ReferenceTable:
+    def __init__(self, path, build):
+        self.path = path
+        self._build = build
+        self._value = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        check_every = float(os.getenv('REFERENCE_DATA_CHECK_SECONDS', '5'))
+        if self._value is not None and now - self._checked_at < check_every:
+            return self._value
+        with self._lock:
+            mtime = os.stat(self.path).st_mtime_ns
+            if self._value is None or mtime != self._mtime:
+                with open(self.path, 'rb') as f:
+                    content = f.read()
+                rows = list(csv.DictReader(io.StringIO(content.decode('utf-8')), skipinitialspace=True))
+                # Content hash, so the version only moves when the data does
+                self._value = self._build(rows, version=hashlib.sha256(content).hexdigest()[:16])
+                self._mtime = mtime
+                print(f"Loaded reference data from {os.path.basename(self.path)} ({len(rows)} rows)")
+            self._checked_at = now
+        return self._value
+
+
+_food_catalog = ReferenceTable(FOOD_DATA_PATH, FoodCatalog)
+_lab_test_parameters = ReferenceTable(TEST_PARAMETERS_PATH, LabTestParameters)
+
+
+def food_catalog():
+    return _food_catalog.get()
+
+
+def lab_test_parameters():
+    return _lab_test_parameters.get()
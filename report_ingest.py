@@ -0,0 +1,117 @@
+"""
+Planning and fan-out for bulk report ingestion (flask ingest-reports).
+
+A source is either a directory or a manifest CSV:
+
+    reports/                     every report belongs to --patient-id, or
+    reports/<patient_id>/...     each subdirectory is named by a patient ID
+    manifest.csv                 columns file, patient_id and optionally date
+                                 (ISO, when the report was taken); paths are
+                                 relative to the manifest
+
+Files are extracted in a process pool (the same extract/parse code the web
+upload runs in its job processes) with only a few files in flight per
+process, so memory stays bounded however large the backlog is.
+"""
+
+import csv
+import hashlib
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+INFLIGHT_PER_WORKER = 2
+
+
+class ManifestError(ValueError):
+    pass
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _report_files(directory, allowed):
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if allowed(name):
+                yield os.path.join(root, name)
+
+
+def plan_directory(directory, allowed, patient_id=None):
+    """(path, patient_id, taken_at) for the report files under directory, in a stable order"""
+    if patient_id:
+        return [(path, patient_id, None) for path in _report_files(directory, allowed)]
+    plan = []
+    for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+        if entry.is_dir():
+            plan.extend((path, entry.name, None) for path in _report_files(entry.path, allowed))
+    return plan
+
+
+def plan_manifest(manifest_path, allowed):
+    """(path, patient_id, taken_at) for each manifest row; raises ManifestError on a bad row"""
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    plan = []
+    with open(manifest_path, newline='', encoding='utf-8-sig') as handle:
+        reader = csv.DictReader(handle)
+        if not {'file', 'patient_id'} <= set(reader.fieldnames or ()):
+            raise ManifestError('manifest needs file and patient_id columns')
+        for row in reader:
+            path = os.path.join(base, row['file'].strip())
+            if not allowed(path) or not os.path.isfile(path):
+                raise ManifestError(f"line {reader.line_num}: not a PDF/JPG/PNG file: {row['file']!r}")
+            taken_at = None
+            if (row.get('date') or '').strip():
+                try:
+                    taken_at = datetime.fromisoformat(row['date'].strip())
+                except ValueError:
+                    raise ManifestError(f"line {reader.line_num}: invalid date {row['date']!r}")
+            plan.append((path, row['patient_id'].strip(), taken_at))
+    return plan
+
+
+def _init_ingest_process():
+    # Same warm-up as the upload job processes: PDF libraries and OCR readers
+    from ocr_readers import reader_pool
+    from pdf_ocr import warm_up
+    warm_up()
+    reader_pool.warm_up_from_env()
+
+
+def bounded_map(fn, jobs, workers):
+    """Run fn(*args) for each (key, args) in jobs; yield (key, result, error) in completion order.
+
+    At most INFLIGHT_PER_WORKER jobs per process are submitted at a time, so
+    results are consumed as fast as they are produced and jobs is read
+    lazily. workers 0 runs fn in this process.
+    """
+    if workers <= 0:
+        for key, args in jobs:
+            try:
+                yield key, fn(*args), None
+            except Exception as e:
+                yield key, None, e
+        return
+    # spawn, not fork: extraction processes must not inherit DB connections or torch state
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_ingest_process) as executor:
+        jobs = iter(jobs)
+        pending = {}
+        while True:
+            for key, args in itertools.islice(jobs, workers * INFLIGHT_PER_WORKER - len(pending)):
+                pending[executor.submit(fn, *args)] = key
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = pending.pop(future)
+                error = future.exception()
+                yield key, None if error else future.result(), error
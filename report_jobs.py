@@ -0,0 +1,92 @@
+"""
+Local background pool for processing uploaded medical reports.
+
+Uploads are recorded as ReportJob rows in the app database (so no external
+broker is needed) and handed to a process pool owned by the web worker. The
+job process claims its row, runs OCR and parsing and writes the HealthReport,
+so a scanned PDF no longer ties up a gunicorn request thread.
+
+A job whose process dies mid-extraction stays 'processing'; when a worker
+starts, jobs claimed longer than REPORT_JOB_TIMEOUT ago are queued again, or
+failed after REPORT_JOB_MAX_ATTEMPTS claims (see recover_stale_report_jobs
+in app.py).
+
+Configuration (environment variables):
+    REPORT_JOB_WORKERS       job processes per web worker (default 2);
+                             0 processes uploads inline in the request
+    REPORT_JOB_TIMEOUT       seconds before a 'processing' job counts as
+                             interrupted (default 900)
+    REPORT_JOB_MAX_ATTEMPTS  claims before an interrupted job fails (default 2)
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+def _init_job_process():
+    # Job processes exist to run OCR: load the PDF libraries up front, and
+    # warm this process's OCR readers if configured
+    from ocr_readers import reader_pool
+    from pdf_ocr import warm_up
+    warm_up()
+    reader_pool.warm_up_from_env()
+
+
+def _log_failure(future):
+    try:
+        future.result()
+    except Exception as e:
+        print(f"Report job failed in worker process: {e}")
+
+
+class ReportJobPool:
+    def __init__(self, workers=None):
+        if workers is None:
+            workers = int(os.getenv('REPORT_JOB_WORKERS', '2'))
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: job processes must not inherit the web
+                # worker's DB connections or torch thread state
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_job_process,
+                )
+            return self._executor
+
+    def start(self):
+        """Start the job processes now instead of on the first upload"""
+        if self.workers > 0:
+            self._get_executor()
+
+    def submit(self, fn, *args):
+        """Run fn(*args) in a job process (or inline when workers is 0)"""
+        if self.workers <= 0:
+            fn(*args)
+            return None
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BrokenProcessPool:
+            # A job process died (e.g. killed for memory); start a fresh pool
+            with self._lock:
+                self._executor = None
+            future = self._get_executor().submit(fn, *args)
+        future.add_done_callback(_log_failure)
+        return future
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+
+job_pool = ReportJobPool()
@@ -0,0 +1,134 @@
+"""
+Read-through cache for SupabaseService reads.
+
+get_user, get_user_reports and get_user_messages each cost a round trip to
+Supabase. Results are kept in this worker for a per-table TTL, keyed by
+(table, id), so repeated reads of the same user are served locally:
+
+- Empty results (no such user, no reports yet) are cached too, for a shorter
+  negative TTL, so lookups of missing rows don't hit the network every time.
+- Failed reads are never cached; the next call tries Supabase again.
+- Values are stored as JSON, which bounds memory by bytes rather than entry
+  count (report rows carry the full extracted text) and hands every caller
+  fresh objects it can modify without corrupting the cache.
+- The create_* methods invalidate the rows they write, and so does each
+  outbox push, when the write actually reaches Supabase. Other workers'
+  copies expire within the TTL.
+
+Configuration (environment variables):
+    SUPABASE_CACHE_TTL_USERS           seconds (default 300)
+    SUPABASE_CACHE_TTL_HEALTH_REPORTS  seconds (default 60)
+    SUPABASE_CACHE_TTL_MESSAGES        seconds (default 30)
+    SUPABASE_CACHE_NEGATIVE_TTL        seconds for empty results (default 15)
+    SUPABASE_CACHE_MAX_MB              memory for cached values (default 32)
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTLS = {'users': 300, 'health_reports': 60, 'messages': 30}
+
+
+def table_ttls():
+    return {table: float(os.getenv(f'SUPABASE_CACHE_TTL_{table.upper()}', ttl))
+            for table, ttl in DEFAULT_TTLS.items()}
+
+
+class SupabaseReadCache:
+    def __init__(self, ttls=None, negative_ttl=None, max_bytes=None, clock=time.monotonic):
+        self.ttls = ttls or table_ttls()
+        self.negative_ttl = negative_ttl if negative_ttl is not None else \
+            float(os.getenv('SUPABASE_CACHE_NEGATIVE_TTL', '15'))
+        self.max_bytes = max_bytes or int(float(os.getenv('SUPABASE_CACHE_MAX_MB', '32')) * 1024 * 1024)
+        self._clock = clock
+        self._entries = OrderedDict()  # (table, key) -> (json, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = {}
+        self.misses = {}
+        self.negative_hits = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _drop(self, key):
+        data, _ = self._entries.pop(key)
+        self._bytes -= len(data)
+
+    def get(self, table, key, load):
+        """Cached result of load() for (table, key); load() runs on a miss.
+
+        load() returns the rows (a falsy result is cached for the negative
+        TTL) or raises, in which case nothing is cached and the error
+        propagates to the caller.
+        """
+        cache_key = (table, key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and self._clock() >= entry[1]:
+                self._drop(cache_key)
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+                self.hits[table] = self.hits.get(table, 0) + 1
+                data = entry[0]
+            else:
+                self.misses[table] = self.misses.get(table, 0) + 1
+        if entry is not None:
+            value = json.loads(data)
+            if not value:
+                with self._lock:
+                    self.negative_hits += 1
+            return value
+        value = load()
+        self.put(table, key, value)
+        return value
+
+    def put(self, table, key, value):
+        data = json.dumps(value, default=str)
+        ttl = self.ttls.get(table, 0) if value else min(self.negative_ttl, self.ttls.get(table, 0))
+        if ttl <= 0 or len(data) > self.max_bytes:
+            return
+        cache_key = (table, key)
+        with self._lock:
+            if cache_key in self._entries:
+                self._drop(cache_key)
+            self._entries[cache_key] = (data, self._clock() + ttl)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, table, key):
+        """Forget (table, key) after a write to it"""
+        with self._lock:
+            if (table, key) in self._entries:
+                self._drop((table, key))
+                self.invalidations += 1
+                return True
+        return False
+
+    def stats(self):
+        with self._lock:
+            hits = sum(self.hits.values())
+            lookups = hits + sum(self.misses.values())
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': hits,
+                'misses': lookups - hits,
+                'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+                'negative_hits': self.negative_hits,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'tables': {table: {'hits': self.hits.get(table, 0), 'misses': self.misses.get(table, 0)}
+                           for table in sorted(set(self.hits) | set(self.misses))},
+            }
+
+
+supabase_cache = SupabaseReadCache()
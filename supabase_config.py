@@ -1,5 +1,5 @@
 import os
-from supabase import create_client, Client
+import threading
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -9,16 +9,24 @@ load_dotenv()
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_ANON_KEY = os.getenv('SUPABASE_ANON_KEY')
 
-# Validate that environment variables are set
-if not SUPABASE_URL or not SUPABASE_ANON_KEY:
-    raise ValueError(
-        "Supabase credentials not found! Please set SUPABASE_URL and SUPABASE_ANON_KEY environment variables.\n"
-        "Create a .env file with your Supabase credentials. See env_template.txt for reference."
-    )
-
-# Create Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+# The client (and the supabase package behind it) is created on first use, so
+# importing this module is cheap and doesn't fail without credentials; the
+# check happens when something actually talks to Supabase.
+_supabase = None
+_lock = threading.Lock()
 
 def get_supabase_client():
-    """Get the Supabase client instance"""
-    return supabase
+    """Get the Supabase client instance, creating it on first call"""
+    global _supabase
+    if _supabase is None:
+        with _lock:
+            if _supabase is None:
+                # Validate that environment variables are set
+                if not SUPABASE_URL or not SUPABASE_ANON_KEY:
+                    raise ValueError(
+                        "Supabase credentials not found! Please set SUPABASE_URL and SUPABASE_ANON_KEY environment variables.\n"
+                        "Create a .env file with your Supabase credentials. See env_template.txt for reference."
+                    )
+                from supabase import create_client
+                _supabase = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+    return _supabase
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Check that folding activity days in one at a time (as the stats rollup does
+on every write) agrees with recomputing the streaks from all days at once.
+"""
+
+import random
+from datetime import date, timedelta
+
+from activity_stats import advance_streak, streaks
+
+START = date(2024, 1, 1)
+
+
+def days(*offsets):
+    return [START + timedelta(days=n) for n in offsets]
+
+
+def test_streaks():
+    assert streaks([]) == (0, 0)
+    assert streaks(days(0)) == (1, 1)
+    assert streaks(days(0, 1, 2, 5, 6)) == (2, 3)
+    # Several logs on one day count once; input order does not matter
+    assert streaks(days(3, 2, 2, 1, 0, 0)) == (4, 4)
+    assert streaks(days(0, 1, 2, 3, 4, 5, 6, 10)) == (1, 7)
+
+
+def test_incremental_matches_recompute():
+    rng = random.Random(3)
+    for _ in range(200):
+        logged = sorted(days(*rng.sample(range(40), rng.randint(1, 30))))
+        # Logs arrive in date order, several per day at times
+        logged = [d for d in logged for _ in range(rng.randint(1, 2))]
+        current = longest = 0
+        last_day = None
+        for day in logged:
+            current, longest, last_day = advance_streak(current, longest, last_day, day)
+        assert (current, longest) == streaks(logged)
+        assert last_day == logged[-1]
+
+
+def test_backdated_day_is_left_to_repair():
+    assert advance_streak(3, 5, START, START - timedelta(days=4)) == (3, 5, START)
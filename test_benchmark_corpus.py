@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+The synthetic corpus the benchmarks run on must be realistic and exact:
+values follow the reference ranges in medical_test_parameters.csv, and the
+parser finds exactly the values each generated report claims to hold, in
+plain text and through a text-layer PDF.
+"""
+
+import contextlib
+import io
+import os
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import extract_text_from_file, parse_medical_values
+from benchmarks.corpus import LabReportGenerator, load_parameters, normal_range, write_image, write_text_pdf
+
+
+def parse(text):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return parse_medical_values(text)[0]
+
+
+def test_normal_ranges():
+    assert normal_range('13.5–17.5 g/dL (M), 12.0–15.5 g/dL (F)') == (13.5, 17.5)
+    assert normal_range('150,000–450,000 /μL') == (150000, 450000)
+    assert normal_range('Less than 200 mg/dL') == (100, 200)
+    assert len(load_parameters()) == 52
+
+
+def test_values_mostly_within_range():
+    generator = LabReportGenerator(seed=1, abnormal_rate=0.2)
+    ranges = {p.key: (p.low, p.high) for p in generator.parameters}
+    inside = total = 0
+    for _ in range(50):
+        for key, value in generator.report(tests=20).values.items():
+            low, high = ranges[key]
+            inside += low <= float(value) <= high
+            total += 1
+    assert 0.7 < inside / total < 0.9
+
+
+def test_parser_finds_generated_values(tmp_path):
+    for seed in range(20):
+        report = LabReportGenerator(seed=seed).report(pages=3, tests=40)
+        assert parse(report.text) == report.values
+    path = write_text_pdf(str(tmp_path / 'report.pdf'), report)
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert parse(extract_text_from_file(path)) == report.values
+
+
+def test_same_seed_same_corpus(tmp_path):
+    first, second = (LabReportGenerator(seed=5).report(pages=2) for _ in range(2))
+    assert first.pages == second.pages
+    write_image(str(tmp_path / 'a.png'), first)
+    write_image(str(tmp_path / 'b.png'), second)
+    assert (tmp_path / 'a.png').read_bytes() == (tmp_path / 'b.png').read_bytes()
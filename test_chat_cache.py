@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Check the chatbot response cache: normalized question matching, misses on a
+changed context or conversation (also through /chatbot), TTL expiry, LRU
+eviction, invalidation and counters.
+"""
+
+import os
+
+from werkzeug.security import generate_password_hash
+
+from chat_cache import ChatResponseCache, normalize_question
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import app as app_module
+from app import User, app, db
+
+CONTEXT = 'User: asha, Age: 34, Goal: diabetes_control | Health Data: hba1c=6.1'
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_normalized_question_hits():
+    assert normalize_question('  Is my SUGAR ok?? ') == 'is my sugar ok'
+    cache = ChatResponseCache(max_entries=10, ttl=60)
+    cache.put(1, 'What should I eat for breakfast?', CONTEXT, 'Oats with nuts.', llm_seconds=2.5)
+    assert cache.get(1, 'what should i eat for breakfast', CONTEXT) == 'Oats with nuts.'
+    assert cache.get(2, 'what should i eat for breakfast', CONTEXT) is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['hit_ratio'], stats['saved_seconds']) == (1, 1, 0.5, 2.5)
+
+
+def test_changed_context_misses():
+    cache = ChatResponseCache(max_entries=10, ttl=60)
+    cache.put(1, 'is my sugar ok', CONTEXT, 'Yes.')
+    assert cache.get(1, 'is my sugar ok', CONTEXT + ' | Recent: 9000 steps, walk') is None
+
+
+def test_changed_history_misses():
+    cache = ChatResponseCache(max_entries=10, ttl=60)
+    cache.put(1, 'is my sugar ok', CONTEXT, 'Yes.', history='Q: hi A: Hello...')
+    assert cache.get(1, 'is my sugar ok', CONTEXT, 'Q: hi A: Hello...') == 'Yes.'
+    assert cache.get(1, 'is my sugar ok', CONTEXT) is None
+    assert cache.get(1, 'is my sugar ok', CONTEXT, 'Q: is my sugar ok A: Yes....') is None
+
+
+def test_chatbot_repeat_in_conversation_asks_again(monkeypatch):
+    with app.app_context():
+        db.session.add(User(username='cache-repeat', password=generate_password_hash('pw'), patient_id='CACHEREPEAT'))
+        db.session.commit()
+    prompts = []
+
+    def ask_llm(context, user_message, goal, history=()):
+        prompts.append(app_module.chat_messages(context, user_message, history)[1]['content'])
+        return f'Reply {len(prompts)}', True
+    monkeypatch.setattr(app_module, 'ask_llm', ask_llm)
+    client = app.test_client()
+    client.post('/login', data={'username': 'cache-repeat', 'password': 'pw'})
+    replies = [client.post('/chatbot', json={'message': 'Is my sugar ok?'}).get_json()['history'][-1]['reply']
+               for _ in range(2)]
+    # The second prompt quotes the first exchange, so its reply isn't the cached one
+    assert replies == ['Reply 1', 'Reply 2']
+    assert 'Recent chat' not in prompts[0]
+    assert 'Q: Is my sugar ok? A: Reply 1' in prompts[1]
+
+
+def test_ttl_expiry():
+    clock = Clock()
+    cache = ChatResponseCache(max_entries=10, ttl=60, clock=clock)
+    cache.put(1, 'q', CONTEXT, 'a')
+    clock.now = 59
+    assert cache.get(1, 'q', CONTEXT) == 'a'
+    clock.now = 61
+    assert cache.get(1, 'q', CONTEXT) is None
+    assert cache.stats()['expirations'] == 1 and cache.stats()['entries'] == 0
+
+
+def test_lru_eviction():
+    cache = ChatResponseCache(max_entries=2, ttl=60)
+    cache.put(1, 'a', CONTEXT, 'A')
+    cache.put(1, 'b', CONTEXT, 'B')
+    cache.get(1, 'a', CONTEXT)  # 'b' is now least recently used
+    cache.put(1, 'c', CONTEXT, 'C')
+    assert cache.get(1, 'b', CONTEXT) is None
+    assert cache.get(1, 'a', CONTEXT) == 'A' and cache.get(1, 'c', CONTEXT) == 'C'
+    assert cache.stats()['evictions'] == 1
+
+
+def test_invalidate_user():
+    cache = ChatResponseCache(max_entries=10, ttl=60)
+    cache.put(1, 'a', CONTEXT, 'A')
+    cache.put(1, 'b', CONTEXT, 'B')
+    cache.put(2, 'a', CONTEXT, 'A')
+    assert cache.invalidate_user(1) == 2
+    assert cache.get(1, 'a', CONTEXT) is None
+    assert cache.get(2, 'a', CONTEXT) == 'A'
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Chat context snapshots: an uploaded report and an activity log rebuild the
+user's ChatContext in the same request, and both chatbot endpoints build
+their prompt from the stored snapshot instead of querying the reports and
+logs again.
+"""
+
+import io
+import os
+
+from werkzeug.security import generate_password_hash
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import app as app_module
+from app import ChatContext, User, app, db
+
+
+def login(name):
+    with app.app_context():
+        user = User(username=name, password=generate_password_hash('pw'), patient_id=name.upper()[:16])
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    client = app.test_client()
+    client.post('/login', data={'username': name, 'password': 'pw'})
+    return client, user_id
+
+
+def snapshot(user_id):
+    with app.app_context():
+        row = db.session.get(ChatContext, user_id)
+        return row.version, row.context, row.latest_report_at
+
+
+def test_report_and_activity_refresh_snapshot(monkeypatch, tmp_path):
+    # Process uploads inline, reading the "scan" as text
+    monkeypatch.setattr(app_module.job_pool, 'workers', 0)
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(app_module, 'extract_text_from_file',
+                        lambda filepath, lang='eng', page_timings=None: open(filepath).read())
+    client, user_id = login('context-writes')
+    assert client.get('/chatbot/history').status_code == 200
+    version, context, latest_report_at = snapshot(user_id)
+    assert context.startswith('User: context-writes, ') and 'Health Data' not in context
+    assert latest_report_at is None
+
+    response = client.post('/upload', headers={'Accept': 'application/json'},
+                           data={'report_file': (io.BytesIO(b'context-writes\nHemoglobin 11.2 g/dL'), 'cbc.png')})
+    assert response.get_json()['status'] == 'done'
+    after_report, context, latest_report_at = snapshot(user_id)
+    assert after_report > version
+    assert 'Health Data: ' in context and '11.2' in context
+    assert latest_report_at is not None
+
+    client.post('/activity-log', data={'steps': '8500', 'exercise': 'cycling', 'calories': '300'})
+    after_activity, context, _ = snapshot(user_id)
+    assert after_activity > after_report
+    assert context.endswith(' | Recent: 8500 steps, cycling')
+    assert '11.2' in context
+
+
+def test_chatbot_prompts_come_from_snapshot(monkeypatch):
+    client, user_id = login('context-prompt')
+    client.get('/chatbot/history')
+    with app.app_context():
+        db.session.get(ChatContext, user_id).context = 'SNAPSHOT CONTEXT'
+        db.session.commit()
+
+    def rebuild(user):
+        raise AssertionError('context rebuilt during a chat turn')
+    monkeypatch.setattr(app_module, 'build_chat_context', rebuild)
+    prompts = []
+
+    def ask_llm(context, user_message, goal, history=()):
+        prompts.append(app_module.chat_messages(context, user_message, history)[1]['content'])
+        return 'Fine.', True
+
+    def stream_chat(messages, max_tokens=150):
+        prompts.append(messages[1]['content'])
+        yield 'Fine.'
+    monkeypatch.setattr(app_module, 'ask_llm', ask_llm)
+    monkeypatch.setattr(app_module.llm_client, 'stream_chat', stream_chat)
+
+    assert client.post('/chatbot', json={'message': 'how am i doing'}).status_code == 200
+    response = client.post('/chatbot/stream', json={'message': 'what should i eat'})
+    assert b'event: done' in response.get_data()
+    assert len(prompts) == 2
+    assert all(prompt.startswith('Context: SNAPSHOT CONTEXT\n\n') for prompt in prompts)
+    # The second turn quotes the first, from the snapshot's history
+    assert 'Q: how am i doing A: Fine....' in prompts[1]
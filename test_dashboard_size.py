@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+The dashboard is constant-size: a patient with ten times the report
+history costs the same SQL statements, reads the same bounded window of
+lab results for the trend chart and gets a page of the same size.
+"""
+
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import app as app_module
+from app import HealthReport, LabResult, User, app, db, lab_trend_rows
+
+PARAMETERS = {'hemoglobin_hb': 12.0, 'tsh': 2.5, 'total_cholesterol': 190.0, 'iron': 60.0, 'hba1c': 5.6}
+
+
+def patient_with_history(name, reports):
+    with app.app_context():
+        user = User(username=name, password=generate_password_hash('pw'), patient_id=name.upper()[:16])
+        db.session.add(user)
+        db.session.flush()
+        start = datetime(2020, 1, 1)
+        db.session.execute(HealthReport.__table__.insert(), [
+            {'user_id': user.id, 'filename': f'r{i:04d}.pdf', 'timestamp': start + timedelta(days=i),
+             'extracted_values': '{}', 'conditions': '[]', 'lab_results_written': True} for i in range(reports)])
+        ids = [row.id for row in db.session.query(HealthReport.id).filter_by(user_id=user.id).order_by(HealthReport.id)]
+        db.session.execute(LabResult.__table__.insert(), [
+            {'report_id': report_id, 'user_id': user.id, 'parameter_key': key, 'numeric_value': value + i % 7,
+             'measured_at': start + timedelta(days=i)}
+            for i, report_id in enumerate(ids) for key, value in PARAMETERS.items()])
+        db.session.commit()
+        return user.id
+
+
+def dashboard(name):
+    """(statements, response body) of a warm GET /dashboard"""
+    client = app.test_client()
+    client.post('/login', data={'username': name, 'password': 'pw'})
+    client.get('/dashboard')  # Builds the stats, diet plan and counter rows
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        response = client.get('/dashboard')
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    assert response.status_code == 200
+    return statements, response.data
+
+
+def test_dashboard_cost_does_not_grow_with_history():
+    small = patient_with_history('size-small', 30)
+    large = patient_with_history('size-large', 300)
+    small_statements, small_page = dashboard('size-small')
+    large_statements, large_page = dashboard('size-large')
+    assert len(large_statements) == len(small_statements)
+    with app.app_context():
+        window = app_module.DASHBOARD_TREND_POINTS * len(PARAMETERS)
+        assert len(lab_trend_rows(small)) == len(lab_trend_rows(large)) == window
+        # The window is the latest reports
+        assert lab_trend_rows(large)[-1].measured_at == datetime(2020, 1, 1) + timedelta(days=299)
+    # Same number of chart points; only digits and dates differ
+    assert abs(len(large_page) - len(small_page)) < 200
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Stored diet plans: the plan is built on the write path and served as is
+while its fingerprint (latest report, conditions, goal, food catalog
+version) is unchanged; a new report or a catalog edit changes the
+fingerprint and the plan is rebuilt.
+"""
+
+import json
+import os
+import types
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import app as app_module
+from app import DietPlan, HealthReport, User, add_health_report, app, current_diet_plan, db, refresh_diet_plan
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Conditions of every diet chart built"""
+    calls = []
+    real = app_module.build_diet_chart
+
+    def build(conditions, goal):
+        calls.append(list(conditions))
+        return real(conditions, goal)
+    monkeypatch.setattr(app_module, 'build_diet_chart', build)
+    return calls
+
+
+def make_user(name):
+    user = User(username=name, password=generate_password_hash('pw'), patient_id=name.upper()[:16], goal='weight_loss')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def latest(user):
+    return HealthReport.query.filter_by(user_id=user.id).order_by(HealthReport.timestamp.desc()).first()
+
+
+def test_unchanged_fingerprint_reuses_the_plan(builds):
+    with app.app_context():
+        user = make_user('diet-reuse')
+        first = current_diet_plan(user, None)
+        assert builds == [[]]
+        assert current_diet_plan(user, None) == first
+        assert builds == [[]]
+
+
+def test_new_report_changes_fingerprint_and_plan(builds):
+    with app.app_context():
+        user = make_user('diet-report')
+        current_diet_plan(user, None)
+        before = DietPlan.query.get(user.id).fingerprint
+        add_health_report(user.id, 'cbc.pdf', 'Hemoglobin 10.5', {'hemoglobin': '10.5'}, ['Anemia'])
+        refresh_diet_plan(user)
+        db.session.commit()
+        plan = DietPlan.query.get(user.id)
+        assert plan.fingerprint != before
+        assert builds[-1] == ['Anemia']
+        assert latest(user).diet_plan == plan.plan
+        # Reads after the write path rebuilt it don't build again
+        builds.clear()
+        assert current_diet_plan(user, latest(user)) == json.loads(plan.plan)
+        assert builds == []
+
+
+def test_catalog_change_rebuilds_on_read(builds, monkeypatch):
+    with app.app_context():
+        user = make_user('diet-catalog')
+        current_diet_plan(user, None)
+        real = app_module.food_catalog()
+        edited = types.SimpleNamespace(version='edited', get=real.get, foods_for=real.foods_for)
+        monkeypatch.setattr(app_module, 'food_catalog', lambda: edited)
+        builds.clear()
+        current_diet_plan(user, None)
+        assert builds == [[]]
+        current_diet_plan(user, None)
+        assert builds == [[]]
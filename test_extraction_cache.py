@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Extraction cache keyed by file content: a stored extraction is served for
+the same content and language, entries from an older extractor are
+ignored, a parser change re-parses the cached text instead of re-running
+OCR, and the least recently used entries are evicted over the size limit.
+"""
+
+import os
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import app as app_module
+from app import ExtractionCache, app, cached_extraction, db, store_extraction
+
+
+def test_hit_and_miss():
+    with app.app_context():
+        assert cached_extraction('cache-hit', 'eng') is None
+        store_extraction('cache-hit', 'eng', 'Hemoglobin 11.2', {'hemoglobin_hb': '11.2'}, ['Anemia'])
+        assert cached_extraction('cache-hit', 'eng') == ('Hemoglobin 11.2', {'hemoglobin_hb': '11.2'}, ['Anemia'])
+        assert ExtractionCache.query.get(('cache-hit', 'eng')).hits == 1
+        # Same file OCR'd in another language is another extraction
+        assert cached_extraction('cache-hit', 'hin') is None
+
+
+def test_older_extractor_is_a_miss(monkeypatch):
+    with app.app_context():
+        store_extraction('cache-extractor', 'eng', 'TSH 2.5', {'tsh': '2.5'}, [])
+        monkeypatch.setattr(app_module, 'EXTRACTOR_VERSION', 'next')
+        assert cached_extraction('cache-extractor', 'eng') is None
+
+
+def test_parser_change_reparses_cached_text(monkeypatch):
+    with app.app_context():
+        store_extraction('cache-parser', 'eng', 'Iron 55', {'iron': '55'}, [])
+        db.session.commit()
+        monkeypatch.setattr(app_module, 'parser_version', lambda: 'newer-parser')
+        monkeypatch.setattr(app_module, 'parse_medical_values', lambda text: ({'iron': '55', 'reparsed': '1'}, []))
+        assert cached_extraction('cache-parser', 'eng') == ('Iron 55', {'iron': '55', 'reparsed': '1'}, [])
+        db.session.commit()
+        entry = ExtractionCache.query.get(('cache-parser', 'eng'))
+        assert entry.parser_version == 'newer-parser'
+
+
+def test_least_recently_used_entries_are_evicted(monkeypatch):
+    text = 'x' * 1000
+    with app.app_context():
+        store_extraction('cache-lru-1', 'eng', text, {}, [])
+        store_extraction('cache-lru-2', 'eng', text, {}, [])
+        # Reading the first entry makes the second the least recently used
+        cached_extraction('cache-lru-1', 'eng')
+        db.session.commit()
+        size = ExtractionCache.query.get(('cache-lru-1', 'eng')).size_bytes
+        monkeypatch.setattr(app_module, 'EXTRACTION_CACHE_MAX_BYTES', 2 * size)
+        store_extraction('cache-lru-3', 'eng', text, {}, [])
+        kept = {entry.content_hash for entry in ExtractionCache.query.all()}
+        assert {'cache-lru-1', 'cache-lru-3'} <= kept
+        assert 'cache-lru-2' not in kept
+        assert db.session.query(db.func.sum(ExtractionCache.size_bytes)).scalar() <= 2 * size
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+The app under gunicorn.conf.py's gevent patching: with socket, threading
+and select monkey-patched before the app is imported, the report-job pool
+still processes an upload in its spawned process, the notification
+listener still relays events to a stream, and the outbox drainer still
+pushes queued rows. Runs in a fresh interpreter, since patching is
+process-wide and irreversible.
+"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+SCRIPT = r'''
+import runpy
+import sys
+import time
+
+config = runpy.run_path('gunicorn.conf.py')
+from gevent import monkey
+assert config['worker_class'] == 'gevent' and config['threads'] == 2
+assert all(monkey.is_module_patched(name) for name in ('socket', 'threading', 'select'))
+
+import app as app_module
+from app import ReportJob, SupabaseOutbox, User, app, db, job_pool, notification_hub, outbox_drainer, requeue_report_jobs
+from benchmarks.corpus import SyntheticReport, write_text_pdf
+from outbox import enqueue
+
+
+def wait_for(check, seconds):
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        if check():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+with app.app_context():
+    user = User(username='gevent-patient', password='x', patient_id='GEVENT')
+    db.session.add(user)
+    db.session.commit()
+    user_id = user.id
+    pdf = sys.argv[1] + '/cbc.pdf'
+    write_text_pdf(pdf, SyntheticReport(pages=[['gevent check', 'Hemoglobin 11.2 g/dL']]))
+    db.session.add(ReportJob(id='gevent-job', user_id=user_id, filename='cbc.pdf', filepath=pdf,
+                             ocr_language='eng', status='queued'))
+    db.session.commit()
+
+# Report job: queued before start-up, processed in a spawned job process
+job_pool.start()
+requeue_report_jobs()
+
+
+def job_done():
+    with app.app_context():
+        status = db.session.get(ReportJob, 'gevent-job').status
+        db.session.remove()
+    assert status != 'failed'
+    return status == 'done'
+assert wait_for(job_done, 120), 'report job did not finish'
+
+# Notifications: an event published after subscribing reaches the stream
+stream = notification_hub.subscribe(user_id)
+notification_hub.publish(user_id, 'message', message_id=1, unread=1)
+received = stream.get(timeout=5)
+assert received and received['user_id'] == user_id
+
+# Outbox: a queued row is pushed by the drainer thread
+pushed = []
+app_module.supabase_service.push = lambda table_name, rows: pushed.append((table_name, rows))
+with app.app_context():
+    enqueue(db.session, SupabaseOutbox, 'messages', {'id': 1, 'content': 'hi'}, 'gevent-message-1')
+    db.session.commit()
+outbox_drainer.start()
+outbox_drainer.wake()
+# (along with the rows the report job queued)
+assert wait_for(lambda: ('messages', [{'id': 1, 'content': 'hi'}]) in pushed, 10), 'outbox row was not pushed'
+
+outbox_drainer.stop(1)
+notification_hub.stop(1)
+job_pool.shutdown()
+print('ok')
+'''
+
+
+def test_app_runs_under_gevent_patching(tmp_path):
+    env = {k: v for k, v in os.environ.items()
+           if not k.startswith(('SUPABASE_', 'GUNICORN_', 'NOTIFY_', 'PROMETHEUS_'))}
+    env.update({
+        'DATABASE_URL': f'sqlite:///{tmp_path}/app.db',
+        'REPORT_JOB_WORKERS': '1',
+        'METRICS_DIR': str(tmp_path / 'metrics'),
+        'NOTIFY_FEED_PATH': str(tmp_path / 'events.log'),
+        'NOTIFY_POLL_INTERVAL': '0.05',
+    })
+    result = subprocess.run([sys.executable, '-c', SCRIPT, str(tmp_path)], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert result.stdout.splitlines()[-1] == 'ok'
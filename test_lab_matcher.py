@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Check that the compiled lab-value matcher returns exactly what the old
+per-pattern regex loop in parse_medical_values returned.
+"""
+
+import re
+
+import pandas as pd
+
+from lab_matcher import ABBREVIATIONS, LabValueMatcher, parameter_key
+
+TEST_NAMES = list(pd.read_csv('medical_test_parameters.csv')['Test Name'])
+
+SAMPLES = [
+    'Hemoglobin: 13.5 g/dL\nRBC Count 4.8\nWBC = 7200\nPlatelets - 250000',
+    'HbA1c 6.1 %\nHb 11.2\nFasting Blood Sugar (FBS) : 98',
+    # Overlapping names: LDL inside VLDL, T3 inside Free T3, HDL inside the ratio
+    'VLDL 30\nLDL 120\nHDL 45\nTotal Cholesterol/HDL Ratio 4.2\nFree T3 3.1\nT3 1.2',
+    # Names inside ordinary words, and a unit word between name and value
+    'Fasting 12 hours. Salt intake normal. Environment: lab 3.\nIron mcg 80',
+    'hemoglobin 12.9\nHEMOGLOBIN 14.0\nSgot: 30 sgpt: 42 alp 90',
+    # Non-ASCII case folding (Kelvin sign, dotless i, long s)
+    '\u212a+ 4.1\n\u0131ron 55\n\u017fodium 140\nVitamin D 25-OH 31',
+    '',
+]
+
+
+def legacy_match(text):
+    values = {}
+    for param in TEST_NAMES:
+        patterns = []
+        for name in ABBREVIATIONS.get(param, [param]):
+            patterns.append(rf"{re.escape(name)}\s*[:=\-]?\s*([\d.]+)")
+            patterns.append(rf"{re.escape(name)}\s*[a-zA-Z]*\s*[:=\-]?\s*([\d.]+)")
+        for pat in patterns:
+            m = re.search(pat, text, re.IGNORECASE)
+            if m:
+                values[parameter_key(param)] = m.group(1)
+                break
+    return values
+
+
+def test_matches_legacy_loop():
+    matcher = LabValueMatcher(TEST_NAMES)
+    for text in SAMPLES:
+        assert matcher.match(text) == legacy_match(text)
+
+
+def test_overlapping_names_are_all_found():
+    positions = LabValueMatcher(TEST_NAMES).find_names('VLDL 30')
+    assert positions['VLDL'] == [0]
+    assert positions['LDL'] == [1]
+
+
+def test_reads_the_value_after_each_name():
+    text = ('Hemoglobin : 11.2 g/dL\nHbA1c - 6.1 %\nSerum Iron mcg 80\n'
+            'Total Cholesterol = 212\nTSH 2.5\nFree T4 1.1\nT4 8.0')
+    values = LabValueMatcher(TEST_NAMES).match(text)
+    assert values['hemoglobin_hb'] == '11.2'
+    assert values['hba1c'] == '6.1'
+    # A unit word may sit between the name and the value
+    assert values['iron'] == '80'
+    assert values['total_cholesterol'] == '212'
+    assert values['tsh'] == '2.5'
+    assert values['free_t4'] == '1.1'
+    # The first occurrence with a value wins: 'T4' inside 'Free T4' comes first
+    assert values['t4'] == '1.1'
+    assert 'vitamin_d_25_oh' not in values
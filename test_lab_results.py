@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Normalized lab results: every stored report also writes one LabResult row
+per numeric value, the dashboard trends and comparison are read from those
+rows, and backfill-lab-results converts older reports exactly once, even
+those without any numeric value or already holding rows.
+"""
+
+import json
+import os
+from datetime import datetime
+
+from werkzeug.security import generate_password_hash
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import app as app_module
+from app import HealthReport, LabResult, User, add_health_report, app, db
+
+
+def make_user(name):
+    with app.app_context():
+        user = User(username=name, password=generate_password_hash('pw'), patient_id=name.upper()[:16])
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def test_reports_dual_write_numeric_values():
+    user_id = make_user('lab-dual')
+    with app.app_context():
+        report = add_health_report(user_id, 'cbc.pdf', 'text', {'hemoglobin_hb': '11.2', 'iron': '.', 'tsh': '2.5'}, [])
+        db.session.commit()
+        assert report.lab_results_written
+        rows = {row.parameter_key: row for row in LabResult.query.filter_by(report_id=report.id)}
+        # '.' is not a number: it stays in extracted_values only
+        assert set(rows) == {'hemoglobin_hb', 'tsh'}
+        assert rows['hemoglobin_hb'].numeric_value == 11.2
+        assert rows['hemoglobin_hb'].unit == 'g/dL'
+        assert rows['tsh'].measured_at == report.timestamp
+
+
+def test_dashboard_trends_read_lab_results(monkeypatch):
+    user_id = make_user('lab-trends')
+    with app.app_context():
+        for day, hemoglobin in [(1, '10.5'), (2, '11.8')]:
+            add_health_report(user_id, f'{day}.pdf', '', {'hemoglobin_hb': hemoglobin}, [],
+                              timestamp=datetime(2024, 5, day))
+        # A value only in the JSON column is not part of the trends
+        report = add_health_report(user_id, '3.pdf', '', {}, [], timestamp=datetime(2024, 5, 3))
+        report.extracted_values = json.dumps({'hemoglobin_hb': '99'})
+        db.session.commit()
+    built = []
+    real = app_module.build_trend_series
+
+    def build(rows):
+        built.append(real(rows))
+        return built[-1]
+    monkeypatch.setattr(app_module, 'build_trend_series', build)
+    client = app.test_client()
+    client.post('/login', data={'username': 'lab-trends', 'password': 'pw'})
+    assert client.get('/dashboard').status_code == 200
+    trend_data, trend_labels, comparison = built[0]
+    assert trend_labels == ['2024-05-01', '2024-05-02']
+    assert trend_data == {'hemoglobin_hb': [10.5, 11.8]}
+    assert comparison == {'hemoglobin_hb': {'latest': 11.8, 'previous': 10.5, 'status': 'worse'}}
+
+
+def test_backfill_converts_each_report_once():
+    user_id = make_user('lab-backfill')
+    with app.app_context():
+        # Stored before dual-writes: no LabResult rows, not marked
+        legacy = HealthReport(user_id=user_id, filename='old.pdf', timestamp=datetime(2022, 1, 1),
+                              extracted_values=json.dumps({'total_cholesterol': '230', 'note': 'n/a'}))
+        empty = HealthReport(user_id=user_id, filename='blank.pdf', timestamp=datetime(2022, 2, 1),
+                             extracted_values='{}')
+        # Rows already written but the flag never set: marked, not written twice
+        unmarked = add_health_report(user_id, 'unmarked.pdf', '', {'hemoglobin_hb': '12.1'}, [],
+                                     timestamp=datetime(2022, 3, 1))
+        unmarked.lab_results_written = False
+        db.session.add_all([legacy, empty])
+        db.session.commit()
+        legacy_id, empty_id, unmarked_id = legacy.id, empty.id, unmarked.id
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['backfill-lab-results'])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        rows = LabResult.query.filter_by(report_id=legacy_id).all()
+        assert [(row.parameter_key, row.numeric_value) for row in rows] == [('total_cholesterol', 230.0)]
+        assert HealthReport.query.get(legacy_id).lab_results_written
+        assert HealthReport.query.get(empty_id).lab_results_written
+        assert LabResult.query.filter_by(report_id=unmarked_id).count() == 1
+        assert HealthReport.query.get(unmarked_id).lab_results_written
+    # Nothing left, including the report without numeric values
+    assert 'Done: 0 reports, 0 lab results' in runner.invoke(args=['backfill-lab-results']).output
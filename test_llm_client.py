@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Run the streaming OpenRouter client against a local stand-in server that
+speaks the chat-completions streaming protocol: chunked Server-Sent Events
+with keep-alive comments, one delta per event and "data: [DONE]" at the end.
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from llm_client import LLMError, OpenRouterClient
+
+REPLY = ['Your ', 'hemoglobin ', 'is ', 'low — ', 'eat more spinach.']
+
+
+class FakeOpenRouter(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive and chunked bodies, like the real API
+
+    def log_message(self, *args):
+        pass
+
+    def send_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append((self.client_address, self.headers['Authorization'], body))
+        question = body['messages'][-1]['content']
+        if 'status-error' in question:
+            message = b'{"error": {"message": "Rate limited"}}'
+            self.send_response(429)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(message)))
+            self.end_headers()
+            self.wfile.write(message)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self.send_chunk(': OPENROUTER PROCESSING\n\n')
+        first = {'choices': [{'delta': {'role': 'assistant', 'content': ''}}]}
+        self.send_chunk(f'data: {json.dumps(first)}\n\n')
+        for text in REPLY:
+            chunk = {'choices': [{'index': 0, 'delta': {'content': text}, 'finish_reason': None}]}
+            self.send_chunk(f'data: {json.dumps(chunk)}\n\n')
+        if 'stream-error' in question:
+            self.send_chunk('data: {"error": {"message": "Provider disconnected"}}\n\n')
+        self.send_chunk('data: {"choices": [{"delta": {}, "finish_reason": "stop"}]}\n\ndata: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), FakeOpenRouter)
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def client_for(server):
+    host, port = server.server_address
+    return OpenRouterClient(api_key='test-key', base_url=f'http://{host}:{port}/', model='test/model', timeout=5)
+
+
+def ask(question):
+    return [{'role': 'system', 'content': 'Be brief.'}, {'role': 'user', 'content': question}]
+
+
+def test_stream_yields_reply_chunks_in_order(server):
+    client = client_for(server)
+    assert list(client.stream_chat(ask('How is my iron?'))) == REPLY
+    (_, authorization, body), = server.requests
+    assert authorization == 'Bearer test-key'
+    assert body['stream'] is True and body['model'] == 'test/model'
+
+
+def test_session_reuses_connection(server):
+    client = client_for(server)
+    for _ in range(3):
+        assert ''.join(client.stream_chat(ask('again'))) == ''.join(REPLY)
+    assert len({address for address, _, _ in server.requests}) == 1
+
+
+def test_error_status_raises(server):
+    with pytest.raises(LLMError, match='429'):
+        list(client_for(server).stream_chat(ask('status-error')))
+
+
+def test_error_event_raises_after_partial_reply(server):
+    received = []
+    with pytest.raises(LLMError, match='Provider disconnected'):
+        for text in client_for(server).stream_chat(ask('stream-error')):
+            received.append(text)
+    assert received == REPLY
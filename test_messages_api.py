@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+/messages serves a page of each list with the sender/receiver and related
+report joined in: the number of SQL statements per request must not grow
+with the inbox. Also covers cursor paging, ?since= incremental fetches from
+a (timestamp, id) position, the maintained unread counter behind the
+dashboard badge, and the Supabase outbox row every new message is queued
+with.
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import HealthReport, InboxCounter, Message, SupabaseOutbox, User, app, db, notification_hub
+
+START = datetime(2024, 3, 1, 9, 0)
+
+
+def make_pair(name, count):
+    """A doctor and a patient with count messages each way, every third about a report"""
+    with app.app_context():
+        doctor = User(username=f'{name}-doctor', password=generate_password_hash('pw'),
+                      patient_id=f'{name}D'[:16], role='doctor')
+        patient = User(username=f'{name}-patient', password=generate_password_hash('pw'), patient_id=f'{name}P'[:16])
+        db.session.add_all([doctor, patient])
+        db.session.flush()
+        report = HealthReport(user_id=patient.id, filename=f'{name}.pdf')
+        db.session.add(report)
+        db.session.flush()
+        for i in range(count):
+            related = report.id if i % 3 == 0 else None
+            db.session.add(Message(sender_id=doctor.id, receiver_id=patient.id, content=f'note {i}',
+                                   timestamp=START + timedelta(minutes=i), related_report_id=related))
+            db.session.add(Message(sender_id=patient.id, receiver_id=doctor.id, content=f'reply {i}',
+                                   timestamp=START + timedelta(minutes=i, seconds=30)))
+        db.session.commit()
+    client = app.test_client()
+    client.post('/login', data={'username': f'{name}-patient', 'password': 'pw'})
+    return client
+
+
+def counted_get(client, path):
+    statements = []
+
+    def count(*args):
+        statements.append(args[2])
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            response = client.get(path)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+    assert response.status_code == 200
+    return response.get_json(), len(statements)
+
+
+def test_query_count_is_constant():
+    small, small_count = counted_get(make_pair('smallbox', 3), '/messages')
+    large, large_count = counted_get(make_pair('largebox', 60), '/messages')
+    assert len(small['received']) == 3 and len(large['received']) == 20
+    assert large['received'][0] == {'id': large['received'][0]['id'], 'content': 'note 59',
+                                    'timestamp': '2024-03-01 09:59', 'type': 'comment',
+                                    'related_report': None, 'sender': 'largebox-doctor', 'is_read': False}
+    assert large['sent'][0]['receiver'] == 'largebox-doctor'
+    assert large['received'][2]['related_report'] == 'largebox.pdf'
+    # The logged-in user, then one statement per list
+    assert small_count == large_count == 3
+
+
+def test_cursor_pages_cover_inbox_once():
+    client = make_pair('pagedbox', 45)
+    seen = []
+    page, _ = counted_get(client, '/messages?box=received&limit=20')
+    while True:
+        seen.extend(msg['content'] for msg in page['items'])
+        if not page['next_cursor']:
+            break
+        page, statements = counted_get(client, f"/messages?box=received&limit=20&cursor={page['next_cursor']}")
+        assert statements == 2
+    assert seen == [f'note {i}' for i in reversed(range(45))]
+
+
+def test_since_returns_only_newer_messages():
+    client = make_pair('sincebox', 5)
+    first, _ = counted_get(client, '/messages')
+    assert counted_get(client, f"/messages?since={first['since']}")[0] == {
+        'since': first['since'], 'more': False, 'received': [], 'sent': [],
+        'next_received_cursor': None, 'next_sent_cursor': None}
+    with app.app_context():
+        doctor = User.query.filter_by(username='sincebox-doctor').one()
+        patient = User.query.filter_by(username='sincebox-patient').one()
+        db.session.add(Message(sender_id=doctor.id, receiver_id=patient.id, content='new result',
+                               timestamp=START + timedelta(hours=1)))
+        db.session.commit()
+    update, _ = counted_get(client, f"/messages?since={first['since']}")
+    assert [msg['content'] for msg in update['received']] == ['new result'] and update['sent'] == []
+    assert counted_get(client, f"/messages?since={update['since']}")[0]['received'] == []
+
+
+def test_since_pages_never_skip_messages():
+    client = make_pair('burstbox', 1)
+    since = counted_get(client, '/messages')[0]['since']
+    with app.app_context():
+        doctor = User.query.filter_by(username='burstbox-doctor').one()
+        patient = User.query.filter_by(username='burstbox-patient').one()
+
+    def arrive(contents, sent_by_patient=False):
+        # Same timestamp for the whole burst: only the id orders them
+        with app.app_context():
+            sender, receiver = (patient, doctor) if sent_by_patient else (doctor, patient)
+            db.session.add_all([Message(sender_id=sender.id, receiver_id=receiver.id, content=content,
+                                        timestamp=START + timedelta(hours=2)) for content in contents])
+            db.session.commit()
+
+    arrive([f'burst {i}' for i in range(5)])
+    arrive(['my reply'], sent_by_patient=True)
+    received, sent = [], []
+    for step in range(10):
+        page, statements = counted_get(client, f'/messages?since={since}&limit=2')
+        assert statements == 3
+        received.extend(msg['content'] for msg in page['received'])
+        sent.extend(msg['content'] for msg in page['sent'])
+        since = page['since']
+        if step == 0:
+            # More arrive in the same second while the client is catching up
+            arrive(['late 0', 'late 1'])
+        if not page['more']:
+            break
+    assert received == [f'burst {i}' for i in range(5)] + ['late 0', 'late 1']
+    assert sent == ['my reply']
+    box_page, _ = counted_get(client, f'/messages?box=received&since={since}')
+    assert (box_page['items'], box_page['next_cursor'], box_page['more']) == ([], None, False)
+
+
+@pytest.mark.parametrize('query', ['box=archive', 'box=sent&cursor=nonsense', 'since=yesterday',
+                                   'since=2024-03-01T09:00:00'])
+def test_bad_parameters_are_rejected(query):
+    client = make_pair(f'bad{len(query)}', 1)
+    assert client.get(f'/messages?{query}').status_code == 400
+
+
+def test_unread_counter_follows_sends_and_reads(monkeypatch):
+    client = make_pair('countbox', 2)
+    published = []
+    monkeypatch.setattr(notification_hub, 'publish', lambda user_id, kind, **data: published.append((kind, data)))
+    # Built from the messages on first use
+    received, _ = counted_get(client, '/messages?box=received')
+    with app.app_context():
+        patient = User.query.filter_by(username='countbox-patient').one()
+        doctor_id = User.query.filter_by(username='countbox-doctor').one().id
+        assert InboxCounter.query.get(patient.id) is None
+    doctor = app.test_client()
+    doctor.post('/login', data={'username': 'countbox-doctor', 'password': 'pw'})
+    doctor.post('/send-message', json={'receiver_id': patient.id, 'content': 'new plan'})
+    assert published[-1][1]['unread'] == 3
+    # Marking the same message twice (e.g. from two tabs) counts once
+    first_id = received['items'][0]['id']
+    assert client.post(f'/mark-message-read/{first_id}').get_json() == {'success': True, 'unread': 2}
+    assert client.post(f'/mark-message-read/{first_id}').get_json() == {'success': True, 'unread': 2}
+    assert [kind for kind, _ in published] == ['message', 'read']
+    with app.app_context():
+        assert InboxCounter.query.get(patient.id).unread == 2
+        assert InboxCounter.query.get(doctor_id) is None
+
+
+def test_doctor_comment_is_queued_for_supabase(monkeypatch):
+    make_pair('commentbox', 0)
+    monkeypatch.setattr(notification_hub, 'publish', lambda user_id, kind, **data: None)
+    with app.app_context():
+        patient_id = User.query.filter_by(username='commentbox-patient').one().id
+        report_id = HealthReport.query.filter_by(filename='commentbox.pdf').one().id
+    doctor = app.test_client()
+    doctor.post('/login', data={'username': 'commentbox-doctor', 'password': 'pw'})
+    assert doctor.post(f'/doctor/comment/{report_id}', data={'doctor_comment': 'Recheck iron'}).status_code == 302
+    with app.app_context():
+        message = Message.query.filter_by(related_report_id=report_id).one()
+        row = SupabaseOutbox.query.filter_by(idempotency_key=f'messages:{message.id}').one()
+        payload = json.loads(row.payload)
+        assert (row.table_name, row.status) == ('messages', 'pending')
+        assert (payload['recipient_id'], payload['subject']) == (patient_id, 'comment')
+        assert payload['content'] == "Doctor's Comment on commentbox.pdf: Recheck iron"
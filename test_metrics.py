@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Request instrumentation: every request records its latency, SQL statement
+count and SQL time per route, calls out (LLM, Supabase, extraction) add to
+the request's breakdown, slow requests log it as a warning, /metrics needs
+its token outside debug mode, and with a multiprocess directory /metrics
+adds up the samples of every process.
+"""
+
+import logging
+import os
+import subprocess
+import sys
+
+import pytest
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import metrics
+from app import app
+from prometheus_client import REGISTRY
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_requests_record_latency_and_sql_per_route(monkeypatch):
+    monkeypatch.setitem(app.config, 'TESTING', True)
+    client = app.test_client()
+    before = sample('nutripattern_http_request_duration_seconds_count', route='/login', method='POST', status='200')
+    queries_before = sample('nutripattern_db_queries_per_request_sum', route='/login')
+    client.post('/login', data={'username': 'nobody', 'password': 'x'})
+    assert sample('nutripattern_http_request_duration_seconds_count',
+                  route='/login', method='POST', status='200') == before + 1
+    # The user lookup
+    assert sample('nutripattern_db_queries_per_request_sum', route='/login') >= queries_before + 1
+    client.get('/no-such-page')
+    assert sample('nutripattern_http_request_duration_seconds_count',
+                  route='<unmatched>', method='GET', status='404') >= 1
+    response = client.get('/metrics')
+    assert response.content_type.startswith('text/plain')
+    assert b'nutripattern_http_request_duration_seconds_bucket{le="0.005",method="POST",route="/login"' in response.data
+
+
+def test_metrics_token(monkeypatch):
+    client = app.test_client()
+    # Production (no debug, no testing): off without a token
+    monkeypatch.delenv('METRICS_TOKEN', raising=False)
+    assert client.get('/metrics').status_code == 404
+    monkeypatch.setenv('METRICS_TOKEN', 'secret')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+
+def test_slow_request_breakdown(monkeypatch, caplog):
+    caplog.set_level(logging.WARNING, logger='metrics')
+    monkeypatch.setattr(metrics, 'SLOW_REQUEST_SECONDS', 1e-9)
+    metrics.start_request()
+    metrics.observe('extraction', 0.25, stage='pdf_ocr')
+    with pytest.raises(TimeoutError):
+        with metrics.timed('llm', mode='complete'):
+            raise TimeoutError
+    metrics.finish_request('POST', '/upload', 200)
+    [record] = caplog.records
+    line = record.getMessage()
+    assert record.levelno == logging.WARNING
+    assert line.startswith('Slow request POST /upload -> 200 in ')
+    assert 'sql 0 queries' in line and 'extraction pdf_ocr 250 ms' in line and 'llm complete' in line
+    assert sample('nutripattern_llm_request_seconds_count', mode='complete', outcome='error') >= 1
+    assert sample('nutripattern_slow_requests_total', route='/upload', method='POST') >= 1
+    # Outside a request only the histograms are recorded
+    metrics.observe('extraction', 0.1, stage='pdf_ocr')
+    metrics.finish_request('GET', '/', 200)
+    assert len(caplog.records) == 1
+
+
+def test_multiprocess_directory_aggregates_processes(tmp_path):
+    env = {**os.environ, 'PROMETHEUS_MULTIPROC_DIR': str(tmp_path)}
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    record = "import metrics; metrics.observe('supabase', 0.2, operation='upsert', table='users', outcome='ok')"
+    for _ in range(2):
+        subprocess.run([sys.executable, '-c', record], cwd=cwd, env=env, check=True)
+    result = subprocess.run([sys.executable, '-c', 'import metrics; print(metrics.render()[0].decode())'],
+                            cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    assert ('nutripattern_supabase_request_seconds_count{operation="upsert",outcome="ok",table="users"} 2.0'
+            in result.stdout)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Message notifications between workers: events published through the file
+feed by one hub reach the subscribed streams of another, only for their own
+user, across a rotation of the feed file, including an event published the
+moment the first stream subscribes; a stalled stream keeps its newest events
+without blocking the listener.
+"""
+
+import threading
+import time
+
+from notifications import FileFeed, NotificationHub, Subscription, feed_from_env
+
+
+def make_hub(path):
+    return NotificationHub(FileFeed(str(path), poll_interval=0.01, max_bytes=200), keepalive=1, stream_seconds=1)
+
+
+def test_events_reach_other_workers(tmp_path):
+    path = tmp_path / 'events.log'
+    writer, reader = make_hub(path), make_hub(path)
+    try:
+        patient = reader.subscribe(7)
+        other = reader.subscribe(8)
+        for n in range(10):
+            writer.publish(7, 'message', message_id=n, unread=n + 1)
+            time.sleep(0.03)
+        received = [patient.get(timeout=2) for _ in range(10)]
+        assert [event['message_id'] for event in received] == list(range(10))
+        assert received[-1] == {'user_id': 7, 'type': 'message', 'message_id': 9, 'unread': 10}
+        assert other.get(timeout=0.1) is None
+        # max_bytes=200 rotated the file several times along the way
+        assert (tmp_path / 'events.log.1').exists()
+        assert reader.stats() == {'users': 2, 'streams': 2, 'published': 0, 'delivered': 10}
+    finally:
+        writer.stop(1)
+        reader.stop(1)
+
+
+def test_event_right_after_first_subscribe_arrives(tmp_path):
+    path = tmp_path / 'events.log'
+    writer, reader = make_hub(path), make_hub(path)
+    writer.publish(5, 'message', message_id=0, unread=1)
+    feed_open = reader.feed._open
+
+    def slow_open(at_end):
+        # A listener thread that is slow to start, e.g. on a busy worker
+        time.sleep(0.3)
+        return feed_open(at_end)
+    reader.feed._open = slow_open
+    try:
+        stream = reader.subscribe(5)
+        writer.publish(5, 'message', message_id=1, unread=2)
+        assert stream.get(timeout=2)['message_id'] == 1
+        assert stream.get(timeout=0.1) is None
+    finally:
+        writer.stop(1)
+        reader.stop(1)
+
+
+def test_closed_stream_stops_receiving(tmp_path):
+    hub = make_hub(tmp_path / 'events.log')
+    try:
+        first, second = hub.subscribe(3), hub.subscribe(3)
+        first.close()
+        hub.dispatch({'user_id': 3, 'type': 'read', 'unread': 0})
+        assert first.get(timeout=0.01) is None
+        assert second.get(timeout=0.01)['type'] == 'read'
+        second.close()
+        assert hub.stats()['streams'] == 0
+    finally:
+        hub.stop(1)
+
+
+def test_stalled_stream_keeps_newest_events():
+    subscription = Subscription(hub=None, user_id=1, maxsize=3)
+    done = threading.Event()
+
+    def flood():
+        for n in range(10):
+            subscription.put({'n': n})
+        done.set()
+
+    threading.Thread(target=flood).start()
+    assert done.wait(1)
+    assert [subscription.get(timeout=0)['n'] for _ in range(3)] == [7, 8, 9]
+
+
+def test_backend_follows_database(tmp_path, monkeypatch):
+    monkeypatch.delenv('NOTIFY_BACKEND', raising=False)
+    monkeypatch.delenv('NOTIFY_FEED_PATH', raising=False)
+    feed = feed_from_env('postgresql+psycopg2://app:pw@db/health', 'unused')
+    assert feed.dsn == 'postgresql://app:pw@db/health'
+    assert feed_from_env('sqlite:///healthapp.db', str(tmp_path / 'events.log')).path == str(tmp_path / 'events.log')
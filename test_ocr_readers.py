@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+The per-process EasyOCR reader pool: one reader per language, built once
+even when several threads ask at the same time, unsupported languages
+fail fast, and readers are only pre-warmed when OCR_READER_INIT=eager.
+"""
+
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+from ocr_readers import EasyOCRReaderPool
+
+
+@pytest.fixture
+def easyocr(monkeypatch):
+    """Stand-in easyocr module that records every Reader it builds"""
+    built = []
+
+    class Reader:
+        def __init__(self, langs):
+            if langs == ['xx']:
+                raise ValueError('xx is not supported')
+            time.sleep(0.05)  # Model loading, so concurrent callers overlap
+            built.append(langs)
+            self.langs = langs
+
+        def readtext(self, image, detail=1):
+            return [f'{self.langs[0]}:{image}']
+
+    module = types.SimpleNamespace(Reader=Reader, built=built)
+    monkeypatch.setitem(sys.modules, 'easyocr', module)
+    return module
+
+
+def test_one_reader_per_language(easyocr):
+    pool = EasyOCRReaderPool()
+    # Tesseract codes map to EasyOCR ones, so 'eng' and 'en' share a reader
+    assert pool.get('eng') is pool.get('en')
+    assert pool.readtext('hin', 'page.png', detail=0) == ['hi:page.png']
+    assert easyocr.built == [['en'], ['hi']]
+    assert pool.loaded_languages() == ['en', 'hi']
+
+
+def test_concurrent_first_use_builds_once(easyocr):
+    pool = EasyOCRReaderPool()
+    readers = []
+    threads = [threading.Thread(target=lambda: readers.append(pool.get('eng'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert easyocr.built == [['en']]
+    assert all(reader is readers[0] for reader in readers)
+
+
+def test_unsupported_language_fails_fast(easyocr, monkeypatch):
+    pool = EasyOCRReaderPool()
+    with pytest.raises(ValueError, match='not supported'):
+        pool.get('xx')
+    # Remembered: the second attempt doesn't try to load models again
+    monkeypatch.setattr(easyocr, 'Reader', None)
+    with pytest.raises(ValueError, match='not supported'):
+        pool.get('xx')
+
+
+def test_warm_up_only_when_eager(easyocr, monkeypatch):
+    pytest.importorskip('numpy')
+    pool = EasyOCRReaderPool()
+    monkeypatch.delenv('OCR_READER_INIT', raising=False)
+    pool.warm_up_from_env()
+    assert easyocr.built == []
+    monkeypatch.setenv('OCR_READER_INIT', 'eager')
+    monkeypatch.setenv('OCR_PRELOAD_LANGS', 'eng, tel')
+    pool.warm_up_from_env()
+    assert pool.loaded_languages() == ['en', 'te']
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Drain the Supabase outbox into a local fake of the Supabase table client:
+bulk upserts per table in parent-first order, idempotent replays, isolation
+of a bad row, backoff and dead-lettering, claims between drainers, and
+pruning of sent rows.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from postgrest.exceptions import APIError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, declarative_base
+
+from outbox import OutboxMixin, backoff_seconds, drain, enqueue, prune_sent, push_rows
+
+Base = declarative_base()
+
+
+class Outbox(OutboxMixin, Base):
+    __tablename__ = 'outbox'
+
+
+class FakeQuery:
+    def __init__(self, client, table_name, rows, options):
+        self.client, self.table_name, self.rows, self.options = client, table_name, rows, options
+
+    def execute(self):
+        self.client.calls.append((self.table_name, len(self.rows)))
+        if self.client.offline:
+            raise ConnectionError('network is unreachable')
+        # Like PostgREST, a rejected row fails the whole request
+        for row in self.rows:
+            if row.get('username') == 'bad' or (self.table_name == 'health_reports'
+                                                 and row['user_id'] not in self.client.tables['users']):
+                raise APIError({'message': 'violates constraint', 'code': '23503'})
+        stored = self.client.tables.setdefault(self.table_name, {})
+        for row in self.rows:
+            # on_conflict='id', ignore_duplicates=True: existing rows are left alone
+            stored.setdefault(row['id'], row)
+
+
+class FakeTable:
+    def __init__(self, client, name):
+        self.client, self.name = client, name
+
+    def upsert(self, rows, **options):
+        assert options['on_conflict'] == 'id' and options['ignore_duplicates'] is True
+        return FakeQuery(self.client, self.name, rows, options)
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.tables = {'users': {}}
+        self.calls = []
+        self.offline = False
+
+    def table(self, name):
+        return FakeTable(self, name)
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def push_to(client):
+    return lambda table_name, rows: push_rows(client, table_name, rows)
+
+
+def add_user(session, user_id, username='u'):
+    enqueue(session, Outbox, 'users', {'id': user_id, 'username': username}, f'users:{user_id}')
+
+
+def add_report(session, report_id, user_id):
+    enqueue(session, Outbox, 'health_reports', {'id': report_id, 'user_id': user_id}, f'health_reports:{report_id}')
+
+
+def make_due(session):
+    session.query(Outbox).update({'next_attempt_at': datetime.utcnow() - timedelta(seconds=1)})
+    session.commit()
+
+
+def test_bulk_push_parents_first(session):
+    client = FakeSupabase()
+    # Reports queued before their users still arrive after them
+    add_report(session, 10, 1)
+    add_report(session, 11, 2)
+    add_user(session, 1)
+    add_user(session, 2)
+    session.commit()
+    assert drain(session, Outbox, push_to(client), batch_size=10) == 4
+    assert client.calls == [('users', 2), ('health_reports', 2)]
+    assert set(client.tables['health_reports']) == {10, 11}
+    assert {row.status for row in session.query(Outbox)} == {'sent'}
+    assert drain(session, Outbox, push_to(client)) == 0
+
+
+def test_replayed_batch_is_idempotent(session):
+    client = FakeSupabase()
+    add_user(session, 1, 'first')
+    session.commit()
+    drain(session, Outbox, push_to(client))
+    # A drainer that died after pushing but before committing leaves the row pending
+    session.query(Outbox).update({'status': 'pending'})
+    make_due(session)
+    drain(session, Outbox, push_to(client))
+    assert client.tables['users'] == {1: {'id': 1, 'username': 'first'}}
+
+
+def test_bad_row_is_isolated(session):
+    client = FakeSupabase()
+    add_user(session, 1)
+    add_user(session, 2, 'bad')
+    add_user(session, 3)
+    session.commit()
+    drain(session, Outbox, push_to(client), max_attempts=3)
+    assert set(client.tables['users']) == {1, 3}
+    bad = session.query(Outbox).filter_by(idempotency_key='users:2').one()
+    assert (bad.status, bad.attempts) == ('pending', 1)
+    assert 'violates constraint' in bad.last_error
+    assert bad.next_attempt_at > datetime.utcnow()
+    for _ in range(2):
+        make_due(session)
+        drain(session, Outbox, push_to(client), max_attempts=3)
+    assert session.get(Outbox, bad.id).status == 'dead'
+
+
+def test_offline_retries_whole_batch_later(session):
+    client = FakeSupabase()
+    client.offline = True
+    add_user(session, 1)
+    add_user(session, 2)
+    session.commit()
+    drain(session, Outbox, push_to(client))
+    assert client.calls == [('users', 2)]  # no per-row retries against a dead network
+    assert {(row.status, row.attempts) for row in session.query(Outbox)} == {('pending', 1)}
+    assert drain(session, Outbox, push_to(client)) == 0  # backing off
+    client.offline = False
+    make_due(session)
+    drain(session, Outbox, push_to(client))
+    assert set(client.tables['users']) == {1, 2}
+
+
+def test_claimed_rows_are_skipped_by_other_drainers(session):
+    client = FakeSupabase()
+    add_user(session, 1)
+    session.commit()
+    pushed = []
+
+    def push_while_another_drains(table_name, rows):
+        # The same rows are not due for a second drainer while claimed
+        assert drain(session, Outbox, push_to(client)) == 0
+        pushed.append(rows)
+
+    assert drain(session, Outbox, push_while_another_drains) == 1
+    assert len(pushed) == 1
+
+
+def test_backoff_grows_and_is_capped():
+    assert 5 <= backoff_seconds(1) <= 10
+    assert 20 <= backoff_seconds(3) <= 40
+    assert backoff_seconds(30) <= 3600
+
+
+def test_sent_rows_are_pruned_after_retention(session):
+    client = FakeSupabase()
+    add_user(session, 1)
+    add_user(session, 2, 'bad')
+    session.commit()
+    drain(session, Outbox, push_to(client), max_attempts=1)
+    assert prune_sent(session, Outbox, retention_hours=1) == 0
+    session.query(Outbox).filter_by(status='sent').update({'sent_at': datetime.utcnow() - timedelta(hours=2)})
+    session.commit()
+    assert prune_sent(session, Outbox, retention_hours=1) == 1
+    # The dead row stays for inspection
+    assert [(row.idempotency_key, row.status) for row in session.query(Outbox)] == [('users:2', 'dead')]
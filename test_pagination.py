@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Check that walking keyset pages returns every row exactly once, in
+(timestamp, id) newest-first order, including rows that share a timestamp.
+"""
+
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import Column, Date, DateTime, Integer, create_engine
+from sqlalchemy.orm import Session, declarative_base
+
+from pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_page, page_size
+
+Base = declarative_base()
+
+
+class Entry(Base):
+    __tablename__ = 'entry'
+    id = Column(Integer, primary_key=True)
+    timestamp = Column(DateTime)
+    day = Column(Date)
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        start = datetime(2024, 1, 1)
+        # Three rows per timestamp so page boundaries fall inside ties
+        session.add_all(Entry(timestamp=start + timedelta(hours=i // 3), day=date(2024, 1, 1) + timedelta(days=i // 3))
+                        for i in range(47))
+        session.commit()
+        yield session
+
+
+def walk(query, sort_column, limit, kind=datetime):
+    seen, cursor = [], None
+    while True:
+        rows, cursor = keyset_page(query, sort_column, Entry.id, cursor=cursor, limit=limit, kind=kind)
+        seen.extend(rows)
+        if cursor is None:
+            return seen
+
+
+def test_pages_cover_everything_in_order(session):
+    expected = session.query(Entry).order_by(Entry.timestamp.desc(), Entry.id.desc()).all()
+    for limit in (1, 2, 5, 20, 47, 100):
+        assert walk(session.query(Entry), Entry.timestamp, limit) == expected
+
+
+def test_date_sort_column(session):
+    expected = session.query(Entry).order_by(Entry.day.desc(), Entry.id.desc()).all()
+    assert walk(session.query(Entry), Entry.day, 4, kind=date) == expected
+
+
+def test_last_page_has_no_cursor(session):
+    rows, cursor = keyset_page(session.query(Entry), Entry.timestamp, Entry.id, limit=47)
+    assert len(rows) == 47 and cursor is None
+
+
+def test_cursor_round_trip_and_validation():
+    moment = datetime(2024, 5, 6, 7, 8, 9, 123456)
+    assert decode_cursor(encode_cursor(moment, 42)) == (moment, 42)
+    for bad in ('', 'not-a-cursor', encode_cursor(moment, 1)[:-3]):
+        with pytest.raises(InvalidCursor):
+            decode_cursor(bad)
+
+
+def test_page_size_is_clamped():
+    assert page_size(None) == 20
+    assert page_size('5') == 5
+    assert page_size('0') == 1
+    assert page_size('100000') == 100
+    assert page_size('abc') == 20
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Bulk patient import: CSV validation per row (including the profile columns
+Supabase requires, and doctor rows only when allowed), and the
+import-patients command inserting chunks with unique patient IDs and hashed
+passwords while skipping bad rows and usernames that are already registered.
+"""
+
+import io
+import json
+import os
+
+import pytest
+from werkzeug.security import check_password_hash
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import SupabaseOutbox, User, app, db, generate_patient_ids
+from patient_import import ImportFileError, read_patient_chunks
+
+CSV = """username,password,age,gender,height,weight,goal,role
+asha,pw-asha,34,female,160,58,diabetes_control,
+ravi,pw-ravi,45,male,172,70,,
+bad-age,pw,thirty,female,150,50,,
+asha,pw-again,35,female,160,58,,
+no-password,,40,male,170,70,,
+meera,pw-meera,51,female,155,62,muscle_gain,
+kiran,pw-kiran,28,male,180,80,sleeping,
+no-gender,pw-ng,30,,165,60,,
+dr-rao,pw-rao,50,male,175,75,,doctor
+"""
+
+
+def test_rows_are_validated_per_line():
+    chunks = list(read_patient_chunks(io.StringIO(CSV), chunk_size=3))
+    assert [[p['username'] for p in patients] for patients, _ in chunks] == [['asha', 'ravi'], ['meera'], []]
+    errors = [error for _, chunk_errors in chunks for error in chunk_errors]
+    assert [line for line, _ in errors] == [4, 5, 6, 8, 9, 10]
+    assert errors[1] == (5, "duplicate username 'asha'")
+    # Supabase's users table needs the profile columns, and doctors need the explicit flag
+    assert errors[4:] == [(9, 'gender is required'), (10, 'doctor accounts are only imported with --allow-doctors')]
+    assert chunks[0][0][1] == {'username': 'ravi', 'password': 'pw-ravi', 'age': 45, 'gender': 'male',
+                               'height': 172.0, 'weight': 70.0, 'goal': 'weight_loss', 'role': 'user'}
+    with_doctors = list(read_patient_chunks(io.StringIO(CSV), chunk_size=10, allow_doctors=True))
+    assert with_doctors[0][0][-1]['role'] == 'doctor'
+    missing_age = 'username,password,age,gender,height,weight\nsam,pw,,male,170,70\n'
+    assert next(read_patient_chunks(io.StringIO(missing_age), chunk_size=10))[1] == [(2, 'age is required')]
+    with pytest.raises(ImportFileError):
+        next(read_patient_chunks(io.StringIO('username,password,age\nasha,pw,34\n'), chunk_size=10))
+
+
+def test_import_command(tmp_path):
+    path = tmp_path / 'patients.csv'
+    path.write_text(CSV)
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['import-patients', str(path), '--chunk-size', '2', '--workers', '0'])
+    assert result.exit_code == 0, result.output
+    assert 'Done: 3 imported, 6 skipped' in result.output
+    with app.app_context():
+        users = {u.username: u for u in User.query.filter(User.username.in_(['asha', 'ravi', 'meera']))}
+        assert check_password_hash(users['asha'].password, 'pw-asha')
+        assert users['meera'].goal == 'muscle_gain' and users['asha'].age == 34
+        assert len({u.patient_id for u in users.values()}) == 3
+        assert all(len(u.patient_id) == 8 for u in users.values())
+        assert all(u.role == 'user' for u in users.values())
+        row = SupabaseOutbox.query.filter(SupabaseOutbox.idempotency_key == f"users:{users['ravi'].id}").one()
+        assert all(json.loads(row.payload)[column] is not None for column in ('age', 'gender', 'height', 'weight'))
+        assert User.query.filter_by(username='dr-rao').count() == 0
+    # Re-running the file adds nothing
+    again = runner.invoke(args=['import-patients', str(path), '--workers', '0'])
+    assert 'Done: 0 imported, 9 skipped' in again.output
+    # Doctors only when asked for
+    doctors = runner.invoke(args=['import-patients', str(path), '--workers', '0', '--allow-doctors'])
+    assert 'Done: 1 imported, 8 skipped' in doctors.output
+    with app.app_context():
+        assert User.query.filter_by(username='dr-rao').one().role == 'doctor'
+
+
+def test_generated_patient_ids_avoid_existing(monkeypatch):
+    import app as app_module
+    candidates = iter(['TAKEN001', 'TAKEN001', 'FRESH002', 'FRESH003'])
+    monkeypatch.setattr(app_module, 'random_patient_id', lambda: next(candidates))
+    with app.app_context():
+        db.session.add(User(username='id-holder', password='x', patient_id='TAKEN001'))
+        db.session.commit()
+        assert sorted(generate_patient_ids(2)) == ['FRESH002', 'FRESH003']
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Scanned-PDF OCR: pages are OCR'd in parallel on at most OCR_PAGE_WORKERS
+threads, texts come back in page order whatever order they finish in, and
+per-page timings are reported. In a mixed PDF only the pages without a
+text layer are OCR'd, and a page whose OCR fails keeps the rest of the
+report.
+"""
+
+import threading
+import time
+
+import pytest
+
+import pdf_ocr
+from benchmarks.corpus import SyntheticReport, write_text_pdf
+
+TYPED_PAGE = ['CITY DIAGNOSTICS - Complete Blood Count', 'Hemoglobin : 11.2 g/dL', 'WBC Count : 7200 /uL']
+
+
+def fake_ocr(delays, running):
+    """Stand-in for ocr_pdf_page: sleeps delays[page] and tracks how many pages run at once"""
+    lock = threading.Lock()
+
+    def ocr(filepath, page_number, lang='eng', dpi=None):
+        with lock:
+            running['now'] += 1
+            running['max'] = max(running['max'], running['now'])
+        time.sleep(delays.get(page_number, 0.01))
+        with lock:
+            running['now'] -= 1
+        return f'{lang} page {page_number}'
+    return ocr
+
+
+def test_pages_come_back_in_order(monkeypatch):
+    running = {'now': 0, 'max': 0}
+    # Later pages finish first
+    monkeypatch.setattr(pdf_ocr, 'ocr_pdf_page', fake_ocr({1: 0.15, 2: 0.1, 3: 0.05}, running))
+    timings = {}
+    texts = pdf_ocr.ocr_pdf_pages('scan.pdf', [1, 2, 3, 5], lang='hin', workers=3, timings=timings)
+    assert texts == ['hin page 1', 'hin page 2', 'hin page 3', 'hin page 5']
+    assert sorted(timings) == [1, 2, 3, 5]
+    assert timings[1] >= 0.15
+    assert running['max'] == 3
+
+
+def test_page_workers_bound_concurrency(monkeypatch):
+    running = {'now': 0, 'max': 0}
+    monkeypatch.setattr(pdf_ocr, 'ocr_pdf_page', fake_ocr({}, running))
+    monkeypatch.setenv('OCR_PAGE_WORKERS', '2')
+    assert len(pdf_ocr.ocr_pdf_pages('scan.pdf', range(1, 9))) == 8
+    assert running['max'] == 2
+    assert pdf_ocr.ocr_pdf_pages('scan.pdf', []) == []
+
+
+@pytest.fixture
+def mixed_pdf(tmp_path):
+    """Typed page, near-empty (scanned) page, typed page"""
+    pytest.importorskip('pdfplumber')
+    report = SyntheticReport(pages=[TYPED_PAGE, ['2'], ['Cholesterol : 190 mg/dL, fasting sample, verified']])
+    return write_text_pdf(str(tmp_path / 'mixed.pdf'), report)
+
+
+def test_only_pages_without_text_are_ocrd(monkeypatch, mixed_pdf):
+    requested = []
+
+    def ocr(filepath, page_number, lang='eng', dpi=None):
+        requested.append(page_number)
+        return 'Platelet Count : 250000'
+    monkeypatch.setattr(pdf_ocr, 'ocr_pdf_page', ocr)
+    timings = []
+    text = pdf_ocr.extract_pdf_text(mixed_pdf, page_timings=timings)
+    assert requested == [2]
+    assert 'Hemoglobin : 11.2' in text and 'Platelet Count : 250000' in text and 'Cholesterol : 190' in text
+    assert [entry['method'] for entry in timings] == ['text', 'ocr', 'text']
+    assert not any('error' in entry for entry in timings)
+
+
+def test_failed_ocr_page_keeps_the_text_layer(monkeypatch, mixed_pdf):
+    def ocr(filepath, page_number, lang='eng', dpi=None):
+        raise OSError('tesseract is not installed')
+    monkeypatch.setattr(pdf_ocr, 'ocr_pdf_page', ocr)
+    timings = []
+    text = pdf_ocr.extract_pdf_text(mixed_pdf, page_timings=timings)
+    assert 'Hemoglobin : 11.2' in text and 'Cholesterol : 190' in text
+    assert timings[1]['method'] == 'ocr'
+    assert timings[1]['error'] == 'OSError: tesseract is not installed'
+
+
+def test_all_pages_failing_ocr_raises(monkeypatch, tmp_path):
+    pytest.importorskip('pdfplumber')
+    path = write_text_pdf(str(tmp_path / 'scan.pdf'), SyntheticReport(pages=[['1'], ['2']]))
+
+    def ocr(filepath, page_number, lang='eng', dpi=None):
+        raise OSError('tesseract is not installed')
+    monkeypatch.setattr(pdf_ocr, 'ocr_pdf_page', ocr)
+    with pytest.raises(RuntimeError, match='OCR failed for every page: OSError: tesseract'):
+        pdf_ocr.extract_pdf_text(path)
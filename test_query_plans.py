@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+The hot routes must read through indexes. Each route below runs against a
+seeded database while every SELECT it issues is captured, then each one is
+EXPLAINed with the same parameters: no full scan of a per-user table and no
+separate sort for its ORDER BY.
+
+Runs on the in-memory SQLite database by default. Point DATABASE_URL at a
+scratch Postgres database to check the same routes' plans there (sequential
+scans are disabled for the EXPLAIN, so any "Seq Scan" means no usable index).
+"""
+
+import os
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import (ActivityLog, ChatHistory, HealthReport, Message, ReportJob, User, add_lab_results, app, db)
+from migrations import MIGRATIONS, current_version
+
+HOT_TABLES = ('health_report', 'lab_result', 'activity_log', 'chat_history', 'message', 'report_job')
+
+
+@pytest.fixture(scope='module')
+def seeded():
+    with app.app_context():
+        doctor = User(username='plan-doctor', password=generate_password_hash('pw'), patient_id='PLANDOC1', role='doctor')
+        patient = User(username='plan-patient', password=generate_password_hash('pw'), patient_id='PLANPAT1',
+                       age=40, gender='female', height=160, weight=60)
+        db.session.add_all([doctor, patient])
+        db.session.flush()
+        start = datetime(2024, 1, 1)
+        for i in range(30):
+            at = start + timedelta(days=i)
+            report = HealthReport(user_id=patient.id, filename=f'r{i}.pdf', timestamp=at,
+                                  extracted_values='{"hemoglobin": "11.5"}', conditions='["Anemia"]')
+            db.session.add(report)
+            db.session.flush()
+            add_lab_results(report, {'hemoglobin': '11.5'})
+            db.session.add(ActivityLog(user_id=patient.id, date=at.date(), steps=5000 + i, exercise='walk', calories=200))
+            db.session.add(ChatHistory(user_id=patient.id, message='hi', reply='hello', timestamp=at))
+            db.session.add(Message(sender_id=doctor.id, receiver_id=patient.id, content='Check in', timestamp=at, is_read=i % 2 == 0))
+        db.session.add(ReportJob(id='planjob', user_id=patient.id, status='queued'))
+        db.session.commit()
+        yield {'doctor': doctor.username, 'patient': patient.username, 'patient_id': patient.patient_id}
+
+
+def captured_selects(client, paths):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        for path in paths:
+            response = client.get(path)
+            assert response.status_code == 200, path
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+    return statements
+
+
+def explain(statement, parameters):
+    with db.engine.connect() as conn:
+        if conn.dialect.name == 'sqlite':
+            rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+            return [row[-1] for row in rows]
+        conn.exec_driver_sql('SET enable_seqscan = off')
+        return [row[0] for row in conn.exec_driver_sql('EXPLAIN ' + statement, parameters)]
+
+
+def plan_problems(plan):
+    tables = '|'.join(HOT_TABLES)
+    full_scan = re.compile(rf'^SCAN ({tables})\b|Seq Scan on "?({tables})\b')
+    return [line for line in plan
+            if full_scan.search(line.strip()) or 'USE TEMP B-TREE FOR ORDER BY' in line]
+
+
+def assert_indexed(client, paths):
+    statements = captured_selects(client, paths)
+    checked = 0
+    for statement, parameters in statements:
+        if not any(re.search(rf'\b{table}\b', statement) for table in HOT_TABLES):
+            continue
+        checked += 1
+        plan = explain(statement, parameters)
+        assert not plan_problems(plan), f'{statement}\n' + '\n'.join(plan)
+    assert checked
+
+
+def login(username):
+    client = app.test_client()
+    client.post('/login', data={'username': username, 'password': 'pw'})
+    return client
+
+
+def test_schema_is_at_latest_migration():
+    with app.app_context():
+        assert current_version(db.engine) == max(version for version, _, _ in MIGRATIONS)
+
+
+def test_patient_routes_use_indexes(seeded):
+    client = login(seeded['patient'])
+    cursor = client.get('/api/reports?limit=5').get_json()['next_cursor']
+    logs_cursor = client.get('/api/activity-logs?limit=5').get_json()['next_cursor']
+    with app.app_context():
+        assert_indexed(client, ['/dashboard', f'/api/reports?limit=5&cursor={cursor}',
+                                f'/api/activity-logs?limit=5&cursor={logs_cursor}',
+                                '/api/chat-history', '/chatbot/history', '/messages'])
+
+
+def test_doctor_routes_use_indexes(seeded):
+    client = login(seeded['doctor'])
+    with app.app_context():
+        assert_indexed(client, [f"/patient-records/{seeded['patient_id']}",
+                                f"/api/reports?patient_id={seeded['patient_id']}", '/messages'])
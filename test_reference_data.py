@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Reference tables: the food catalog and lab test parameters are parsed once
+into indexed structures, served from memory, and reloaded only when their
+file's content changes (checked at most every REFERENCE_DATA_CHECK_SECONDS).
+"""
+
+import os
+
+from reference_data import FoodCatalog, LabTestParameters, ReferenceTable, food_catalog, lab_test_parameters
+
+FOODS = ('food,calories,protein,iron,carbs,suitable_for\n'
+         'Spinach,23,2.9,2.7,3.6,"anemia, weight_loss"\n'
+         'Oats,389,16.9,4.7,66.3,diabetes_control\n'
+         'spinach,99,0,0,0,muscle_gain\n')
+
+
+def write(path, text, mtime):
+    path.write_text(text)
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_food_catalog_is_indexed(tmp_path):
+    path = tmp_path / 'food.csv'
+    write(path, FOODS, 1_000_000_000)
+    catalog = ReferenceTable(str(path), FoodCatalog).get()
+    # Case-insensitive lookup; the first row wins on duplicate names
+    assert catalog.get('SPINACH') == {'food': 'Spinach', 'calories': 23, 'protein': 2.9, 'iron': 2.7,
+                                      'carbs': 3.6, 'suitable_for': ('anemia', 'weight_loss')}
+    assert catalog.foods_for('weight_loss') == ['Spinach']
+    assert catalog.foods_for('muscle_gain') == ['spinach']
+    assert catalog.foods_for('unknown') == []
+
+
+def test_reloads_only_when_the_file_changes(tmp_path, monkeypatch):
+    monkeypatch.setenv('REFERENCE_DATA_CHECK_SECONDS', '0')
+    path = tmp_path / 'food.csv'
+    write(path, FOODS, 1_000_000_000)
+    table = ReferenceTable(str(path), FoodCatalog)
+    first = table.get()
+    assert table.get() is first
+    # Touched but unchanged: rebuilt, same content version
+    write(path, FOODS, 2_000_000_000)
+    assert table.get().version == first.version
+    write(path, FOODS + 'Lentils,116,9,3.3,20,anemia\n', 3_000_000_000)
+    changed = table.get()
+    assert changed.version != first.version
+    assert changed.foods_for('anemia') == ['Spinach', 'Lentils']
+
+
+def test_check_interval_serves_from_memory(tmp_path, monkeypatch):
+    monkeypatch.setenv('REFERENCE_DATA_CHECK_SECONDS', '3600')
+    path = tmp_path / 'food.csv'
+    write(path, FOODS, 1_000_000_000)
+    table = ReferenceTable(str(path), FoodCatalog)
+    first = table.get()
+    write(path, FOODS + 'Lentils,116,9,3.3,20,anemia\n', 2_000_000_000)
+    assert table.get() is first
+
+
+def test_shared_tables():
+    assert food_catalog() is food_catalog()
+    parameters = lab_test_parameters()
+    assert isinstance(parameters, LabTestParameters)
+    assert parameters.units['hemoglobin_hb'] == parameters.by_name['Hemoglobin (Hb)']['Unit']
+    assert parameters.matcher.match('Hemoglobin 11.2') == {'hemoglobin_hb': '11.2'}
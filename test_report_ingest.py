@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Bulk report ingestion: a directory of per-patient folders and a manifest
+with report dates are ingested in batches through the upload extraction
+path, duplicates come from the extraction cache, and a re-run (e.g. after a
+crash) skips everything already ingested.
+"""
+
+import os
+from datetime import datetime
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import app as app_module
+from app import HealthReport, LabResult, ReportJob, User, UserStats, app, db
+from report_ingest import ManifestError, bounded_map, plan_manifest
+
+
+@pytest.fixture
+def extracted(monkeypatch):
+    """Stand-in for OCR: the 'image' files hold their report text; records what was extracted"""
+    paths = []
+
+    def fake_extract(filepath, lang='eng', page_timings=None):
+        paths.append(os.path.basename(filepath))
+        with open(filepath) as handle:
+            return handle.read()
+
+    monkeypatch.setattr(app_module, 'extract_text_from_file', fake_extract)
+    return paths
+
+
+def make_patients(*patient_ids):
+    with app.app_context():
+        users = [User(username=f'ingest-{pid}', password=generate_password_hash('pw'), patient_id=pid)
+                 for pid in patient_ids]
+        db.session.add_all(users)
+        db.session.commit()
+        return [user.id for user in users]
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return path
+
+
+def ingest(*args):
+    result = app.test_cli_runner().invoke(args=['ingest-reports', *map(str, args), '--workers', '0'])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_directory_ingest_is_batched_and_resumable(tmp_path, extracted):
+    first, second = make_patients('INGESTA1', 'INGESTB2')
+    write(tmp_path / 'INGESTA1' / 'jan.png', 'Hemoglobin 11.2 g/dL')
+    write(tmp_path / 'INGESTA1' / 'feb.png', 'Hemoglobin 12.4 g/dL\nCholesterol 190')
+    write(tmp_path / 'INGESTA1' / 'notes.txt', 'not a report')
+    # Same file for another patient: ingested for each of them
+    write(tmp_path / 'INGESTB2' / 'copy.png', 'Hemoglobin 11.2 g/dL')
+    write(tmp_path / 'UNKNOWN9' / 'x.png', 'Hemoglobin 10')
+    output = ingest(tmp_path, '--batch-size', '2')
+    assert "unknown patient ID 'UNKNOWN9'" in output
+    assert 'Done: 3 ingested, 0 failed, 1 skipped' in output
+    assert sorted(extracted) == ['copy.png', 'feb.png', 'jan.png']
+    with app.app_context():
+        assert HealthReport.query.filter_by(user_id=first).count() == 2
+        assert HealthReport.query.filter_by(user_id=second).count() == 1
+        assert UserStats.query.get(first).report_count == 2
+        assert LabResult.query.filter_by(user_id=first).count() == 3
+        assert ReportJob.query.filter_by(user_id=first, status='done').count() == 2
+    # Re-running extracts and stores nothing new
+    extracted.clear()
+    assert 'Done: 0 ingested, 0 failed, 4 skipped' in ingest(tmp_path)
+    assert extracted == []
+    with app.app_context():
+        assert HealthReport.query.filter(HealthReport.user_id.in_([first, second])).count() == 3
+
+
+def test_manifest_dates_and_failures(tmp_path, extracted, monkeypatch):
+    (patient,) = make_patients('INGESTM3')
+    write(tmp_path / 'files' / 'old.png', 'Cholesterol 230')
+    write(tmp_path / 'files' / 'broken.png', 'unreadable')
+    write(tmp_path / 'manifest.csv', 'file,patient_id,date\n'
+                                     'files/old.png,INGESTM3,2021-05-04\n'
+                                     'files/broken.png,INGESTM3,\n')
+    real_parse = app_module.parse_medical_values
+
+    def parse(text):
+        if text == 'unreadable':
+            raise ValueError('no values found')
+        return real_parse(text)
+
+    monkeypatch.setattr(app_module, 'parse_medical_values', parse)
+    assert 'Done: 1 ingested, 1 failed, 0 skipped' in ingest(tmp_path / 'manifest.csv')
+    with app.app_context():
+        report = HealthReport.query.filter_by(user_id=patient).one()
+        assert report.timestamp == datetime(2021, 5, 4)
+        assert report.extracted_values == '{"total_cholesterol": "230"}'
+        failed = ReportJob.query.filter_by(user_id=patient, status='failed').one()
+        assert failed.error == 'no values found'
+    # A failed file is retried on the next run
+    monkeypatch.setattr(app_module, 'parse_medical_values', real_parse)
+    assert 'Done: 1 ingested, 0 failed, 1 skipped' in ingest(tmp_path / 'manifest.csv')
+    # Content already extracted for one patient comes from the cache for another
+    make_patients('INGESTM4')
+    write(tmp_path / 'second.csv', 'file,patient_id\nfiles/old.png,INGESTM4\n')
+    extracted.clear()
+    assert '1 in the extraction cache, 0 to extract' in ingest(tmp_path / 'second.csv')
+    assert extracted == []
+
+
+def test_bad_manifest_row(tmp_path):
+    write(tmp_path / 'manifest.csv', 'file,patient_id\nmissing.pdf,P1\n')
+    with pytest.raises(ManifestError, match='line 2'):
+        plan_manifest(str(tmp_path / 'manifest.csv'), lambda name: True)
+
+
+def test_bounded_map_keeps_keys_and_errors():
+    results = {key: (result, error) for key, result, error in
+               bounded_map(lambda x: 10 // x, ((f'k{x}', (x,)) for x in [1, 2, 0]), workers=0)}
+    assert results['k1'] == (10, None) and results['k2'] == (5, None)
+    assert isinstance(results['k0'][1], ZeroDivisionError)
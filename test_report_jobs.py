@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Report upload jobs: an upload is recorded and handed to the job pool, a
+job is claimed exactly once, the status endpoint follows it, and jobs
+whose process died mid-extraction are queued again on startup, or failed
+once they have used up their attempts.
+"""
+
+import io
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import app as app_module
+from app import HealthReport, ReportJob, User, app, db, process_report_job, requeue_report_jobs
+
+
+@pytest.fixture
+def submitted(monkeypatch, tmp_path):
+    """Jobs handed to the pool, recorded instead of run"""
+    jobs = []
+    monkeypatch.setattr(app_module.job_pool, 'submit', lambda fn, *args: jobs.append((fn, *args)))
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(app_module, 'extract_text_from_file',
+                        lambda filepath, lang='eng', page_timings=None: open(filepath).read())
+    return jobs
+
+
+def login(name):
+    with app.app_context():
+        user = User(username=name, password=generate_password_hash('pw'), patient_id=name.upper()[:16])
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    client = app.test_client()
+    client.post('/login', data={'username': name, 'password': 'pw'})
+    return client, user_id
+
+
+def upload(client, text, name='report.png'):
+    return client.post('/upload', data={'report_file': (io.BytesIO(text.encode()), name)},
+                       headers={'Accept': 'application/json'})
+
+
+def test_upload_is_queued_then_claimed_once(submitted):
+    client, user_id = login('jobs-upload')
+    # Content no other test uploads, so it isn't served from the extraction cache
+    response = upload(client, 'jobs-upload\nHemoglobin 11.2 g/dL')
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+    assert submitted == [(process_report_job, job_id)]
+    assert client.get(f'/upload/status/{job_id}').get_json()['status'] == 'queued'
+    process_report_job(job_id)
+    # A second delivery of the same job finds it claimed and does nothing
+    process_report_job(job_id)
+    status = client.get(f'/upload/status/{job_id}').get_json()
+    assert status['status'] == 'done' and status['report_id']
+    with app.app_context():
+        assert HealthReport.query.filter_by(user_id=user_id).count() == 1
+        assert ReportJob.query.get(job_id).attempts == 1
+    # Other users can't see the job
+    other, _ = login('jobs-other')
+    assert other.get(f'/upload/status/{job_id}').status_code == 404
+
+
+def test_interrupted_jobs_are_requeued_then_failed(submitted):
+    client, user_id = login('jobs-stale')
+    long_ago = datetime.utcnow() - timedelta(seconds=app_module.REPORT_JOB_TIMEOUT + 60)
+    with app.app_context():
+        db.session.add_all([
+            ReportJob(id='stale-retry', user_id=user_id, status='processing', started_at=long_ago, attempts=1),
+            ReportJob(id='stale-spent', user_id=user_id, status='processing', started_at=long_ago,
+                      attempts=app_module.REPORT_JOB_MAX_ATTEMPTS),
+            ReportJob(id='still-running', user_id=user_id, status='processing', started_at=datetime.utcnow(),
+                      attempts=1),
+            ReportJob(id='waiting', user_id=user_id, status='queued'),
+        ])
+        db.session.commit()
+    requeue_report_jobs()
+    assert {args[0] for _, *args in submitted} >= {'stale-retry', 'waiting'}
+    assert 'still-running' not in {args[0] for _, *args in submitted}
+    statuses = {job_id: client.get(f'/upload/status/{job_id}').get_json()
+                for job_id in ['stale-retry', 'stale-spent', 'still-running']}
+    assert statuses['stale-retry']['status'] == 'queued'
+    assert statuses['stale-spent']['status'] == 'failed'
+    assert 'interrupted' in statuses['stale-spent']['error']
+    assert statuses['still-running']['status'] == 'processing'
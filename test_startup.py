@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Importing the app must stay cheap: the OCR, PDF, data-science and Supabase
+libraries load on first use, not when a worker or test imports app.py.
+"""
+
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ['easyocr', 'torch', 'pandas', 'numpy', 'pdfplumber', 'pytesseract',
+                 'pdf2image', 'supabase', 'postgrest']
+
+
+def test_import_app_defers_heavy_dependencies():
+    env = {k: v for k, v in os.environ.items() if not k.startswith('SUPABASE_')}
+    env['DATABASE_URL'] = 'sqlite://'
+    code = f'import sys, app; print("loaded:" + ",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))'
+    result = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=env, capture_output=True, text=True)
+    # No Supabase credentials either: the check happens when the client is first used
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines()[-1] == 'loaded:'
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+SupabaseService reads through the per-worker cache, against an in-process
+fake of the Supabase client: per-table TTLs, negative caching, the memory
+bound, and invalidation from create_* and outbox pushes.
+"""
+
+import os
+
+import pytest
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import app as app_module
+from app import SupabaseService
+from supabase_cache import SupabaseReadCache
+
+
+class FakeResult:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeQuery:
+    def __init__(self, client, table_name):
+        self.client, self.table_name, self.filters = client, table_name, {}
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        self.filters[column] = value
+        return self
+
+    def upsert(self, rows, **options):
+        self.rows = rows
+        return self
+
+    def execute(self):
+        self.client.calls.append(self.table_name)
+        if self.client.offline:
+            raise ConnectionError('network is unreachable')
+        if hasattr(self, 'rows'):
+            self.client.tables[self.table_name].extend(self.rows)
+            return FakeResult([])
+        rows = self.client.tables[self.table_name]
+        return FakeResult([row for row in rows if all(row.get(k) == v for k, v in self.filters.items())])
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.tables = {'users': [{'id': 1, 'username': 'asha'}], 'health_reports': [], 'messages': []}
+        self.calls = []
+        self.offline = False
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def client():
+    return FakeSupabase()
+
+
+@pytest.fixture
+def service(client, clock):
+    cache = SupabaseReadCache(ttls={'users': 300, 'health_reports': 60, 'messages': 30},
+                              negative_ttl=10, max_bytes=10_000, clock=clock)
+    return SupabaseService(client=client, cache=cache)
+
+
+def test_repeated_reads_are_served_locally(service, client, clock):
+    assert service.get_user(1) == {'id': 1, 'username': 'asha'}
+    service.get_user(1)['username'] = 'changed by caller'
+    assert service.get_user(1) == {'id': 1, 'username': 'asha'}
+    assert client.calls == ['users']
+    clock.now = 301
+    service.get_user(1)
+    assert client.calls == ['users', 'users']
+    stats = service.cache.stats()
+    assert (stats['hits'], stats['misses'], stats['expirations']) == (2, 2, 1)
+    assert stats['tables']['users'] == {'hits': 2, 'misses': 2}
+
+
+def test_empty_results_are_cached_briefly(service, client, clock):
+    assert service.get_user(2) is None
+    assert service.get_user_reports(1) == []
+    assert service.get_user(2) is None and service.get_user_reports(1) == []
+    assert client.calls == ['users', 'health_reports']
+    assert service.cache.stats()['negative_hits'] == 2
+    clock.now = 11
+    service.get_user(2)
+    assert client.calls[-1] == 'users'
+
+
+def test_failed_reads_are_not_cached(service, client):
+    client.offline = True
+    assert service.get_user_messages(1) == []
+    client.offline = False
+    client.tables['messages'].append({'id': 5, 'recipient_id': 1})
+    assert service.get_user_messages(1) == [{'id': 5, 'recipient_id': 1}]
+
+
+def test_writes_invalidate_cached_reads(service, client, monkeypatch):
+    queued = []
+    monkeypatch.setattr(app_module, 'enqueue', lambda session, model, table, data, key: queued.append(key))
+    assert service.get_user_messages(1) == []
+    service.create_message({'id': 7, 'recipient_id': 1, 'content': 'Please book a follow-up'})
+    assert queued == ['messages:7']
+    # The outbox push is what lands the row remotely; it invalidates again
+    service.get_user_messages(1)
+    service.push('messages', [{'id': 7, 'recipient_id': 1, 'content': 'Please book a follow-up'}])
+    assert service.get_user_messages(1) == [{'id': 7, 'recipient_id': 1, 'content': 'Please book a follow-up'}]
+    assert service.cache.stats()['invalidations'] == 2
+
+
+def test_memory_is_bounded(clock):
+    cache = SupabaseReadCache(ttls={'health_reports': 60}, negative_ttl=10, max_bytes=2_000, clock=clock)
+    for user_id in range(10):
+        cache.put('health_reports', user_id, [{'user_id': user_id, 'extracted_text': 'x' * 500}])
+    stats = cache.stats()
+    assert stats['bytes'] <= 2_000 and stats['entries'] == 3 and stats['evictions'] == 7
+    # Least recently stored go first
+    assert cache.get('health_reports', 9, lambda: pytest.fail('evicted too early'))
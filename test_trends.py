@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+The vectorized trend builder must produce exactly what the dashboard's old
+per-key/per-report JSON loop produced (kept in benchmarks/bench_trends.py
+as the benchmark's baseline): same carried-forward series, labels and
+latest-vs-previous comparison.
+"""
+
+import json
+from datetime import datetime
+
+from benchmarks.bench_trends import lab_result_rows, legacy_trends, synthetic_reports
+from trends import build_trend_series
+
+
+def decoded(reports):
+    for report in reports:
+        report.values_dict = json.loads(report.extracted_values)
+    return reports
+
+
+def test_matches_legacy_loop():
+    reports = decoded(synthetic_reports(count=60, parameters=12))
+    assert build_trend_series(lab_result_rows(reports)) == legacy_trends(reports)
+
+
+def test_sparse_parameters_and_single_report():
+    # Parameters missing from one of the two latest reports compare against the other one
+    reports = decoded(synthetic_reports(count=5, parameters=40))
+    assert build_trend_series(lab_result_rows(reports)) == legacy_trends(reports)
+    one = decoded(synthetic_reports(count=1))
+    assert build_trend_series(lab_result_rows(one)) == legacy_trends(one)
+    assert build_trend_series([]) == ({}, [], {})
+
+
+def test_value_before_first_measurement_is_zero():
+    at = [datetime(2024, 1, day) for day in (1, 2, 3)]
+    rows = [(1, at[0], 'tsh', 2.0), (2, at[1], 'iron', 50.0), (3, at[2], 'tsh', 3.0)]
+    trend_data, labels, comparison = build_trend_series(rows)
+    assert trend_data == {'iron': [0.0, 50.0, 50.0], 'tsh': [2.0, 2.0, 3.0]}
+    assert labels == ['2024-01-01', '2024-01-02', '2024-01-03']
+    assert comparison == {'iron': {'latest': 50.0, 'previous': 50.0, 'status': 'no_change'},
+                          'tsh': {'latest': 3.0, 'previous': 3.0, 'status': 'no_change'}}
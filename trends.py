@@ -0,0 +1,68 @@
+"""
+Trend series and report comparison for the dashboard.
+
+The input is the user's LabResult rows (one per numeric value, read with the
+(user_id, measured_at) index), laid out as a reports x parameters matrix.
+Carry-forward filling and the latest-vs-previous comparison are then
+column-wise operations on that matrix instead of a JSON decode per
+(parameter, report) pair.
+
+numpy and pandas are imported when the first trend is built rather than at
+app import, which keeps worker boot and login pages free of their cost.
+"""
+
+
+def value_matrix(results):
+    """Reports x parameters frame from (report_id, measured_at, parameter_key, value) rows in time order.
+
+    Returns (frame, dates): one frame row per report in order of first
+    appearance, columns sorted, NaN where a report has no value.
+    """
+    import numpy as np
+    import pandas as pd
+    points = {}  # report_id -> frame row
+    dates = []
+    keys = sorted({key for _, _, key, _ in results})
+    column = {key: j for j, key in enumerate(keys)}
+    rows, columns, values = [], [], []
+    for report_id, measured_at, key, value in results:
+        if report_id not in points:
+            points[report_id] = len(dates)
+            dates.append(measured_at)
+        rows.append(points[report_id])
+        columns.append(column[key])
+        values.append(value)
+    matrix = np.full((len(dates), len(keys)), np.nan)
+    matrix[rows, columns] = values
+    return pd.DataFrame(matrix, columns=keys), dates
+
+
+def build_trend_series(results):
+    """Trend data, labels and comparison from LabResult rows ordered oldest first.
+
+    Returns (trend_data, trend_labels, comparison) in the shape the dashboard
+    template expects: trend_data maps each parameter to one value per report
+    (oldest first), carrying the last known value forward and 0 before the
+    first one; comparison covers the parameters of the two latest reports.
+    """
+    import numpy as np
+    matrix, dates = value_matrix(results)
+    trend_labels = [d.strftime('%Y-%m-%d') for d in dates]
+    if not dates:
+        return {}, trend_labels, {}
+    filled = matrix.ffill().fillna(0)
+    trend_data = {key: filled[key].tolist() for key in filled.columns}
+
+    comparison = {}
+    if len(dates) >= 2:
+        latest = matrix.iloc[-1]
+        previous = matrix.iloc[-2]
+        keys = [key for key in matrix.columns if latest.notna()[key] or previous.notna()[key]]
+        latest, previous = latest[keys], previous[keys]
+        # Missing on one side: compare against the other report's value
+        v_new = latest.fillna(previous).fillna(0)
+        v_old = previous.fillna(v_new)
+        status = np.select([v_new > v_old, v_new < v_old], ['worse', 'improved'], 'no_change')
+        for key, new, old, state in zip(keys, v_new.tolist(), v_old.tolist(), status):
+            comparison[key] = {'latest': new, 'previous': old, 'status': str(state)}
+    return trend_data, trend_labels, comparison